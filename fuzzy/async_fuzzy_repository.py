@@ -0,0 +1,182 @@
+# async_fuzzy_repository.py
+from datetime import datetime
+from typing import List, Dict, Optional
+from loguru import logger
+from database import AsyncDatabaseConnection
+from feedback_store import FeedbackBatch, rows_to_batch
+import queries
+
+
+class AsyncFuzzyFeedbackRepository:
+    """
+    Асинхронный вариант FuzzyFeedbackRepository для обработчиков FastAPI.
+    Таблицы создаёт синхронный репозиторий, SQL общий (queries.py).
+    """
+
+    def __init__(self, connection: AsyncDatabaseConnection):
+        self.connection = connection
+
+    async def save_evaluate_result(self, task_id: str, inputs: Dict, predictions: Dict, task_type: str = None,
+                                   shadow_rows: Optional[List[tuple]] = None) -> int:
+        """
+        Сохраняет результат /evaluate, возвращает ID записи.
+        shadow_rows - предсказания кандидатов (queries.SHADOW_PREDICTION_COLUMNS), пишутся в той же транзакции
+        """
+        try:
+            async with self.connection.connection() as conn:
+                await conn.execute(queries.LOCK_TASKS, (queries.EVALUATE_LOCK, [task_id]))
+                cursor = await conn.execute(
+                    queries.UPSERT_EVALUATE_RESULT,
+                    queries.evaluate_params(task_id, inputs, predictions, task_type)
+                )
+                result = await cursor.fetchone()
+                if shadow_rows:
+                    await conn.execute(queries.UPSERT_SHADOW_PREDICTIONS, queries.shadow_params(shadow_rows))
+                return result[0] if result else None
+        except Exception as e:
+            logger.error(f"Save evaluate result failed: {e}")
+            raise
+
+    async def save_evaluate_results_bulk(self, rows: List[tuple], shadow_rows: Optional[List[tuple]] = None) -> int:
+        """
+        Пакетный upsert результатов /evaluate: COPY в staging-таблицу и один UPDATE + INSERT.
+        rows - кортежи в порядке queries.EVALUATE_ROW_COLUMNS, task_id в пачке должны быть уникальны.
+        shadow_rows - предсказания кандидатов по этим задачам (queries.SHADOW_PREDICTION_COLUMNS)
+        """
+        if not rows:
+            return 0
+        try:
+            async with self.connection.connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(queries.CREATE_EVALUATE_STAGING)
+                    async with cursor.copy(queries.COPY_EVALUATE_STAGING) as copy:
+                        for row in rows:
+                            await copy.write_row(row)
+                    await cursor.execute(queries.LOCK_STAGED_TASKS)
+                    await cursor.execute(queries.UPSERT_EVALUATE_FROM_STAGING)
+                    written = (await cursor.fetchone())[0]
+                    if shadow_rows:
+                        await cursor.execute(queries.UPSERT_SHADOW_PREDICTIONS, queries.shadow_params(shadow_rows))
+                    return written
+        except Exception as e:
+            logger.error(f"Bulk save evaluate results failed: {e}")
+            raise
+
+    async def save_feedback(self, task_id: str, actual_data: Dict) -> Optional[Dict]:
+        """
+        Сохраняет фидбэк, связывая с существующей записью evaluate_results.
+        Возвращает сохранённую строку вместе с предсказаниями задачи (queries.SAVED_FEEDBACK_COLUMNS)
+        или None, если задачи нет в evaluate_results
+        """
+        try:
+            async with self.connection.connection() as conn:
+                await conn.execute(queries.LOCK_TASKS, (queries.FEEDBACK_LOCK, [task_id]))
+                cursor = await conn.execute(
+                    queries.UPSERT_FEEDBACK_WITH_PREDICTIONS,
+                    queries.feedback_params(task_id, actual_data)
+                )
+                row = await cursor.fetchone()
+                return dict(zip(queries.SAVED_FEEDBACK_COLUMNS, row)) if row else None
+        except Exception as e:
+            logger.error(f"Save feedback failed: {e}")
+            raise
+
+    async def save_feedback_batch(self, items: List[Dict]) -> List[Dict]:
+        """
+        Сохраняет пачку фидбэка одним upsert. Возвращает сохранённые строки с предсказаниями
+        (queries.SAVED_FEEDBACK_COLUMNS): задачи без записи в evaluate_results пропускаются.
+        """
+        if not items:
+            return []
+        try:
+            params = queries.feedback_batch_params(items)
+            async with self.connection.connection() as conn:
+                await conn.execute(queries.LOCK_TASKS, (queries.FEEDBACK_LOCK, params[0]))
+                cursor = await conn.execute(queries.UPSERT_FEEDBACK_BATCH, params)
+                return [dict(zip(queries.SAVED_FEEDBACK_COLUMNS, row)) for row in await cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Save feedback batch failed: {e}")
+            raise
+
+    async def get_count(self) -> int:
+        """Количество записей с фидбэком (есть actual_*)"""
+        return (await self.get_counts())["total"]
+
+    async def get_counts(self) -> Dict[str, int]:
+        """Счётчики фидбэка: {"effort", "risk", "total"} (поддерживаются триггерами, без COUNT(*))"""
+        async with self.connection.connection() as conn:
+            cursor = await conn.execute(queries.FEEDBACK_COUNTERS)
+            return queries.counters_to_dict(await cursor.fetchall())
+
+    async def get_training_data(self, agent_name: str, limit: int = 200, since: Optional[datetime] = None,
+                                until: Optional[datetime] = None) -> List[Dict]:
+        """Возвращает данные для обучения: джойн evaluate_results + feedback"""
+        sql, params = queries.training_data_query(agent_name, since, until)
+        async with self.connection.connection() as conn:
+            cursor = await conn.execute(sql, params + (limit,))
+            rows = await cursor.fetchall()
+            return queries.rows_to_training_data(rows)
+
+    async def get_training_batch(self, agent_name: str, limit: int = 200, since: Optional[datetime] = None,
+                                 until: Optional[datetime] = None) -> FeedbackBatch:
+        """Последние limit записей для обучения в колоночном виде (от старых к новым)"""
+        sql, params = queries.training_data_query(agent_name, since, until)
+        async with self.connection.connection() as conn:
+            cursor = await conn.execute(sql, params + (limit,))
+            return rows_to_batch(await cursor.fetchall())
+
+    async def get_accuracy_totals(self, agent_name: str, since: Optional[datetime] = None,
+                                  until: Optional[datetime] = None) -> Dict[str, float]:
+        """Суммы ошибок агента по фидбэку за период (для metrics.StreamingMetrics)"""
+        sql, params = queries.accuracy_totals_query(agent_name, since, until)
+        async with self.connection.connection() as conn:
+            cursor = await conn.execute(sql, params)
+            return dict(zip(queries.ACCURACY_TOTALS_COLUMNS, await cursor.fetchone()))
+
+    async def get_evaluate_history_page(self, fields: List[str], limit: int = 50, cursor: Optional[str] = None,
+                                        **filters) -> Dict:
+        """
+        Страница истории оценок (queries.evaluate_history_query): {"items", "next_cursor"}.
+        next_cursor = None на последней странице; filters - фильтры evaluate_history_query
+        """
+        after = queries.decode_history_cursor(cursor) if cursor else None
+        sql, params, columns = queries.evaluate_history_query(fields, limit, after, **filters)
+        try:
+            async with self.connection.connection() as conn:
+                rows = await (await conn.execute(sql, params)).fetchall()
+        except Exception as e:
+            logger.error(f"Get evaluate history failed: {e}")
+            raise
+        page = [dict(zip(columns, row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = page[-1]
+            next_cursor = queries.encode_history_cursor(last["evaluated_at"], last["id"])
+        return {
+            "items": [queries.format_history_row(row, fields) for row in page],
+            "next_cursor": next_cursor
+        }
+
+    async def get_evaluate_by_task_id(self, task_id: str) -> Optional[Dict]:
+        """Получает полную информацию по задаче: предсказания + фидбэк (если есть)"""
+        try:
+            async with self.connection.connection() as conn:
+                cursor = await conn.execute(queries.EVALUATE_BY_TASK_ID, (task_id,))
+                row = await cursor.fetchone()
+                return queries.format_evaluate_row(row) if row else None
+        except Exception as e:
+            logger.error(f"Get evaluate by task_id failed: {e}")
+            raise
+
+    async def get_evaluate_by_task_ids(self, task_ids: List[str]) -> Dict[str, Dict]:
+        """Как get_evaluate_by_task_id для нескольких задач: {task_id: строка}"""
+        if not task_ids:
+            return {}
+        try:
+            async with self.connection.connection() as conn:
+                cursor = await conn.execute(queries.EVALUATE_BY_TASK_IDS, (list(task_ids),))
+                rows = [queries.format_evaluate_row(row) for row in await cursor.fetchall()]
+                return {row["task_id"]: row for row in rows}
+        except Exception as e:
+            logger.error(f"Get evaluate by task_ids failed: {e}")
+            raise
@@ -0,0 +1,97 @@
+# backtest.py
+"""
+Бэктест конфига-кандидата до /config/import: сохранённые входы и факты (evaluate_results ⋈ feedback)
+пересчитываются кандидатом и текущим (live) движком векторизованно, пачками серверного курсора.
+
+Метрики считаются так же, как в FuzzyOptimizer._compute_metrics: если выход не определён
+(ни одно правило не сработало), ошибка считается равной 100, а Spearman - по определённым выходам.
+Рядом приводятся метрики записанных предсказаний (recorded) - того конфига, что был live в момент оценки.
+Выходы candidate и live, как и записанные, умножаются на вес типа задачи и обрезаются до 0-100 (как в /evaluate).
+Выход зависит только от входов, а входы задач в основном целочисленные (строки, зависимости, проценты),
+поэтому движки считают каждую уникальную строку входов один раз.
+"""
+import time
+from typing import Dict, Iterable, Optional
+import numpy as np
+from scipy import stats
+from inference import INPUT_FIELDS
+from knowledge import TASK_TYPE_WEIGHTS
+from training_export import TrainingChunk
+
+BUCKETS = {"day": "datetime64[D]", "week": "datetime64[W]", "month": "datetime64[M]"}
+
+
+def score(predicted: np.ndarray, target: np.ndarray) -> Dict:
+    """MAE/RMSE/bias/Spearman предсказаний против факта; undefined - число NaN-выходов"""
+    if predicted.size == 0:
+        return {"count": 0, "mae": 0.0, "rmse": 0.0, "bias": 0.0, "spearman_rho": 0.0, "undefined": 0}
+    valid = np.isfinite(predicted)
+    errors = np.where(valid, np.abs(predicted - target), 100.0)
+    rho = 0.0
+    if np.count_nonzero(valid) >= 5 and np.ptp(predicted[valid]) > 0 and np.ptp(target[valid]) > 0:
+        rho_val, _ = stats.spearmanr(predicted[valid], target[valid])
+        rho = float(rho_val) if not np.isnan(rho_val) else 0.0
+    return {
+        "count": int(predicted.size),
+        "mae": float(np.mean(errors)),
+        "rmse": float(np.sqrt(np.mean(errors ** 2))),
+        "bias": float(np.mean(predicted[valid] - target[valid])) if valid.any() else 0.0,
+        "spearman_rho": rho,
+        "undefined": int(predicted.size - np.count_nonzero(valid))
+    }
+
+
+def run_backtest(chunks: Iterable[TrainingChunk], candidate, live, bucket: str = "month") -> Dict:
+    """
+    candidate и live - всё, что умеет evaluate_batch(X, columns=...) (CompiledEngine, FuzzyAgent).
+    Возвращает метрики candidate/live/recorded в целом, по task_type и по корзинам времени фидбэка.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}', expected one of {tuple(BUCKETS)}")
+    started = time.perf_counter()
+    columns = {"inputs": [], "recorded": [], "target": [], "bucket": [], "task_type": []}
+    names = []
+    for chunk in chunks:
+        batch = chunk.batch
+        columns["inputs"].append(batch.inputs)
+        columns["recorded"].append(batch.predicted)
+        columns["target"].append(batch.target)
+        columns["bucket"].append(batch.timestamp.astype("datetime64[s]").astype(BUCKETS[bucket]))
+        columns["task_type"].append(chunk.task_type)
+        names = chunk.task_type_names
+    if not columns["target"]:
+        data = {name: np.zeros(0) for name in columns}
+        data["inputs"] = np.zeros((0, len(INPUT_FIELDS)))
+        data["task_type"] = np.zeros(0, dtype=np.int16)
+        data["bucket"] = np.zeros(0, dtype=BUCKETS[bucket])
+    else:
+        data = {name: np.concatenate(parts) for name, parts in columns.items()}
+    unique, inverse = np.unique(data.pop("inputs"), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    type_weights = np.array([TASK_TYPE_WEIGHTS.get(name, 1.0) for name in names] or [1.0])
+    weights = np.where(data["task_type"] < 0, 1.0, type_weights[np.maximum(data["task_type"], 0)])
+    data["candidate"] = np.clip(candidate.evaluate_batch(unique, columns=INPUT_FIELDS)[inverse] * weights, 0, 100)
+    data["live"] = np.clip(live.evaluate_batch(unique, columns=INPUT_FIELDS)[inverse] * weights, 0, 100)
+
+    def compare(mask: Optional[np.ndarray] = None) -> Dict:
+        target = data["target"] if mask is None else data["target"][mask]
+        return {
+            source: score(data[source] if mask is None else data[source][mask], target)
+            for source in ("candidate", "live", "recorded")
+        }
+
+    by_task_type = {}
+    for code in np.unique(data["task_type"]):
+        by_task_type["unknown" if code < 0 else names[code]] = compare(data["task_type"] == code)
+    by_bucket = {}
+    for value in np.unique(data["bucket"]):
+        by_bucket[str(value)] = compare(data["bucket"] == value)
+    return {
+        "rows": int(data["target"].size),
+        "unique_inputs": int(unique.shape[0]),
+        "bucket": bucket,
+        "overall": compare(),
+        "by_task_type": by_task_type,
+        "by_bucket": by_bucket,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
@@ -0,0 +1,131 @@
+# bench_api.py
+"""
+Сквозной бенчмарк /evaluate: приложение main.py в том же процессе (httpx.ASGITransport, со startup/shutdown),
+настоящая БД - локальный Postgres, заданный обычными переменными сервиса FUZZY_DB_*.
+Меряются задержка последовательных запросов, пропускная способность при параллельных запросах
+и /evaluate/batch. Результаты оценки пишутся в БД, поэтому нужна отдельная (тестовая) база.
+
+Конфиги копируются во временный каталог - оптимизация и импорт во время прогона не трогают configs/.
+
+Запуск из каталога fuzzy: FUZZY_DB_HOST=localhost python benchmarks/bench_api.py [--quick] > api.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from common import CONFIGS_DIR, environment, latency_metrics, metric
+
+TASK_TYPES = ("feature", "bugfix", "refactor")
+
+
+def _payloads(count: int, rng: np.random.Generator, prefix: str) -> list:
+    return [
+        {
+            "task_id": f"{prefix}-{i}",
+            "code_changes_lines": float(rng.integers(1, 1000)),
+            "dependencies_count": int(rng.integers(0, 15)),
+            "team_expertise": round(float(rng.uniform(1, 5)), 1),
+            "requirement_uncertainty_pct": float(rng.integers(0, 100)),
+            "task_type": TASK_TYPES[int(rng.integers(0, len(TASK_TYPES)))]
+        }
+        for i in range(count)
+    ]
+
+
+def _prepare_service():
+    """Рабочий каталог с копией конфигов и отдельный каталог общей памяти движков"""
+    work = tempfile.mkdtemp(prefix="fuzzy-bench-")
+    shutil.copytree(CONFIGS_DIR, os.path.join(work, "configs"))
+    os.environ.setdefault("FUZZY_SHARED_ENGINE_DIR", os.path.join(work, "shm"))
+    os.chdir(work)
+    return work
+
+
+async def _bench(requests: int, concurrency: int, batch_size: int, seed: int) -> dict:
+    import httpx
+    import main
+
+    rng = np.random.default_rng(seed)
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    metrics = {}
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://fuzzy-bench") as client:
+            async def evaluate(payload: dict) -> float:
+                started = time.perf_counter()
+                response = await client.post("/evaluate", json=payload)
+                response.raise_for_status()
+                return time.perf_counter() - started
+
+            for payload in _payloads(20, rng, f"{prefix}-warmup"):
+                await evaluate(payload)
+
+            values = [await evaluate(payload) for payload in _payloads(requests, rng, f"{prefix}-seq")]
+            metrics.update(latency_metrics("api.evaluate", values, 1e3, "ms"))
+
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def limited(payload: dict) -> float:
+                async with semaphore:
+                    return await evaluate(payload)
+
+            started = time.perf_counter()
+            values = await asyncio.gather(*(limited(p) for p in _payloads(requests, rng, f"{prefix}-par")))
+            elapsed = time.perf_counter() - started
+            metrics[f"api.evaluate.concurrency_{concurrency}.requests_per_sec"] = metric(requests / elapsed, "req/s", "higher")
+            metrics.update(latency_metrics(f"api.evaluate.concurrency_{concurrency}", list(values), 1e3, "ms"))
+
+            batches = max(requests // batch_size, 3)
+            values = []
+            for b in range(batches):
+                started = time.perf_counter()
+                response = await client.post(
+                    "/evaluate/batch", json={"items": _payloads(batch_size, rng, f"{prefix}-batch{b}")}
+                )
+                response.raise_for_status()
+                values.append(time.perf_counter() - started)
+            metrics.update(latency_metrics(f"api.evaluate_batch_{batch_size}", values, 1e3, "ms"))
+            metrics[f"api.evaluate_batch_{batch_size}.rows_per_sec"] = metric(
+                batch_size / min(values), "rows/s", "higher"
+            )
+    return metrics
+
+
+def run(requests: int = 500, concurrency: int = 16, batch_size: int = 100, seed: int = 0) -> dict:
+    cwd = os.getcwd()
+    work = _prepare_service()
+    try:
+        metrics = asyncio.run(_bench(requests, concurrency, batch_size, seed))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work, ignore_errors=True)
+    return {
+        "benchmark": "api",
+        "parameters": {"requests": requests, "concurrency": concurrency, "batch_size": batch_size, "seed": seed},
+        "database": {"host": os.getenv("FUZZY_DB_HOST", "postgres"), "name": os.getenv("FUZZY_DB_NAME", "fuzzy_agent_db")},
+        "metrics": metrics
+    }
+
+
+if __name__ == "__main__":
+    from loguru import logger
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="меньше запросов (проверка, а не замер)")
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    result = run(50 if args.quick else args.requests, args.concurrency, args.batch_size, args.seed)
+    json.dump({"environment": environment(), **result}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
@@ -0,0 +1,100 @@
+# bench_engine.py
+"""
+Микробенчмарки движка без БД и HTTP: задержка одиночного FuzzyAgent.evaluate, пропускная способность
+evaluate_batch в зависимости от размера пачки, время _build_system / rebuild и число испытаний
+FuzzyOptimizer в секунду. Агенты строятся из configs/*.json без общей памяти.
+
+Запуск из каталога fuzzy: python benchmarks/bench_engine.py [--quick] > engine.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from common import CONFIGS_DIR, environment, latency_metrics, metric, timings
+from engine import FuzzyAgent, FuzzyOptimizer
+from inference import INPUT_FIELDS
+
+AGENTS = {"effort": "effort_config.json", "risk": "risk_config.json"}
+BATCH_SIZES = (1, 10, 100, 1000, 10000)
+
+
+def _agent(name: str) -> FuzzyAgent:
+    return FuzzyAgent(os.path.join(CONFIGS_DIR, AGENTS[name]), name)
+
+
+def _inputs(agent: FuzzyAgent, size: int, rng: np.random.Generator) -> np.ndarray:
+    """Случайные точки сетки универсумов в порядке INPUT_FIELDS, на которых срабатывает хотя бы одно правило"""
+    universes = np.array([agent.config["universes"][name] for name in INPUT_FIELDS], dtype=np.float64)
+    lows, highs, steps = universes[:, 0], universes[:, 1], universes[:, 2]
+    X = lows + rng.integers(0, np.floor((highs - lows) / steps) + 1, size=(size * 2, len(lows))) * steps
+    X = X[np.isfinite(agent.evaluate_batch(X, columns=list(INPUT_FIELDS)))]
+    return X[:size]
+
+
+def bench_agent(name: str, repeat: int, trials: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    agent = _agent(name)
+    metrics = {}
+
+    rows = [dict(zip(INPUT_FIELDS, row)) for row in _inputs(agent, repeat, rng)]
+    cursor = iter(rows * 2)
+    metrics.update(latency_metrics(f"{name}.evaluate", timings(lambda: agent.evaluate(next(cursor)), len(rows) - 3)))
+
+    for size in BATCH_SIZES:
+        X = _inputs(agent, size, rng)
+        values = timings(lambda: agent.evaluate_batch(X, columns=list(INPUT_FIELDS)), max(repeat // max(size // 100, 1), 5))
+        best = min(values)
+        metrics[f"{name}.batch_{size}.rows_per_sec"] = metric(len(X) / best, "rows/s", "higher")
+        metrics[f"{name}.batch_{size}.per_row_us"] = metric(best / len(X) * 1e6, "us")
+
+    metrics.update(latency_metrics(f"{name}.build_system", timings(agent._build_system, max(repeat // 10, 5)), 1e3, "ms"))
+    metrics.update(latency_metrics(f"{name}.rebuild", timings(agent.rebuild, max(repeat // 10, 5)), 1e3, "ms"))
+
+    # Фидбэк - предсказания с шумом: оптимизатору есть что улучшать, а число испытаний фиксировано
+    X = _inputs(agent, 200, rng)
+    predicted = agent.evaluate_batch(X, columns=list(INPUT_FIELDS))
+    for row, value in zip(X, predicted):
+        agent.add_feedback(dict(zip(INPUT_FIELDS, row)), float(value), float(np.clip(value + rng.normal(0, 8), 0, 100)))
+    optimizer = FuzzyOptimizer(agent)
+    history = agent.feedback.snapshot(limit=200)
+    method = agent.config["consequent"]["defuzzify_method"]
+    started = time.perf_counter()
+    result = optimizer._optimize_single_method(
+        method, history, n_trials=trials, timeout_seconds=3600, reg_strength=optimizer._get_reg_strength(len(history))
+    )
+    elapsed = time.perf_counter() - started
+    metrics[f"{name}.optimizer.trials_per_sec"] = metric(result["n_trials"] / elapsed, "trials/s", "higher")
+    metrics[f"{name}.optimizer.per_trial_ms"] = metric(elapsed / max(result["n_trials"], 1) * 1e3, "ms")
+    return metrics
+
+
+def run(repeat: int = 500, trials: int = 40, seed: int = 0) -> dict:
+    import optuna
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    metrics = {}
+    for name in AGENTS:
+        metrics.update(bench_agent(name, repeat, trials, seed))
+    return {
+        "benchmark": "engine",
+        "parameters": {"repeat": repeat, "optimizer_trials": trials, "seed": seed, "batch_sizes": list(BATCH_SIZES)},
+        "metrics": metrics
+    }
+
+
+if __name__ == "__main__":
+    from loguru import logger
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--trials", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="меньше повторов (проверка, а не замер)")
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    result = run(50 if args.quick else args.repeat, 5 if args.quick else args.trials, args.seed)
+    json.dump({"environment": environment(), **result}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
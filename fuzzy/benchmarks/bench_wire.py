@@ -0,0 +1,128 @@
+# bench_wire.py
+"""
+Накладные расходы формата обмена: JSON (как отвечает FastAPI - jsonable_encoder + json.dumps)
+против MessagePack (wire.py). Для тел запросов и ответов /evaluate/batch разных размеров и ответа
+/engine/{agent} меряются размер в байтах и медианное время кодирования/декодирования.
+Декодирование пачки включает разворачивание колоночного ответа обратно в словари.
+
+Запуск из каталога fuzzy: python benchmarks/bench_wire.py [--repeat N] > wire.json
+Результат - JSON в stdout.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+from datetime import datetime
+
+import msgpack
+from fastapi.encoders import jsonable_encoder
+
+from common import CONFIGS_DIR, environment, metric, timings
+from engine import compile_config
+from knowledge import MITIGATION_STRATEGIES, risk_category
+from schemas import TaskOutput
+import wire
+
+BATCH_SIZES = (1, 100, 1000)
+CONFIG_PATH = os.path.join(CONFIGS_DIR, "risk_config.json")
+
+
+def _median_us(fn, repeat: int) -> float:
+    return round(statistics.median(timings(fn, repeat)) * 1e6, 2)
+
+
+def _expand(body: dict) -> list:
+    """То же, что делает клиент (server/fuzzy_client.py) с колоночным ответом"""
+    results = []
+    for row in body["rows"]:
+        result = dict(zip(body["fields"], row))
+        result["mitigation_strategies"] = body["mitigation_strategies"][result["risk_category"]]
+        result["evaluated_at"] = body["evaluated_at"]
+        results.append(result)
+    return results
+
+
+def _tasks(size: int, rng: random.Random) -> list:
+    return [
+        {
+            "task_id": f"TASK-{i}",
+            "code_changes_lines": rng.randint(1, 2000),
+            "dependencies_count": rng.randint(0, 20),
+            "team_expertise": round(rng.uniform(1, 5), 1),
+            "requirement_uncertainty_pct": rng.randint(0, 100),
+            "task_type": rng.choice(["feature", "bugfix", "refactor"])
+        }
+        for i in range(size)
+    ]
+
+
+def _batch_result(tasks: list, rng: random.Random) -> dict:
+    evaluated_at = datetime.utcnow()
+    outputs = []
+    for task in tasks:
+        risk = round(rng.uniform(0, 100), 2)
+        category = risk_category(risk)
+        outputs.append(TaskOutput(
+            task_id=task["task_id"],
+            complexity_score=round(rng.uniform(0, 100), 2),
+            risk_score=risk,
+            risk_category=category,
+            mitigation_strategies=MITIGATION_STRATEGIES[category],
+            evaluated_at=evaluated_at
+        ))
+    return {"results": outputs, "errors": []}
+
+
+def _case(name: str, content, compact, decode_compact, repeat: int) -> dict:
+    json_body = json.dumps(jsonable_encoder(content)).encode()
+    packed_content = compact(content) if compact else content
+    msgpack_body = wire.packb(packed_content)
+    return {
+        "case": name,
+        "json": {
+            "bytes": len(json_body),
+            "encode_us": _median_us(lambda: json.dumps(jsonable_encoder(content)).encode(), repeat),
+            "decode_us": _median_us(lambda: json.loads(json_body), repeat)
+        },
+        "msgpack": {
+            "bytes": len(msgpack_body),
+            "encode_us": _median_us(lambda: wire.packb(compact(content) if compact else content), repeat),
+            "decode_us": _median_us(lambda: decode_compact(msgpack.unpackb(msgpack_body, raw=False)), repeat)
+        }
+    }
+
+
+def run(repeat: int = 50, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    cases = []
+    for size in BATCH_SIZES:
+        tasks = _tasks(size, rng)
+        cases.append(_case(f"batch_request_{size}", {"items": tasks}, None, lambda body: body, repeat))
+        cases.append(_case(f"batch_response_{size}", _batch_result(tasks, rng), wire.compact_batch, _expand, repeat))
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        engine = compile_config(json.load(f))
+    cases.append(_case("engine_payload", {"engine": engine.to_payload()}, None, lambda body: body, max(repeat // 10, 3)))
+    metrics = {}
+    for case in cases:
+        case["msgpack_size_ratio"] = round(case["msgpack"]["bytes"] / case["json"]["bytes"], 3)
+        for fmt in ("json", "msgpack"):
+            metrics[f"{case['case']}.{fmt}.bytes"] = metric(case[fmt]["bytes"], "bytes")
+            metrics[f"{case['case']}.{fmt}.encode_us"] = metric(case[fmt]["encode_us"], "us")
+            metrics[f"{case['case']}.{fmt}.decode_us"] = metric(case[fmt]["decode_us"], "us")
+    return {
+        "benchmark": "wire",
+        "parameters": {"repeat": repeat, "seed": seed, "msgpack": ".".join(map(str, msgpack.version))},
+        "cases": cases,
+        "metrics": metrics
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    json.dump({"environment": environment(), **run(args.repeat, args.seed)}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
@@ -0,0 +1,75 @@
+# common.py
+"""
+Общее для бенчмарков: замеры времени, описание метрик и окружения.
+
+Каждый набор (bench_*.py) возвращает {"benchmark": имя, "metrics": {...}, ...}, где метрика -
+{"value", "unit", "better": "lower" | "higher"}. По плоскому словарю metrics run.py сравнивает
+результаты разных прогонов.
+"""
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+FUZZY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIGS_DIR = os.path.join(FUZZY_DIR, "configs")
+
+if FUZZY_DIR not in sys.path:
+    sys.path.insert(0, FUZZY_DIR)
+
+
+def metric(value: float, unit: str, better: str = "lower") -> Dict:
+    return {"value": round(float(value), 3), "unit": unit, "better": better}
+
+
+def timings(fn: Callable[[], object], repeat: int, warmup: int = 3) -> List[float]:
+    """Время каждого из repeat вызовов, с"""
+    for _ in range(warmup):
+        fn()
+    result = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        result.append(time.perf_counter() - started)
+    return result
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def latency_metrics(prefix: str, values: List[float], scale: float = 1e6, unit: str = "us") -> Dict[str, Dict]:
+    """Медиана, p95 и среднее по замерам в секундах"""
+    return {
+        f"{prefix}.median": metric(statistics.median(values) * scale, unit),
+        f"{prefix}.p95": metric(percentile(values, 95) * scale, unit),
+        f"{prefix}.mean": metric(statistics.fmean(values) * scale, unit),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=FUZZY_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def environment() -> Dict:
+    """Что нужно знать, чтобы сравнивать прогоны: версия кода, интерпретатор, библиотеки, машина"""
+    import numpy
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
@@ -0,0 +1,108 @@
+# run.py
+"""
+Запуск наборов бенчмарков и сравнение с прошлым прогоном.
+
+    python benchmarks/run.py                                 # engine и wire, JSON в stdout
+    python benchmarks/run.py --suite engine api -o bench.json
+    python benchmarks/run.py --compare baseline.json --threshold 0.15
+
+Наборы: engine (bench_engine.py, без БД), wire (bench_wire.py), api (bench_api.py, нужен Postgres
+из FUZZY_DB_*). Результат: {"environment": ..., "suites": {набор: {"metrics": ...}}}.
+С --compare для каждой общей метрики печатается изменение в stderr; код выхода 1, если хоть одна
+метрика ухудшилась больше чем на threshold (доля). Сравнивать имеет смысл прогоны на одной машине
+с одинаковыми параметрами - они сохраняются в результате.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List
+
+from common import environment
+
+SUITES = ("engine", "wire", "api")
+DEFAULT_SUITES = ("engine", "wire")
+
+
+def run_suite(name: str, quick: bool) -> Dict:
+    if name == "engine":
+        import bench_engine
+        return bench_engine.run(50, 5) if quick else bench_engine.run()
+    if name == "wire":
+        import bench_wire
+        return bench_wire.run(10 if quick else 50)
+    if name == "api":
+        import bench_api
+        return bench_api.run(50 if quick else 500)
+    raise ValueError(f"Unknown benchmark suite '{name}'")
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[Dict]:
+    """Изменения общих метрик; regression - ухудшение больше threshold"""
+    changes = []
+    for suite, result in current["suites"].items():
+        previous = baseline.get("suites", {}).get(suite, {}).get("metrics", {})
+        for name, value in result["metrics"].items():
+            if name not in previous or not previous[name]["value"]:
+                continue
+            change = value["value"] / previous[name]["value"] - 1
+            worse = change if value["better"] == "lower" else -change
+            changes.append({
+                "suite": suite,
+                "metric": name,
+                "baseline": previous[name]["value"],
+                "current": value["value"],
+                "unit": value["unit"],
+                "change": round(change, 4),
+                "regression": worse > threshold
+            })
+    return changes
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Fuzzy service benchmarks")
+    parser.add_argument("--suite", nargs="+", choices=SUITES, default=list(DEFAULT_SUITES))
+    parser.add_argument("-o", "--output", help="файл для результата (по умолчанию stdout)")
+    parser.add_argument("--compare", help="результат прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.1, help="допустимое ухудшение метрики, доля")
+    parser.add_argument("--quick", action="store_true", help="меньше повторов (проверка, а не замер)")
+    args = parser.parse_args(argv)
+
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    result = {"environment": environment(), "quick": args.quick, "suites": {}}
+    for name in args.suite:
+        print(f"[BENCH] running {name}...", file=sys.stderr)
+        result["suites"][name] = run_suite(name, args.quick)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        changes = compare(result, baseline, args.threshold)
+        result["comparison"] = {
+            "baseline": baseline.get("environment", {}),
+            "threshold": args.threshold,
+            "changes": changes
+        }
+        for change in changes:
+            mark = "REGRESSION" if change["regression"] else ""
+            print(
+                f"{change['suite']:7} {change['metric']:55} {change['baseline']:>12} -> {change['current']:>12} "
+                f"{change['unit']:7} {change['change']:+.1%} {mark}",
+                file=sys.stderr
+            )
+        exit_code = 1 if any(change["regression"] for change in changes) else 0
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,12 @@
 # database.py
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
-from psycopg2 import sql
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2 import sql, pool
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, TRANSACTION_STATUS_IDLE
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
 
 class DatabaseConfig:
     '''Класс конфигурации БД'''
@@ -36,13 +41,41 @@ class DatabaseConfig:
         }
 
 
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
 class DatabaseConnection:
-    '''Класс подключения к БД'''
-    def __init__(self, config: DatabaseConfig):
+    '''Класс подключения к БД: пул соединений с выдачей/возвратом и проверкой живости'''
+    def __init__(self, config: DatabaseConfig,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 acquire_timeout: float = 30.0,
+                 health_check_interval: float = 30.0):
         self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
         self._connection = None
-    
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "acquired": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+            "in_use": 0,
+            "peak_in_use": 0,
+            "wait_total_ms": 0.0,
+            "wait_max_ms": 0.0,
+        }
+
     def get_connection(self):
+        """Отдельное (не пуловое) соединение - для долгоживущих задач вроде LISTEN"""
         if self._connection is None or self._connection.closed:
             self._connection = psycopg2.connect(**self.config.get_connection_params())
         return self._connection
@@ -51,6 +84,110 @@ class DatabaseConnection:
         if self._connection and not self._connection.closed:
             self._connection.close()
 
+    def _get_pool(self) -> pool.ThreadedConnectionPool:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = pool.ThreadedConnectionPool(
+                        self.min_size, self.max_size, **self.config.get_connection_params()
+                    )
+        return self._pool
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self):
+        """Берёт соединение из пула, ожидая свободного не дольше acquire_timeout"""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._stats_lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeoutError(f"No free DB connection in {self.acquire_timeout}s (max_size={self.max_size})")
+        try:
+            db_pool = self._get_pool()
+            conn = db_pool.getconn()
+            while not self._is_healthy(conn):
+                with self._stats_lock:
+                    self._stats["health_check_failures"] += 1
+                self._last_used.pop(id(conn), None)
+                db_pool.putconn(conn, close=True)
+                conn = db_pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        waited_ms = (time.monotonic() - started) * 1000
+        with self._stats_lock:
+            self._stats["acquired"] += 1
+            self._stats["in_use"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._stats["in_use"])
+            self._stats["wait_total_ms"] += waited_ms
+            self._stats["wait_max_ms"] = max(self._stats["wait_max_ms"], waited_ms)
+        return conn
+
+    def release(self, conn, discard: bool = False):
+        """Возвращает соединение в пул; битые или явно отброшенные закрываются"""
+        try:
+            if not conn.closed and not discard and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            discard = True
+        close = discard or conn.closed
+        if close:
+            self._last_used.pop(id(conn), None)
+            with self._stats_lock:
+                self._stats["discarded"] += 1
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._get_pool().putconn(conn, close=close)
+        finally:
+            with self._stats_lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Соединение из пула на время блока; незакоммиченная транзакция откатывается"""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def pool_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        acquired = stats["acquired"]
+        stats["wait_avg_ms"] = round(stats["wait_total_ms"] / acquired, 3) if acquired else 0.0
+        stats["wait_total_ms"] = round(stats["wait_total_ms"], 3)
+        stats["wait_max_ms"] = round(stats["wait_max_ms"], 3)
+        stats["min_size"] = self.min_size
+        stats["max_size"] = self.max_size
+        stats["utilization"] = round(stats["in_use"] / self.max_size, 3)
+        return stats
+
+    def close_pool(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
     @staticmethod
     def create_database(config: DatabaseConfig):
         """
@@ -91,4 +228,48 @@ class DatabaseConnection:
             return False
         finally:
             if conn:
-                conn.close()
\ No newline at end of file
+                conn.close()
+
+
+class AsyncDatabaseConnection:
+    '''Асинхронный пул соединений (psycopg3) для обработчиков FastAPI'''
+    def __init__(self, config: DatabaseConfig,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 acquire_timeout: float = 30.0):
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self._pool = None
+
+    def _conninfo(self) -> str:
+        params = self.config.get_connection_params()
+        params["dbname"] = params.pop("database")
+        return make_conninfo(**params)
+
+    async def open(self):
+        if self._pool is None:
+            self._pool = AsyncConnectionPool(
+                self._conninfo(),
+                min_size=self.min_size,
+                max_size=self.max_size,
+                timeout=self.acquire_timeout,
+                check=AsyncConnectionPool.check_connection,
+                open=False
+            )
+            await self._pool.open()
+
+    def connection(self):
+        """async-контекст: коммит при нормальном выходе, откат при исключении"""
+        if self._pool is None:
+            raise RuntimeError("AsyncDatabaseConnection is not opened")
+        return self._pool.connection()
+
+    def pool_stats(self) -> dict:
+        return self._pool.get_stats() if self._pool is not None else {}
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
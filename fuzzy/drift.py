@@ -0,0 +1,216 @@
+# drift.py
+"""
+Планировщик автооптимизации по дрейфу вместо фиксированного порога числа фидбэков.
+
+Для каждого агента хранится база: входы и MAE текущего движка на первых error_window фидбэках,
+пришедших после появления версии конфига (после оптимизации, импорта, выката кандидата база собирается
+заново). Окно, на котором оптимизатор подбирал параметры, в базу не попадает - MAE на нём занижена.
+На каждые check_every новых фидбэков сравниваются последние error_window записей с базой:
+- скользящая MAE текущего движка: выше max_mae или выше базовой больше чем в (1 + error_increase) раз;
+- PSI (population stability index) распределения каждого входа: больше psi_threshold.
+Пока база набирается, действует только граница max_mae.
+Оптимизация запускается, только если сработало одно из условий, с прошлого запуска прошло не меньше
+min_interval секунд и процессорное время оптимизаций за budget_window секунд не превысило cpu_budget.
+Все проверки попадают в журнал решений (decisions).
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+import numpy as np
+from inference import INPUT_FIELDS
+from feedback_store import FeedbackBatch
+
+# Ошибка, которой штрафуется вход без сработавших правил (как в FuzzyOptimizer)
+UNDEFINED_ERROR = 100.0
+
+
+def psi(reference: np.ndarray, current: np.ndarray, bins: int = 10, eps: float = 1e-4) -> float:
+    """PSI по квантильным корзинам базы; 0.1-0.2 - заметный сдвиг, больше 0.2 - существенный"""
+    if len(reference) == 0 or len(current) == 0:
+        return 0.0
+    # входы в основном целочисленные: совпадающие квантили схлопываются в одну границу
+    edges = np.unique(np.quantile(reference, np.linspace(0, 1, bins + 1)[1:-1]))
+    expected = np.bincount(np.searchsorted(edges, reference, side="right"), minlength=len(edges) + 1) / len(reference)
+    actual = np.bincount(np.searchsorted(edges, current, side="right"), minlength=len(edges) + 1) / len(current)
+    expected, actual = np.clip(expected, eps, None), np.clip(actual, eps, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def _tail(batch: FeedbackBatch, n: int) -> FeedbackBatch:
+    return FeedbackBatch(*(a[-n:] for a in batch))
+
+
+def _mae(engine, batch: FeedbackBatch) -> float:
+    predicted = engine.evaluate_batch(batch.inputs, columns=list(INPUT_FIELDS))
+    errors = np.where(np.isfinite(predicted), np.abs(predicted - batch.target), UNDEFINED_ERROR)
+    return float(errors.mean())
+
+
+class DriftScheduler:
+    """Решает, запускать ли автооптимизацию агента; состояние - в памяти реплики"""
+
+    def __init__(self, error_window: int = 100, max_mae: Optional[float] = None, error_increase: float = 0.25,
+                 psi_threshold: float = 0.2, min_samples: int = 30, check_every: int = 10,
+                 min_interval: float = 3600, cpu_budget: float = 600, budget_window: float = 86400,
+                 log_size: int = 200):
+        self.error_window = error_window
+        self.max_mae = max_mae
+        self.error_increase = error_increase
+        self.psi_threshold = psi_threshold
+        self.min_samples = min_samples
+        self.check_every = check_every
+        self.min_interval = min_interval
+        self.cpu_budget = cpu_budget
+        self.budget_window = budget_window
+        self._lock = threading.Lock()
+        self._baselines: Dict[str, Dict] = {}
+        self._checked: Dict[str, int] = {}
+        self._started: Dict[str, float] = {}
+        # (time.time() окончания, агент, процессорные секунды)
+        self._runs: Deque[tuple] = deque()
+        self._log: Deque[Dict] = deque(maxlen=log_size)
+
+    def _baseline(self, name: str, engine, window: FeedbackBatch) -> Dict:
+        """База версии движка; mae и inputs - None, пока не пришли error_window фидбэков после смены версии"""
+        baseline = self._baselines.get(name)
+        if baseline is None or baseline["version"] != engine.version:
+            baseline = {
+                "version": engine.version,
+                "started": time.time(),
+                "inputs": None,
+                "mae": None,
+                "samples": 0,
+                "since": datetime.utcnow().isoformat()
+            }
+            self._baselines[name] = baseline
+        if baseline["mae"] is None:
+            fresh = np.flatnonzero(window.timestamp >= baseline["started"])
+            baseline["samples"] = len(fresh)
+            if len(fresh) >= self.error_window:
+                first = FeedbackBatch(*(a[fresh[:self.error_window]] for a in window))
+                baseline["inputs"] = first.inputs
+                baseline["mae"] = _mae(engine, first)
+                baseline["samples"] = len(first)
+        return baseline
+
+    def cpu_used(self) -> float:
+        """Процессорное время оптимизаций за последние budget_window секунд"""
+        with self._lock:
+            horizon = time.time() - self.budget_window
+            while self._runs and self._runs[0][0] < horizon:
+                self._runs.popleft()
+            return sum(cpu for _, _, cpu in self._runs)
+
+    def _record(self, entry: Dict) -> Dict:
+        with self._lock:
+            self._log.append(entry)
+        return entry
+
+    def decide(self, agent, total: int) -> Optional[Dict]:
+        """
+        Проверка агента после нового фидбэка. total - число фидбэков агента в БД.
+        None - с прошлой проверки пришло меньше check_every фидбэков; иначе решение из журнала,
+        decision["action"] == "optimize" - пора оптимизировать (время запуска уже учтено для min_interval)
+        """
+        name = agent.name
+        with self._lock:
+            if name in self._checked and total - self._checked[name] < self.check_every:
+                return None
+            self._checked[name] = total
+        entry = {"time": datetime.utcnow().isoformat(), "agent": name, "feedback_count": total}
+        window = agent.feedback.snapshot()
+        if len(window) < self.min_samples:
+            return self._record({**entry, "action": "skip", "reason": "not_enough_feedback", "window": len(window)})
+
+        engine = agent.current_engine()
+        baseline = self._baseline(name, engine, window)
+        recent = _tail(window, self.error_window)
+        rolling_mae = _mae(engine, recent)
+        triggers = []
+        if self.max_mae is not None and rolling_mae > self.max_mae:
+            triggers.append("error_above_max")
+        entry.update({"version": engine.version, "rolling_mae": round(rolling_mae, 4)})
+        if baseline["mae"] is None:
+            entry.update(baseline_mae=None, baseline_samples=baseline["samples"], triggers=triggers)
+            if not triggers:
+                return self._record({**entry, "action": "skip", "reason": "collecting_baseline"})
+        else:
+            drift = {
+                field: round(psi(baseline["inputs"][:, i], recent.inputs[:, i]), 4)
+                for i, field in enumerate(INPUT_FIELDS)
+            }
+            if rolling_mae > baseline["mae"] * (1 + self.error_increase):
+                triggers.append("error_increase")
+            if max(drift.values()) > self.psi_threshold:
+                triggers.append("input_drift")
+            entry.update(baseline_mae=round(baseline["mae"], 4), psi=drift, triggers=triggers)
+            if not triggers:
+                return self._record({**entry, "action": "skip", "reason": "no_drift"})
+
+        now = time.time()
+        cpu_used = self.cpu_used()
+        with self._lock:
+            started = self._started.get(name)
+            if started is not None and now - started < self.min_interval:
+                entry.update(action="skip", reason="min_interval", retry_in_sec=round(self.min_interval - (now - started)))
+            elif cpu_used >= self.cpu_budget:
+                entry.update(action="skip", reason="cpu_budget", cpu_used_sec=round(cpu_used, 1))
+            else:
+                self._started[name] = now
+                entry.update(action="optimize", reason="+".join(triggers), cpu_used_sec=round(cpu_used, 1))
+            self._log.append(entry)
+        return entry
+
+    def cancel(self, decision: Dict, reason: str):
+        """Запуск не состоялся (например, оптимизацию забрала другая реплика) - min_interval не отсчитывается"""
+        with self._lock:
+            self._started.pop(decision["agent"], None)
+            decision["action"] = "skip"
+            decision["reason"] = reason
+
+    def record_run(self, agent_name: str, cpu_seconds: float, success: bool):
+        with self._lock:
+            self._runs.append((time.time(), agent_name, cpu_seconds))
+            self._log.append({
+                "time": datetime.utcnow().isoformat(),
+                "agent": agent_name,
+                "action": "finished" if success else "failed",
+                "cpu_sec": round(cpu_seconds, 2)
+            })
+
+    def decisions(self, agent: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Журнал решений, новые первыми"""
+        with self._lock:
+            entries = [dict(entry) for entry in reversed(self._log) if agent is None or entry["agent"] == agent]
+        return entries[:limit]
+
+    def status(self) -> Dict:
+        cpu_used = self.cpu_used()
+        now = time.time()
+        with self._lock:
+            agents = {
+                name: {
+                    "baseline_version": baseline["version"],
+                    "baseline_mae": None if baseline["mae"] is None else round(baseline["mae"], 4),
+                    "baseline_samples": baseline["samples"],
+                    "baseline_since": baseline["since"],
+                    "last_checked_count": self._checked.get(name),
+                    "next_run_allowed_in_sec": max(0, round(self.min_interval - (now - self._started[name])))
+                    if name in self._started else 0
+                }
+                for name, baseline in self._baselines.items()
+            }
+        return {
+            "agents": agents,
+            "cpu_used_sec": round(cpu_used, 1),
+            "cpu_budget_sec": self.cpu_budget,
+            "budget_window_sec": self.budget_window,
+            "bounds": {
+                "max_mae": self.max_mae,
+                "error_increase": self.error_increase,
+                "psi": self.psi_threshold,
+                "min_interval_sec": self.min_interval
+            }
+        }
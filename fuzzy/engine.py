@@ -1,22 +1,137 @@
 import os
+import copy
 import json
 import time
 import numpy as np
 import pandas as pd
 import skfuzzy as fuzz
-from skfuzzy import control as ctrl
 from scipy import stats
 from datetime import datetime
 from loguru import logger
 from typing import Dict, List, Optional, Tuple, Any
 import optuna
+from inference import CompiledEngine, INPUT_FIELDS, TSK_METHODS, config_version
+from feedback_store import FeedbackBatch, FeedbackStore
+
+def _sample_mf(universe: np.ndarray, params: Dict) -> np.ndarray:
+    if params["type"] == "trimf":
+        return fuzz.trimf(universe, params["params"])
+    elif params["type"] == "trapmf":
+        return fuzz.trapmf(universe, params["params"])
+    elif params["type"] == "gaussmf":
+        return fuzz.gaussmf(universe, params["params"][0], params["params"][1])
+    raise ValueError(f"Unsupported membership function type: {params['type']}")
+
+def _tsk_coefficients(params: Dict, inputs: List[str], order: List[str]) -> List[float]:
+    """
+    Терм выхода TSK: constant - [c], linear - [c, коэффициенты входов в порядке consequent.inputs].
+    Порядок задаётся списком явно: JSONB в БД не сохраняет порядок ключей antecedents
+    """
+    values = [float(p) for p in params["params"]]
+    if params["type"] == "constant" and len(values) == 1:
+        return values + [0.0] * len(inputs)
+    if params["type"] == "linear" and len(values) == 1 + len(inputs):
+        coefficients = dict(zip(inputs, values[1:]))
+        return values[:1] + [coefficients[name] for name in order]
+    raise ValueError(
+        f"Unsupported TSK consequent: {params['type']} with {len(values)} params "
+        f"(expected constant [c] or linear [c, {len(inputs)} coefficients])"
+    )
+
+class _RuleTerm:
+    def __init__(self, program: list):
+        self.program = program
+
+    def __and__(self, other):
+        return _RuleTerm(["and", self.program, other.program])
+
+    def __or__(self, other):
+        return _RuleTerm(["or", self.program, other.program])
+
+    def __invert__(self):
+        return _RuleTerm(["not", self.program])
+
+class _RuleVariable:
+    def __init__(self, labels: List[str], offset: int = 0):
+        self.index = {label: offset + i for i, label in enumerate(labels)}
+
+    def __getitem__(self, label: str) -> _RuleTerm:
+        return _RuleTerm(["term", self.index[label]])
+
+def compile_config(cfg: Dict) -> CompiledEngine:
+    """
+    Компилирует JSON-конфиг агента в CompiledEngine (правила в том же синтаксисе, что и для skfuzzy).
+    "inference": "tsk" - термы выхода задаются как constant/linear (см. _tsk_coefficients), а не trimf
+    """
+    inference = cfg.get("inference", "mamdani")
+    if inference not in ("mamdani", "tsk"):
+        raise ValueError(f"Unknown inference mode: {inference}")
+    arrays = {}
+    terms = {}
+    ctx = {}
+    offset = 0
+    for var_name, mf_cfg in cfg["antecedents"].items():
+        u_min, u_max, step = cfg["universes"][var_name]
+        universe = np.arange(u_min, u_max + step, step)
+        arrays[f"universe:{var_name}"] = universe
+        arrays[f"mf:{var_name}"] = np.vstack([_sample_mf(universe, params) for params in mf_cfg.values()])
+        terms[var_name] = list(mf_cfg.keys())
+        ctx[var_name] = _RuleVariable(terms[var_name], offset)
+        offset += len(mf_cfg)
+
+    cons = cfg["consequent"]
+    if inference == "tsk":
+        defuzzify_method = cons.get("defuzzify_method", TSK_METHODS[0])
+        if defuzzify_method.lower() not in TSK_METHODS:
+            raise ValueError(f"Unknown TSK defuzzify method: {defuzzify_method}, expected one of {TSK_METHODS}")
+        tsk_inputs = cons.get("inputs", list(terms))
+        if sorted(tsk_inputs) != sorted(terms):
+            raise ValueError(f"TSK consequent inputs {tsk_inputs} do not match antecedents {list(terms)}")
+        arrays["tsk:__out__"] = np.array(
+            [_tsk_coefficients(params, tsk_inputs, list(terms)) for params in cons["mfs"].values()], dtype=np.float64
+        ).reshape(len(cons["mfs"]), 1 + len(terms))
+    else:
+        defuzzify_method = cons.get("defuzzify_method", "centroid")
+        c_univ = cons["universe"]
+        cons_universe = np.arange(c_univ[0], c_univ[1] + c_univ[2], c_univ[2])
+        arrays["universe:__out__"] = cons_universe
+        arrays["mf:__out__"] = np.vstack([fuzz.trimf(cons_universe, params["params"]) for params in cons["mfs"].values()])
+    cons_labels = list(cons["mfs"].keys())
+
+    rules, rule_consequents = [], []
+    cons_var = _RuleVariable(cons_labels)
+    for rule_expr in cfg["rules"]:
+        if "=>" in rule_expr:
+            ant_part, cons_part = rule_expr.split("=>", 1)
+            ant_obj = eval(ant_part.strip(), {"__builtins__": {}}, ctx)
+            cons_obj = eval(cons_part.strip(), {"__builtins__": {}}, {cons["name"]: cons_var})
+            rules.append(ant_obj.program)
+            rule_consequents.append(cons_obj.program[1])
+
+    meta = {
+        "version": config_version(cfg),
+        "inference": inference,
+        "inputs": list(cfg["antecedents"].keys()),
+        "terms": terms,
+        "output": {
+            "name": cons["name"],
+            "terms": cons_labels,
+            "defuzzify_method": defuzzify_method
+        },
+        "rules": rules,
+        "rule_consequents": rule_consequents
+    }
+    return CompiledEngine(arrays, meta)
 
 class FuzzyAgent:
-    def __init__(self, config_path: str, name: str):
+    def __init__(self, config_path: str, name: str, store=None, feedback_capacity: int = 500,
+                 config: Optional[Dict] = None, feedback: Optional[FeedbackStore] = None):
         self.name = name
         self.config_path = config_path
-        self.config = self._load_config(config_path)
-        self.feedback_history: List[Dict] = []
+        self.store = store
+        self.config = self._load_config(config_path) if config is None else config
+        self.feedback = FeedbackStore(feedback_capacity) if feedback is None else feedback
+        # в общую память агент выкладывается явно (publish), когда конфиг сверен с БД
         self._build_system()
 
     def _load_config(self, path: str) -> Dict:
@@ -24,59 +139,76 @@ class FuzzyAgent:
             return json.load(f)
 
     def _build_system(self):
-        cfg = self.config
-        self.antecedents = {}
-        for var_name, mf_cfg in cfg["antecedents"].items():
-            u_min, u_max, step = cfg["universes"][var_name]
-            universe = np.arange(u_min, u_max + step, step)
-            ant = ctrl.Antecedent(universe, var_name)
-            for label, params in mf_cfg.items():
-                if params["type"] == "trimf":
-                    ant[label] = fuzz.trimf(ant.universe, params["params"])
-                elif params["type"] == "trapmf":
-                    ant[label] = fuzz.trapmf(ant.universe, params["params"])
-                elif params["type"] == "gaussmf":
-                    ant[label] = fuzz.gaussmf(ant.universe, params["params"][0], params["params"][1])
-            self.antecedents[var_name] = ant
-
-        c_univ = cfg["consequent"]["universe"]
-        cons_universe = np.arange(c_univ[0], c_univ[1] + c_univ[2], c_univ[2])
-        self.consequent = ctrl.Consequent(cons_universe, cfg["consequent"]["name"])
-        self.consequent.defuzzify_method = cfg["consequent"].get("defuzzify_method", "centroid")
-        for label, params in cfg["consequent"]["mfs"].items():
-            self.consequent[label] = fuzz.trimf(self.consequent.universe, params["params"])
-
-        self.rules = []
-        ctx = {"__builtins__": {}}
-        ctx.update(self.antecedents)
-        ctx[cfg["consequent"]["name"]] = self.consequent
+        self.engine = compile_config(self.config)
+        self._shared_version = None
 
-        for rule_expr in cfg["rules"]:
-            if "=>" in rule_expr:
-                ant_part, cons_part = rule_expr.split("=>", 1)
-                ant_obj = eval(ant_part.strip(), {"__builtins__": {}}, ctx)
-                cons_obj = eval(cons_part.strip(), {"__builtins__": {}}, ctx)
-                self.rules.append(ctrl.Rule(ant_obj, cons_obj))
+    def evaluate(self, inputs: Dict[str, float]) -> float:
+        self._refresh_shared()
+        value = self.engine.evaluate(inputs)
+        if np.isnan(value):
+            raise ValueError(f"Crisp output cannot be calculated for '{self.engine.output_name}': no rules fired")
+        return value
 
-        self.system = ctrl.ControlSystem(self.rules)
+    def evaluate_batch(self, X: np.ndarray, columns: Optional[List[str]] = None) -> np.ndarray:
+        self._refresh_shared()
+        return self.engine.evaluate_batch(X, columns=columns)
 
-    def evaluate(self, inputs: Dict[str, float]) -> float:
-        sim = ctrl.ControlSystemSimulation(self.system)
-        for k, v in inputs.items():
-            sim.input[k] = v
-        sim.compute()
-        return sim.output[self.config["consequent"]["name"]]
+    def current_engine(self) -> CompiledEngine:
+        """Движок, которым сейчас считает evaluate (с учётом новой версии в общей памяти)"""
+        self._refresh_shared()
+        return self.engine
 
     def add_feedback(self, inputs: Dict[str, float], predicted: float, target: float):
-        self.feedback_history.append({"inputs": inputs, "predicted": predicted, "target": target})
+        self.feedback.append(inputs, predicted, target)
+
+    @property
+    def feedback_history(self) -> List[Dict]:
+        """Окно фидбэка списком словарей (копия; основное хранилище - self.feedback)"""
+        return self.feedback.records()
+
+    def apply_config(self, config: Dict):
+        """Подменяет конфиг (например, пришедший от другой реплики) и пересобирает движок"""
+        self.config = config
+        self._build_system()
+        self.publish()
+
+    def publish(self):
+        """Выкладывает текущий движок в общую память и переключается на разделяемую копию"""
+        if self.store is None:
+            return
+        try:
+            self.store.publish(self.name, self.engine, self.config)
+            self._attach_shared()
+        except OSError as e:
+            logger.warning(f"[SHM] {self.name}: shared engine unavailable, using private copy: {e}")
+
+    def _attach_shared(self):
+        attached = self.store.attach(self.name)
+        if attached is None:
+            return
+        engine, config = attached
+        self.engine = engine
+        self.config = config
+        self._shared_version = engine.version
 
-    def save_config(self):
-        with open(self.config_path, "w", encoding="utf-8") as f:
-            json.dump(self.config, f, indent=2, ensure_ascii=False)
+    def _refresh_shared(self):
+        # Приватный движок (например, во время оптимизации) не подменяем
+        if self.store is None or self._shared_version is None:
+            return
+        version = self.store.current_version(self.name)
+        if version and version != self._shared_version:
+            logger.info(f"[SHM] {self.name}: switching to config version {version}")
+            self._attach_shared()
 
     def rebuild(self):
+        """Приватная пересборка из self.config (без publish агент перестаёт следить за общей памятью)"""
         self._build_system()
 
+    def detached(self) -> "FuzzyAgent":
+        """Приватная копия для подбора параметров: свой конфиг и движок, то же окно фидбэка, без общей памяти"""
+        self._refresh_shared()
+        return FuzzyAgent(self.config_path, self.name, config=copy.deepcopy(self.config), feedback=self.feedback)
+
 class FuzzyOptimizer:
     def __init__(self, agent: FuzzyAgent):
         self.agent = agent
@@ -93,7 +225,7 @@ class FuzzyOptimizer:
                     idx += len(cfg["params"])
         for label, cfg in self.agent.config["consequent"]["mfs"].items():
             if cfg.get("optimizable", False):
-                self.param_indices.append(("__cons__", label, "params", "trimf", idx))
+                self.param_indices.append(("__cons__", label, "params", cfg.get("type", "trimf"), idx))
                 idx += len(cfg["params"])
         self.param_count = idx
 
@@ -153,6 +285,16 @@ class FuzzyOptimizer:
             elif mtype == "gaussmf":
                 bounds.append((f"{var}_{label}_center", u_min, u_max))
                 bounds.append((f"{var}_{label}_sigma", 0.1, (u_max - u_min) * 0.2))
+            elif mtype in ("constant", "linear"):
+                # TSK: шаг коэффициента входа - такой, чтобы его вклад на всём универсуме входа
+                # менялся не больше чем на 15% универсума выхода; свободный член за универсум не обрезается
+                widths = [1.0] + [
+                    self.agent.config["universes"][name][1] - self.agent.config["universes"][name][0]
+                    for name in self.agent.config["consequent"].get("inputs", self.agent.config["antecedents"])
+                ]
+                for i, p in enumerate(current_params):
+                    margin = max(1e-6, (u_max - u_min) * 0.15 / max(widths[i], 1e-9))
+                    bounds.append((f"{var}_{label}_p{i}", p - margin, p + margin))
         return bounds
 
     def _get_reg_strength(self, history_size: int) -> float:
@@ -160,20 +302,22 @@ class FuzzyOptimizer:
         if history_size < 100: return 0.05
         return 0.01
 
-    def _compute_metrics(self, history: List[Dict]) -> Dict[str, float]:
-        errors = []
-        preds = []
-        targets = []
-        for record in history:
-            try:
-                pred = self.agent.evaluate(record["inputs"])
-                errors.append(abs(pred - record["target"]))
-                preds.append(pred)
-                targets.append(record["target"])
-            except Exception:
-                errors.append(100.0)
-        mae = np.mean(errors) if errors else 100.0
-        rmse = np.sqrt(np.mean([e**2 for e in errors])) if errors else 100.0
+    def _predict(self, history: FeedbackBatch) -> np.ndarray:
+        """Предсказания текущего движка для окна; NaN там, где выход не определён"""
+        try:
+            return self.agent.evaluate_batch(history.inputs, columns=INPUT_FIELDS)
+        except Exception:
+            return np.full(len(history), np.nan)
+
+    def _compute_metrics(self, history: FeedbackBatch) -> Dict[str, float]:
+        if len(history) == 0:
+            return {"mae": 100.0, "rmse": 100.0, "spearman_rho": 0.0}
+        preds = self._predict(history)
+        valid = np.isfinite(preds)
+        errors = np.where(valid, np.abs(preds - history.target), 100.0)
+        preds, targets = preds[valid], history.target[valid]
+        mae = float(np.mean(errors))
+        rmse = float(np.sqrt(np.mean(errors ** 2)))
         rho = 0.0
         if len(preds) >= 5:
             rho_val, _ = stats.spearmanr(preds, targets)
@@ -184,7 +328,7 @@ class FuzzyOptimizer:
             logger.warning("[OPT-DIAG] Negative correlation detected. Check rule directions or target scaling.")
         return {"mae": mae, "rmse": rmse, "spearman_rho": rho}
 
-    def _objective(self, trial: optuna.Trial, history: List[Dict], initial_params: List[float], 
+    def _objective(self, trial: optuna.Trial, history: FeedbackBatch, initial_params: List[float], 
                    param_bounds: List[Tuple[str, float, float]], reg_strength: float, 
                    defuzz_method: str) -> float:
         proposed_params = []
@@ -203,18 +347,10 @@ class FuzzyOptimizer:
         except Exception as e:
             return 1e6
         
-        mse = 0.0
-        count = 0
-        for record in history:
-            try:
-                pred = self.agent.evaluate(record["inputs"])
-                if np.isnan(pred) or np.isinf(pred):
-                    mse += 10000.0
-                else:
-                    mse += (pred - record["target"]) ** 2
-                count += 1
-            except Exception:
-                mse += 10000.0
+        preds = self._predict(history)
+        sq_errors = np.where(np.isfinite(preds), (preds - history.target) ** 2, 10000.0)
+        mse = float(sq_errors.sum())
+        count = len(history)
         
         loss = mse / max(count, 1)
         
@@ -230,7 +366,7 @@ class FuzzyOptimizer:
         
         return loss
 
-    def _optimize_single_method(self, method: str, history: List[Dict], 
+    def _optimize_single_method(self, method: str, history: FeedbackBatch, 
                                n_trials: int, timeout_seconds: int, 
                                reg_strength: float) -> Dict:
         param_bounds = self._get_param_bounds()
@@ -300,19 +436,37 @@ class FuzzyOptimizer:
         }
 
     def optimize_with_method_selection(self, min_samples: int = 15, preferred_method: str = None,
-                                       n_trials_per_method: int = 50, 
+                                       n_trials_per_method: int = 50,
                                        timeout_per_method: int = 120) -> Dict:
+        """
+        Подбор параметров и способа дефаззификации на приватной копии агента (detached): живой агент
+        во время подбора не меняется. При успехе лучший конфиг - в result["config"], выкатывает его
+        вызывающий (apply_config / publish)
+        """
+        tuner = FuzzyOptimizer(self.agent.detached())
+        result = tuner._optimize_with_method_selection(min_samples, preferred_method,
+                                                       n_trials_per_method, timeout_per_method)
+        if "error" not in result:
+            result["config"] = tuner.agent.config
+        return result
+
+    def _optimize_with_method_selection(self, min_samples: int, preferred_method: Optional[str],
+                                        n_trials_per_method: int, timeout_per_method: int) -> Dict:
         agent_name = self.agent.name
         logger.info(f"[OPT-START] {agent_name}: beginning Optuna optimization")
         
-        if len(self.agent.feedback_history) < min_samples:
-            return {"error": f"Need >= {min_samples} feedback samples, got {len(self.agent.feedback_history)}"}
+        if len(self.agent.feedback) < min_samples:
+            return {"error": f"Need >= {min_samples} feedback samples, got {len(self.agent.feedback)}"}
         
+        # конфиг мог смениться с прошлого запуска (импорт, выкат TSK-кандидата): пространство - по текущему
+        self._prepare_optimization_space()
         methods = ["centroid", "bisector", "mom", "lom", "som"]
+        if self.agent.config.get("inference") == "tsk":
+            methods = list(TSK_METHODS)
         if preferred_method and preferred_method in methods:
             methods = [preferred_method]
         
-        history = self.agent.feedback_history[:200]
+        history = self.agent.feedback.snapshot(limit=200)
         reg_strength = self._get_reg_strength(len(history))
         
         initial_metrics = self._compute_metrics(history)
@@ -344,8 +498,6 @@ class FuzzyOptimizer:
         
         if not successful_results:
             logger.error(f"[OPT-FAIL] {agent_name}: ALL methods failed")
-            original_params = self._pack_params()
-            self.agent.rebuild()
             return {
                 "error": "All optimization methods failed",
                 "attempted_methods": methods,
@@ -0,0 +1,121 @@
+# feedback_store.py
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import numpy as np
+from inference import INPUT_FIELDS
+
+
+class FeedbackBatch(NamedTuple):
+    """Колоночный срез фидбэка в хронологическом порядке"""
+    inputs: np.ndarray      # (N, 4), колонки INPUT_FIELDS
+    predicted: np.ndarray   # (N,), сохранённое предсказание (NaN, если неизвестно)
+    target: np.ndarray      # (N,), факт в шкале 0-100
+    timestamp: np.ndarray   # (N,), unix-время фидбэка
+
+    def __len__(self) -> int:
+        return self.target.shape[0]
+
+
+class FeedbackStore:
+    """
+    Ограниченное окно фидбэка агента в виде плоских float64-массивов.
+
+    Кольцевой буфер хранится «зеркально» (каждая запись пишется в позиции i и i + capacity),
+    поэтому последние N записей всегда лежат непрерывно и view() отдаёт их без копирования.
+    Память постоянна: 2 * capacity * 7 чисел на агента.
+    """
+
+    def __init__(self, capacity: int = 500):
+        if capacity <= 0:
+            raise ValueError("FeedbackStore capacity must be positive")
+        self.capacity = capacity
+        self._inputs = np.zeros((2 * capacity, len(INPUT_FIELDS)))
+        self._predicted = np.zeros(2 * capacity)
+        self._target = np.zeros(2 * capacity)
+        self._timestamp = np.zeros(2 * capacity)
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, inputs: Dict[str, float], predicted: Optional[float], target: float,
+               timestamp: Optional[float] = None):
+        row = [inputs[name] for name in INPUT_FIELDS]
+        with self._lock:
+            for pos in (self._next, self._next + self.capacity):
+                self._inputs[pos] = row
+                self._predicted[pos] = np.nan if predicted is None else predicted
+                self._target[pos] = target
+                self._timestamp[pos] = time.time() if timestamp is None else timestamp
+            self._next = (self._next + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def replace(self, batch: FeedbackBatch):
+        """Заменяет содержимое (например, окном из БД); лишние старые записи отбрасываются"""
+        n = min(len(batch), self.capacity)
+        with self._lock:
+            for offset in (0, self.capacity):
+                self._inputs[offset:offset + n] = batch.inputs[len(batch) - n:]
+                self._predicted[offset:offset + n] = batch.predicted[len(batch) - n:]
+                self._target[offset:offset + n] = batch.target[len(batch) - n:]
+                self._timestamp[offset:offset + n] = batch.timestamp[len(batch) - n:]
+            self._next = n % self.capacity
+            self._size = n
+
+    def clear(self):
+        with self._lock:
+            self._next = 0
+            self._size = 0
+
+    def view(self, limit: Optional[int] = None) -> FeedbackBatch:
+        """
+        Последние limit записей без копирования. Массивы смотрят в буфер:
+        их содержимое сдвинется после следующих append, для долгой работы используйте snapshot()
+        """
+        with self._lock:
+            return self._slice(limit)
+
+    def snapshot(self, limit: Optional[int] = None) -> FeedbackBatch:
+        """Копия последних limit записей; копируется под блокировкой, чтобы append не разорвал строку"""
+        with self._lock:
+            return FeedbackBatch(*(a.copy() for a in self._slice(limit)))
+
+    def _slice(self, limit: Optional[int]) -> FeedbackBatch:
+        n = self._size if limit is None else min(limit, self._size)
+        end = self._next + self.capacity
+        sl = slice(end - n, end)
+        return FeedbackBatch(self._inputs[sl], self._predicted[sl], self._target[sl], self._timestamp[sl])
+
+    def records(self) -> List[Dict]:
+        """Окно в прежнем формате списка словарей (для отладки и старых скриптов)"""
+        batch = self.snapshot()
+        return [
+            {
+                "inputs": dict(zip(INPUT_FIELDS, row.tolist())),
+                "predicted": None if np.isnan(pred) else float(pred),
+                "target": float(target)
+            }
+            for row, pred, target in zip(batch.inputs, batch.predicted, batch.target)
+        ]
+
+
+def rows_to_batch(rows: Sequence[Sequence]) -> FeedbackBatch:
+    """
+    Строки queries.training_data_query (новые первыми) -> FeedbackBatch в хронологическом порядке.
+    Факт обрезается до 0-100, строки без факта отбрасываются (как в queries.rows_to_training_data)
+    """
+    if not rows:
+        return FeedbackBatch(np.zeros((0, len(INPUT_FIELDS))), np.zeros(0), np.zeros(0), np.zeros(0))
+    values = np.array([row[:6] for row in rows[::-1]], dtype=np.float64)
+    timestamp = np.array([row[6].timestamp() if row[6] else np.nan for row in rows[::-1]])
+    keep = ~np.isnan(values[:, 5])
+    values, timestamp = values[keep], timestamp[keep]
+    return FeedbackBatch(
+        np.ascontiguousarray(values[:, :4]),
+        values[:, 4].copy(),
+        np.clip(values[:, 5], 0.0, 100.0),
+        timestamp
+    )
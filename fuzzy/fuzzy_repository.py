@@ -1,375 +1,621 @@
 # fuzzy_repository.py
+import gzip
 import json
+import os
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
 from loguru import logger
+from psycopg2 import sql
 from database import DatabaseConnection
+from feedback_store import FeedbackBatch, rows_to_batch
+import queries
 
 class FuzzyFeedbackRepository:
     """Изолированный репозиторий для хранения результатов evaluate и фидбэка"""
     
-    def __init__(self, connection: DatabaseConnection):
+    def __init__(self, connection: DatabaseConnection, months_ahead: int = 2, ensure_tables: bool = True):
         self.connection = connection
-        self._ensure_tables()
+        self.months_ahead = months_ahead
+        if ensure_tables:
+            self._ensure_tables()
 
     def _ensure_tables(self):
-        """Создание таблиц evaluate_results и feedback с FK-связью"""
+        """
+        Создание таблиц evaluate_results и feedback, секционированных по месяцам
+        (evaluated_at и feedback_at). Таблицы прежней несекционированной схемы сервис не трогает:
+        их переносит отдельная команда (python migrate.py legacy-tables), до неё старт прерывается.
+        """
         try:
-            conn = self.connection.get_connection()
-            cursor = conn.cursor()
-            
-            # Таблица результатов evaluate
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS evaluate_results (
-                    id SERIAL PRIMARY KEY,
-                    task_id VARCHAR(255) UNIQUE NOT NULL,
-                    input_volume FLOAT,
-                    input_dependencies FLOAT,
-                    input_expertise FLOAT,
-                    input_uncertainty FLOAT,
-                    task_type VARCHAR(50),
-                    predicted_complexity FLOAT,
-                    predicted_risk FLOAT,
-                    evaluated_at TIMESTAMP DEFAULT NOW()
-                );
-                CREATE INDEX IF NOT EXISTS idx_evaluate_task ON evaluate_results(task_id);
-                CREATE INDEX IF NOT EXISTS idx_evaluate_at ON evaluate_results(evaluated_at);
-            """)
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS feedback (
-                    id SERIAL PRIMARY KEY,
-                    evaluate_id INTEGER REFERENCES evaluate_results(id) ON DELETE CASCADE,
-                    task_id VARCHAR(255) NOT NULL UNIQUE,
-                    actual_effort_hours FLOAT,
-                    actual_risk_score FLOAT,
-                    user_rating VARCHAR(20),
-                    feedback_at TIMESTAMP DEFAULT NOW(),
-                    CONSTRAINT fk_evaluate FOREIGN KEY (task_id) 
-                        REFERENCES evaluate_results(task_id) ON DELETE CASCADE
-                );
-                CREATE INDEX IF NOT EXISTS idx_feedback_task ON feedback(task_id);
-                CREATE INDEX IF NOT EXISTS idx_feedback_at ON feedback(feedback_at);
-            """)
-            
-            conn.commit()
-            cursor.close()
-            logger.info("Tables evaluate_results and feedback ensured")
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                # реплики стартуют одновременно - схему готовит одна
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, 0)", (queries.SCHEMA_LOCK,))
+                if self._has_legacy_tables(cursor):
+                    conn.rollback()
+                    cursor.close()
+                    raise RuntimeError(
+                        "evaluate_results has the legacy unpartitioned schema; "
+                        "run `python migrate.py legacy-tables` once before starting the service"
+                    )
+                self._create_tables(cursor)
+                self._ensure_partition_function(cursor)
+                self._create_partitions(cursor, self.months_ahead)
+                self._ensure_counters(cursor)
+
+                conn.commit()
+                cursor.close()
+                logger.info("Tables evaluate_results, feedback and shadow_predictions ensured")
         except Exception as e:
             logger.error(f"Failed to ensure tables: {e}")
             raise
-        finally:
-            if conn: conn.close()
+
+    def migrate_legacy_tables(self) -> bool:
+        """
+        Разовый перенос несекционированных evaluate_results/feedback прежней схемы в месячные секции:
+        старые таблицы переименовываются в *_legacy, данные копируются, *_legacy удаляются.
+        Всё в одной транзакции под SCHEMA_LOCK, так что параллельные запуски и старт реплик ждут её;
+        повторный запуск ничего не делает. Возвращает True, если перенос был выполнен.
+        """
+        try:
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, 0)", (queries.SCHEMA_LOCK,))
+                if not self._has_legacy_tables(cursor):
+                    conn.rollback()
+                    cursor.close()
+                    logger.info("No legacy evaluate_results/feedback tables, nothing to migrate")
+                    return False
+                cursor.execute("""
+                    DROP INDEX IF EXISTS idx_evaluate_task, idx_evaluate_at, idx_evaluate_at_id, idx_feedback_task, idx_feedback_at;
+                    ALTER TABLE feedback RENAME TO feedback_legacy;
+                    ALTER TABLE evaluate_results RENAME TO evaluate_results_legacy;
+                """)
+                self._create_tables(cursor)
+                self._ensure_partition_function(cursor)
+                self._migrate_legacy(cursor)
+                self._create_partitions(cursor, self.months_ahead)
+                self._ensure_counters(cursor)
+                self._recount(cursor, overwrite=True)
+
+                conn.commit()
+                cursor.close()
+                return True
+        except Exception as e:
+            logger.error(f"Legacy tables migration failed: {e}")
+            raise
+
+    @staticmethod
+    def _has_legacy_tables(cursor) -> bool:
+        """evaluate_results - обычная (не секционированная) таблица прежней схемы"""
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('evaluate_results')")
+        row = cursor.fetchone()
+        return row is not None and row[0] == "r"
+
+    @staticmethod
+    def _create_tables(cursor):
+        """Секционированные evaluate_results/feedback, shadow_predictions и каскадный триггер"""
+        # Таблица результатов evaluate. UNIQUE (task_id) на секционированной таблице невозможен:
+        # уникальность держат upsert-запросы queries.py под advisory-блокировками
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS evaluate_results (
+                id SERIAL,
+                task_id VARCHAR(255) NOT NULL,
+                input_volume FLOAT,
+                input_dependencies FLOAT,
+                input_expertise FLOAT,
+                input_uncertainty FLOAT,
+                task_type VARCHAR(50),
+                predicted_complexity FLOAT,
+                predicted_risk FLOAT,
+                evaluated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (id, evaluated_at)
+            ) PARTITION BY RANGE (evaluated_at);
+            CREATE TABLE IF NOT EXISTS evaluate_results_default PARTITION OF evaluate_results DEFAULT;
+            CREATE INDEX IF NOT EXISTS idx_evaluate_task ON evaluate_results(task_id);
+            -- ключ keyset-пагинации истории (queries.evaluate_history_query)
+            DROP INDEX IF EXISTS idx_evaluate_at;
+            CREATE INDEX IF NOT EXISTS idx_evaluate_at_id ON evaluate_results(evaluated_at, id);
+        """)
+
+        # Предсказания конфигов-кандидатов (теневая оценка): по строке на задачу и версию кандидата
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS shadow_predictions (
+                task_id VARCHAR(255) NOT NULL,
+                agent VARCHAR(50) NOT NULL,
+                version VARCHAR(32) NOT NULL,
+                predicted FLOAT,
+                evaluated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (agent, version, task_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_shadow_task ON shadow_predictions(task_id);
+        """)
+
+        # FK на секционированную evaluate_results невозможен: каскадное удаление - триггером
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS feedback (
+                id SERIAL,
+                evaluate_id INTEGER,
+                task_id VARCHAR(255) NOT NULL,
+                actual_effort_hours FLOAT,
+                actual_risk_score FLOAT,
+                user_rating VARCHAR(20),
+                feedback_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (id, feedback_at)
+            ) PARTITION BY RANGE (feedback_at);
+            CREATE TABLE IF NOT EXISTS feedback_default PARTITION OF feedback DEFAULT;
+            CREATE INDEX IF NOT EXISTS idx_feedback_task ON feedback(task_id);
+            CREATE INDEX IF NOT EXISTS idx_feedback_at ON feedback(feedback_at);
+
+            CREATE OR REPLACE FUNCTION evaluate_results_delete_feedback() RETURNS trigger AS $$
+            BEGIN
+                DELETE FROM feedback f USING old_rows o WHERE f.task_id = o.task_id;
+                DELETE FROM shadow_predictions s USING old_rows o WHERE s.task_id = o.task_id;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE TRIGGER trg_evaluate_results_cascade AFTER DELETE ON evaluate_results
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION evaluate_results_delete_feedback();
+        """)
+
+    @staticmethod
+    def _ensure_partition_function(cursor):
+        """
+        fuzzy_ensure_month_partition(parent, key, month) создаёт секцию parent_YYYY_MM.
+        Строки этого месяца, успевшие попасть в DEFAULT-секцию, переносятся в новую секцию
+        (иначе ATTACH невозможен). Операции идут по секциям напрямую, поэтому
+        statement-триггеры родительской таблицы (счётчики фидбэка) не срабатывают.
+        """
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION fuzzy_ensure_month_partition(parent TEXT, key TEXT, month DATE)
+            RETURNS TEXT AS $$
+            DECLARE
+                lower_bound DATE := date_trunc('month', month)::date;
+                upper_bound DATE := (date_trunc('month', month) + INTERVAL '1 month')::date;
+                part TEXT := parent || '_' || to_char(lower_bound, 'YYYY_MM');
+            BEGIN
+                IF to_regclass(part) IS NOT NULL THEN
+                    RETURN part;
+                END IF;
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', part, parent);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                    parent || '_default', key, lower_bound, key, upper_bound, part
+                );
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                               parent, part, lower_bound, upper_bound);
+                RETURN part;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+    @staticmethod
+    def _create_partitions(cursor, months_ahead: int):
+        """Секции текущего месяца и months_ahead следующих для обеих таблиц"""
+        cursor.execute("""
+            SELECT fuzzy_ensure_month_partition(t.parent, t.key, m::date)
+            FROM (VALUES ('evaluate_results', 'evaluated_at'), ('feedback', 'feedback_at')) AS t(parent, key)
+            CROSS JOIN generate_series(
+                date_trunc('month', LOCALTIMESTAMP),
+                date_trunc('month', LOCALTIMESTAMP) + make_interval(months => %s),
+                INTERVAL '1 month'
+            ) AS m
+        """, (months_ahead,))
+
+    @staticmethod
+    def _migrate_legacy(cursor):
+        """Копирование данных из *_legacy в секционированные таблицы (см. migrate_legacy_tables)"""
+        value_columns = ", ".join(queries.EVALUATE_ROW_COLUMNS[:-1])
+        cursor.execute(f"""
+            SELECT fuzzy_ensure_month_partition('evaluate_results', 'evaluated_at', m::date)
+            FROM (SELECT DISTINCT date_trunc('month', evaluated_at) AS m FROM evaluate_results_legacy
+                  WHERE evaluated_at IS NOT NULL) s;
+            SELECT fuzzy_ensure_month_partition('feedback', 'feedback_at', m::date)
+            FROM (SELECT DISTINCT date_trunc('month', feedback_at) AS m FROM feedback_legacy
+                  WHERE feedback_at IS NOT NULL) s;
+
+            INSERT INTO evaluate_results (id, {value_columns}, evaluated_at)
+            SELECT id, {value_columns}, COALESCE(evaluated_at, NOW()) FROM evaluate_results_legacy;
+            INSERT INTO feedback (id, evaluate_id, task_id, actual_effort_hours, actual_risk_score, user_rating, feedback_at)
+            SELECT id, evaluate_id, task_id, actual_effort_hours, actual_risk_score, user_rating, COALESCE(feedback_at, NOW())
+            FROM feedback_legacy;
+
+            SELECT setval(pg_get_serial_sequence('evaluate_results', 'id'), COALESCE(MAX(id), 0) + 1, false)
+            FROM evaluate_results;
+            SELECT setval(pg_get_serial_sequence('feedback', 'id'), COALESCE(MAX(id), 0) + 1, false)
+            FROM feedback;
+
+            DROP TABLE feedback_legacy;
+            DROP TABLE evaluate_results_legacy;
+        """)
+        logger.info("Legacy evaluate_results/feedback migrated to monthly partitions")
+
+    def ensure_partitions(self, months_ahead: Optional[int] = None) -> None:
+        """Создаёт недостающие месячные секции на months_ahead месяцев вперёд (для периодического обслуживания)"""
+        try:
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, 0)", (queries.SCHEMA_LOCK,))
+                self._create_partitions(cursor, self.months_ahead if months_ahead is None else months_ahead)
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Ensure partitions failed: {e}")
+            raise
+
+    def archive_partitions(self, retention_months: int, archive_dir: str) -> List[str]:
+        """
+        Секции evaluate_results/feedback за месяцы раньше, чем retention_months месяцев до текущего,
+        выгружаются в {archive_dir}/{секция}.csv.gz и удаляются из БД. Каждая секция - отдельная
+        транзакция: сначала файл, потом DETACH + DROP. Фидбэк по задачам из архивных секций
+        evaluate_results остаётся, но перестаёт попадать в джойны. Возвращает имена архивированных секций.
+        """
+        os.makedirs(archive_dir, exist_ok=True)
+        archived = []
+        try:
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT c.relname, p.relname
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    JOIN pg_class p ON p.oid = i.inhparent
+                    WHERE p.relname IN ('evaluate_results', 'feedback')
+                      AND c.relname ~ '_[0-9]{4}_[0-9]{2}$'
+                      AND to_date(right(c.relname, 7), 'YYYY_MM')
+                          < date_trunc('month', LOCALTIMESTAMP) - make_interval(months => %s)
+                    ORDER BY c.relname
+                """, (retention_months,))
+                expired = cursor.fetchall()
+                conn.rollback()
+
+                for part, parent in expired:
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s, 0)", (queries.SCHEMA_LOCK,))
+                    cursor.execute("SELECT to_regclass(%s)", (part,))
+                    if cursor.fetchone()[0] is None:
+                        conn.rollback()
+                        continue
+                    path = os.path.join(archive_dir, f"{part}.csv.gz")
+                    with gzip.open(f"{path}.tmp", "wb") as f:
+                        cursor.copy_expert(
+                            sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(part)), f
+                        )
+                    os.replace(f"{path}.tmp", path)
+                    cursor.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                        sql.Identifier(parent), sql.Identifier(part)))
+                    cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(part)))
+                    conn.commit()
+                    archived.append(part)
+                    logger.info(f"Partition {part} archived to {path}")
+
+                # секции удаляются мимо триггеров - счётчики фидбэка пересчитываются
+                if any(name.startswith("feedback_") for name in archived):
+                    self._recount(cursor, overwrite=True)
+                    conn.commit()
+                cursor.close()
+                return archived
+        except Exception as e:
+            logger.error(f"Archive partitions failed: {e}")
+            raise
+
+    def _ensure_counters(self, cursor):
+        """
+        Таблица feedback_counters и statement-триггеры на feedback: счётчики сдвигаются
+        одним UPDATE на запрос (по transition tables), а не COUNT(*) на каждое чтение.
+        Начальные значения считаются один раз, под блокировкой feedback от записи.
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS feedback_counters (
+                name VARCHAR(20) PRIMARY KEY,
+                total BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT NOW()
+            );
+
+            CREATE OR REPLACE FUNCTION feedback_counters_apply() RETURNS trigger AS $$
+            DECLARE
+                new_effort BIGINT := 0; new_risk BIGINT := 0; new_total BIGINT := 0;
+                old_effort BIGINT := 0; old_risk BIGINT := 0; old_total BIGINT := 0;
+            BEGIN
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    SELECT COUNT(*) FILTER (WHERE actual_effort_hours IS NOT NULL),
+                           COUNT(*) FILTER (WHERE actual_risk_score IS NOT NULL),
+                           COUNT(*) FILTER (WHERE actual_effort_hours IS NOT NULL OR actual_risk_score IS NOT NULL)
+                    INTO new_effort, new_risk, new_total FROM new_rows;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    SELECT COUNT(*) FILTER (WHERE actual_effort_hours IS NOT NULL),
+                           COUNT(*) FILTER (WHERE actual_risk_score IS NOT NULL),
+                           COUNT(*) FILTER (WHERE actual_effort_hours IS NOT NULL OR actual_risk_score IS NOT NULL)
+                    INTO old_effort, old_risk, old_total FROM old_rows;
+                END IF;
+                UPDATE feedback_counters c SET total = c.total + d.delta, updated_at = NOW()
+                FROM (VALUES ('effort', new_effort - old_effort),
+                             ('risk', new_risk - old_risk),
+                             ('total', new_total - old_total)) AS d(name, delta)
+                WHERE c.name = d.name AND d.delta <> 0;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION feedback_counters_reset() RETURNS trigger AS $$
+            BEGIN
+                UPDATE feedback_counters SET total = 0, updated_at = NOW();
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE TRIGGER trg_feedback_counters_insert AFTER INSERT ON feedback
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION feedback_counters_apply();
+            CREATE OR REPLACE TRIGGER trg_feedback_counters_update AFTER UPDATE ON feedback
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION feedback_counters_apply();
+            CREATE OR REPLACE TRIGGER trg_feedback_counters_delete AFTER DELETE ON feedback
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION feedback_counters_apply();
+            CREATE OR REPLACE TRIGGER trg_feedback_counters_truncate AFTER TRUNCATE ON feedback
+                FOR EACH STATEMENT EXECUTE FUNCTION feedback_counters_reset();
+        """)
+        cursor.execute("SELECT COUNT(*) FROM feedback_counters")
+        if cursor.fetchone()[0] < 3:
+            self._recount(cursor, overwrite=False)
+
+    @staticmethod
+    def _recount(cursor, overwrite: bool):
+        cursor.execute("LOCK TABLE feedback IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(queries.RECOUNT_FEEDBACK)
+        effort, risk, total = cursor.fetchone()
+        conflict = "DO UPDATE SET total = EXCLUDED.total, updated_at = NOW()" if overwrite else "DO NOTHING"
+        cursor.execute(f"""
+            INSERT INTO feedback_counters (name, total)
+            VALUES ('effort', %s), ('risk', %s), ('total', %s)
+            ON CONFLICT (name) {conflict}
+        """, (effort, risk, total))
+
+    def reconcile_counters(self) -> Dict[str, int]:
+        """Пересчитывает feedback_counters по таблице feedback (COUNT(*), для обслуживания)"""
+        try:
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                self._recount(cursor, overwrite=True)
+                conn.commit()
+                cursor.execute(queries.FEEDBACK_COUNTERS)
+                counts = queries.counters_to_dict(cursor.fetchall())
+                cursor.close()
+                logger.info(f"Feedback counters reconciled: {counts}")
+                return counts
+        except Exception as e:
+            logger.error(f"Reconcile feedback counters failed: {e}")
+            raise
 
     def save_evaluate_result(self, task_id: str, inputs: Dict, predictions: Dict, task_type: str = None) -> int:
         """Сохраняет результат /evaluate, возвращает ID записи"""
         try:
-            conn = self.connection.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO evaluate_results (
-                    task_id, input_volume, input_dependencies, input_expertise, input_uncertainty,
-                    task_type, predicted_complexity, predicted_risk
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (task_id) DO UPDATE SET
-                    input_volume = EXCLUDED.input_volume,
-                    input_dependencies = EXCLUDED.input_dependencies,
-                    input_expertise = EXCLUDED.input_expertise,
-                    input_uncertainty = EXCLUDED.input_uncertainty,
-                    task_type = EXCLUDED.task_type,
-                    predicted_complexity = EXCLUDED.predicted_complexity,
-                    predicted_risk = EXCLUDED.predicted_risk,
-                    evaluated_at = EXCLUDED.evaluated_at
-                RETURNING id
-            """, (
-                task_id, inputs["volume"], inputs["dependencies"], 
-                inputs["expertise"], inputs["uncertainty"],
-                task_type, predictions["complexity_score"], predictions["risk_score"]
-            ))
-            result = cursor.fetchone()
-            evaluate_id = result[0] if result else None
-            conn.commit()
-            cursor.close()
-            return evaluate_id
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(queries.LOCK_TASKS, (queries.EVALUATE_LOCK, [task_id]))
+                cursor.execute(queries.UPSERT_EVALUATE_RESULT, queries.evaluate_params(task_id, inputs, predictions, task_type))
+                result = cursor.fetchone()
+                evaluate_id = result[0] if result else None
+                conn.commit()
+                cursor.close()
+                return evaluate_id
         except Exception as e:
             logger.error(f"Save evaluate result failed: {e}")
             raise
-        finally:
-            if conn: conn.close()
 
     def save_feedback(self, task_id: str, actual_data: Dict) -> bool:
-        """Сохраняет фидбэк, связывая с существующей записью evaluate_results"""
+        """Сохраняет фидбэк, связывая с существующей записью evaluate_results (False - задачи нет)"""
         try:
-            conn = self.connection.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO feedback (
-                    task_id, actual_effort_hours, actual_risk_score, user_rating
-                ) VALUES (%s, %s, %s, %s)
-                ON CONFLICT (task_id) DO UPDATE SET
-                    actual_effort_hours = COALESCE(EXCLUDED.actual_effort_hours, feedback.actual_effort_hours),
-                    actual_risk_score = COALESCE(EXCLUDED.actual_risk_score, feedback.actual_risk_score),
-                    user_rating = COALESCE(EXCLUDED.user_rating, feedback.user_rating),
-                    feedback_at = EXCLUDED.feedback_at
-            """, (
-                task_id,
-                actual_data.get("actual_effort_hours"),
-                actual_data.get("actual_risk_score"),
-                actual_data.get("user_rating")
-            ))
-            conn.commit()
-            cursor.close()
-            return True
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(queries.LOCK_TASKS, (queries.FEEDBACK_LOCK, [task_id]))
+                cursor.execute(queries.UPSERT_FEEDBACK_WITH_PREDICTIONS, queries.feedback_params(task_id, actual_data))
+                saved = cursor.fetchone() is not None
+                conn.commit()
+                cursor.close()
+                return saved
         except Exception as e:
             logger.error(f"Save feedback failed: {e}")
             raise
-        finally:
-            if conn: conn.close()
 
     def get_count(self) -> int:
         """Количество записей с фидбэком (есть actual_*)"""
-        try:
-            conn = self.connection.get_connection()
+        return self.get_counts()["total"]
+
+    def get_counts(self) -> Dict[str, int]:
+        """Счётчики фидбэка: {"effort", "risk", "total"} (поддерживаются триггерами, без COUNT(*))"""
+        with self.connection.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM feedback 
-                WHERE actual_effort_hours IS NOT NULL OR actual_risk_score IS NOT NULL
-            """)
-            count = cursor.fetchone()[0]
+            cursor.execute(queries.FEEDBACK_COUNTERS)
+            counts = queries.counters_to_dict(cursor.fetchall())
             cursor.close()
-            return count
-        finally:
-            if conn: conn.close()
+            return counts
 
-    def get_training_data(self, agent_name: str, limit: int = 200) -> List[Dict]:
+    def get_training_data(self, agent_name: str, limit: int = 200, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None) -> List[Dict]:
         """Возвращает данные для обучения: джойн evaluate_results + feedback"""
-        target_col = "actual_effort_hours" if agent_name == "effort" else "actual_risk_score"
-        pred_col = "predicted_complexity" if agent_name == "effort" else "predicted_risk"
-        
-        try:
-            conn = self.connection.get_connection()
+        sql, params = queries.training_data_query(agent_name, since, until)
+        with self.connection.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(f"""
-                SELECT 
-                    e.input_volume, e.input_dependencies, e.input_expertise, e.input_uncertainty,
-                    e.{pred_col}, f.{target_col}
-                FROM evaluate_results e
-                INNER JOIN feedback f ON e.task_id = f.task_id
-                WHERE f.{target_col} IS NOT NULL
-                ORDER BY f.feedback_at DESC LIMIT %s
-            """, (limit,))
+            cursor.execute(sql, params + (limit,))
             rows = cursor.fetchall()
             cursor.close()
-            
-            data = []
-            for r in rows:
-                raw_target = r[5]
-                if raw_target is None:
-                    continue
-                target = min(max(raw_target, 0.0), 100.0)
-                
-                data.append({
-                    "inputs": {
-                        "volume": r[0], "dependencies": r[1],
-                        "expertise": r[2], "uncertainty": r[3]
-                    },
-                    "predicted": r[4],
-                    "target": target
-                })
-            return data
-        finally:
-            if conn: conn.close()
-
-    def get_evaluate_history(self, task_id: Optional[str] = None, limit: int = 100) -> List[Dict]:
-        """Получение истории оценок для аналитики"""
+            return queries.rows_to_training_data(rows)
+
+    def get_training_batch(self, agent_name: str, limit: int = 200, since: Optional[datetime] = None,
+                           until: Optional[datetime] = None) -> FeedbackBatch:
+        """Последние limit записей для обучения в колоночном виде (от старых к новым)"""
+        sql, params = queries.training_data_query(agent_name, since, until)
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params + (limit,))
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows_to_batch(rows)
+
+    def iter_training_export(self, agent_name: str, since: Optional[datetime] = None,
+                             until: Optional[datetime] = None, task_types: Optional[List[str]] = None,
+                             batch_size: int = 10000) -> Iterator[List[tuple]]:
+        """Потоковая выгрузка обучающих данных (queries.training_export_query) пачками по batch_size строк"""
+        sql, params = queries.training_export_query(agent_name, since, until, task_types)
+        yield from self._stream(f"training_export_{agent_name}", sql, params, batch_size)
+
+    def iter_evaluate_inputs(self, batch_size: int = 50000) -> Iterator[List[tuple]]:
+        """(task_id, входы INPUT_FIELDS) всех оценок пачками - для индекса похожих задач"""
+        yield from self._stream("evaluate_inputs", queries.EVALUATE_INPUTS, (), batch_size)
+
+    def _stream(self, name: str, sql: str, params: tuple, batch_size: int) -> Iterator[List[tuple]]:
+        """
+        Серверный (именованный) курсор в транзакции REPEATABLE READ READ ONLY: в памяти
+        клиента одновременно не больше одной пачки, а вся выгрузка видит один снимок БД.
+        Соединение из пула занято, пока генератор не исчерпан или не закрыт.
+        """
+        with self.connection.connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+                with conn.cursor(name=name) as cursor:
+                    cursor.itersize = batch_size
+                    cursor.execute(sql, params)
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield rows
+            except Exception as e:
+                logger.error(f"Streaming {name} failed: {e}")
+                raise
+            finally:
+                if not conn.closed:
+                    conn.rollback()
+
+    def get_accuracy_totals(self, agent_name: str, since: Optional[datetime] = None,
+                            until: Optional[datetime] = None) -> Dict[str, float]:
+        """Суммы ошибок агента по фидбэку за период (для metrics.StreamingMetrics)"""
+        sql, params = queries.accuracy_totals_query(agent_name, since, until)
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            totals = dict(zip(queries.ACCURACY_TOTALS_COLUMNS, cursor.fetchone()))
+            cursor.close()
+            return totals
+
+    def get_shadow_accuracy(self, agent_name: str) -> Dict[str, Dict[str, float]]:
+        """Суммы ошибок кандидатов и live-конфига по версиям кандидатов (queries.shadow_accuracy_query)"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(queries.shadow_accuracy_query(agent_name), (agent_name,))
+            rows = cursor.fetchall()
+            cursor.close()
+        return {row[0]: dict(zip(queries.SHADOW_ACCURACY_COLUMNS[1:], row[1:])) for row in rows}
+
+    def delete_shadow_predictions(self, agent_name: str, version: str) -> int:
+        """Удаляет предсказания снятого (или выкаченного) кандидата"""
         try:
-            conn = self.connection.get_connection()
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(queries.DELETE_SHADOW_PREDICTIONS, (agent_name, version))
+                deleted = cursor.rowcount
+                conn.commit()
+                cursor.close()
+                return deleted
+        except Exception as e:
+            logger.error(f"Delete shadow predictions failed: {e}")
+            raise
+
+    def get_evaluate_history(self, task_id: Optional[str] = None, limit: int = 100,
+                             since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict]:
+        """
+        Получение истории оценок для аналитики.
+        since/until ограничивают evaluated_at: читаются только месячные секции этого периода
+        """
+        conditions = []
+        params = []
+        if task_id:
+            conditions.append("e.task_id = %s")
+            params.append(task_id)
+        if since is not None:
+            conditions.append("e.evaluated_at >= %s")
+            params.append(since)
+        if until is not None:
+            conditions.append("e.evaluated_at < %s")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.connection.connection() as conn:
             cursor = conn.cursor()
-            
-            if task_id:
-                cursor.execute("""
-                    SELECT e.*, f.actual_effort_hours, f.actual_risk_score, f.user_rating, f.feedback_at
-                    FROM evaluate_results e
-                    LEFT JOIN feedback f ON e.task_id = f.task_id
-                    WHERE e.task_id = %s
-                """, (task_id,))
-            else:
-                cursor.execute("""
-                    SELECT e.*, f.actual_effort_hours, f.actual_risk_score, f.user_rating, f.feedback_at
-                    FROM evaluate_results e
-                    LEFT JOIN feedback f ON e.task_id = f.task_id
-                    ORDER BY e.evaluated_at DESC LIMIT %s
-                """, (limit,))
+            cursor.execute(f"""
+                SELECT e.*, f.actual_effort_hours, f.actual_risk_score, f.user_rating, f.feedback_at
+                FROM evaluate_results e
+                LEFT JOIN feedback f ON e.task_id = f.task_id
+                {where}
+                ORDER BY e.evaluated_at DESC LIMIT %s
+            """, (*params, limit))
             
             columns = [desc[0] for desc in cursor.description]
             results = [dict(zip(columns, row)) for row in cursor.fetchall()]
             cursor.close()
             return results
-        finally:
-            if conn: conn.close()
 
     def get_evaluate_by_task_id(self, task_id: str) -> Optional[Dict]:
         """Получает полную информацию по задаче: предсказания + фидбэк (если есть)"""
         try:
-            conn = self.connection.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT 
-                    e.id, e.task_id,
-                    e.input_volume, e.input_dependencies, e.input_expertise, e.input_uncertainty,
-                    e.task_type,
-                    e.predicted_complexity, e.predicted_risk,
-                    e.evaluated_at,
-                    f.actual_effort_hours, f.actual_risk_score, f.user_rating, f.feedback_at
-                FROM evaluate_results e
-                LEFT JOIN feedback f ON e.task_id = f.task_id
-                WHERE e.task_id = %s
-                ORDER BY e.evaluated_at DESC
-                LIMIT 1
-            """, (task_id,))
-            
-            row = cursor.fetchone()
-            cursor.close()
-            
-            if not row:
-                return None
-                
-            # Маппинг колонок в словарь
-            columns = [
-                "id", "task_id", "input_volume", "input_dependencies", 
-                "input_expertise", "input_uncertainty", "task_type",
-                "predicted_complexity", "predicted_risk", "evaluated_at",
-                "actual_effort_hours", "actual_risk_score", "user_rating", "feedback_at"
-            ]
-            result = dict(zip(columns, row))
-            
-            # Форматируем ответ для UI
-            return {
-                "task_id": result["task_id"],
-                "inputs": {
-                    "volume": result["input_volume"],
-                    "dependencies": result["input_dependencies"],
-                    "expertise": result["input_expertise"],
-                    "uncertainty": result["input_uncertainty"]
-                },
-                "task_type": result["task_type"],
-                "predictions": {
-                    "complexity_score": round(result["predicted_complexity"], 2) if result["predicted_complexity"] else None,
-                    "risk_score": round(result["predicted_risk"], 2) if result["predicted_risk"] else None,
-                    "risk_category": self._calculate_risk_category(result["predicted_risk"])
-                },
-                "feedback": {
-                    "actual_effort_hours": result["actual_effort_hours"],
-                    "actual_risk_score": result["actual_risk_score"],
-                    "user_rating": result["user_rating"],
-                    "feedback_at": result["feedback_at"].isoformat() if result["feedback_at"] else None
-                } if result["actual_effort_hours"] or result["actual_risk_score"] else None,
-                "evaluated_at": result["evaluated_at"].isoformat() if result["evaluated_at"] else None
-            }
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(queries.EVALUATE_BY_TASK_ID, (task_id,))
+                row = cursor.fetchone()
+                cursor.close()
+                return queries.format_evaluate_row(row) if row else None
         except Exception as e:
             logger.error(f"Get evaluate by task_id failed: {e}")
             raise
-        finally:
-            if conn: conn.close()
 
     @staticmethod
     def _calculate_risk_category(risk_score: Optional[float]) -> str:
         """Вспомогательный метод для категоризации риска"""
-        if risk_score is None:
-            return "Unknown"
-        if risk_score < 35:
-            return "Low"
-        elif risk_score < 60:
-            return "Medium"
-        elif risk_score < 80:
-            return "High"
-        else:
-            return "Critical"
+        return queries.calculate_risk_category(risk_score)
     
-    def generate_synthetic_feedback(self, task_ids: Optional[List[str]] = None, inflation_range: tuple = (1.2, 1.3)) -> Dict[str, int]:
+    def generate_synthetic_feedback(self, task_ids: Optional[List[str]] = None, inflation_range: tuple = (1.2, 1.3),
+                                    seed: Optional[int] = None, dry_run: bool = False) -> Dict[str, int]:
         """
         Генерирует синтетические actual_* значения для задач без фидбэка.
         Значения завышаются относительно предсказанных на случайный множитель из inflation_range.
+        Вся генерация - один INSERT ... SELECT на стороне БД (queries.synthetic_feedback_query).
         
         Args:
             task_ids: список task_id для обработки (None = все задачи без фидбэка)
             inflation_range: кортеж (min_multiplier, max_multiplier) для случайного завышения
+            seed: зерно для воспроизводимых значений (None = случайные)
+            dry_run: только подсчёт, без записи в БД
         
         Returns:
-            Dict со статистикой: сколько записей обработано/пропущено/ошибок
+            Dict со статистикой: сколько записей обработано (при dry_run - было бы)/пропущено/ошибок
         """
-        import random
-        from decimal import Decimal, ROUND_HALF_UP
-        
-        stats = {"processed": 0, "skipped": 0, "errors": 0}
-        
+        inflation_min, inflation_max = inflation_range
+        if inflation_min > inflation_max:
+            raise ValueError(f"inflation_min ({inflation_min}) must not exceed inflation_max ({inflation_max})")
+        sql, params = queries.synthetic_feedback_query(task_ids, inflation_min, inflation_max, seed, dry_run)
         try:
-            conn = self.connection.get_connection()
-            cursor = conn.cursor()
-            
-            # Выбираем задачи из evaluate_results, для которых ещё нет записей в feedback
-            if task_ids:
-                placeholders = ','.join(['%s'] * len(task_ids))
-                cursor.execute(f"""
-                    SELECT e.task_id, e.predicted_complexity, e.predicted_risk 
-                    FROM evaluate_results e
-                    LEFT JOIN feedback f ON e.task_id = f.task_id
-                    WHERE e.task_id IN ({placeholders}) AND f.task_id IS NULL
-                """, task_ids)
-            else:
-                cursor.execute("""
-                    SELECT e.task_id, e.predicted_complexity, e.predicted_risk 
-                    FROM evaluate_results e
-                    LEFT JOIN feedback f ON e.task_id = f.task_id
-                    WHERE f.task_id IS NULL
-                """)
-            
-            rows = cursor.fetchall()
-            
-            for task_id, pred_complexity, pred_risk in rows:
-                try:
-                    # Пропускаем, если предсказания отсутствуют
-                    if pred_complexity is None or pred_risk is None:
-                        stats["skipped"] += 1
-                        continue
-                    
-                    # Генерируем случайный множитель завышения в заданном диапазоне
-                    inflation_factor = random.uniform(*inflation_range)
-                    
-                    # Рассчитываем завышенные значения с округлением до 2 знаков
-                    actual_effort = float(Decimal(str(pred_complexity * inflation_factor)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
-                    actual_risk = float(Decimal(str(pred_risk * inflation_factor)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
-                    
-                    # Ограничиваем значения диапазоном [0, 100]
-                    actual_effort = min(max(actual_effort, 0.0), 100.0)
-                    actual_risk = min(max(actual_risk, 0.0), 100.0)
-                    
-                    # Вставляем запись в feedback
-                    cursor.execute("""
-                        INSERT INTO feedback (
-                            task_id, actual_effort_hours, actual_risk_score, user_rating, feedback_at
-                        ) VALUES (%s, %s, %s, %s, NOW())
-                        ON CONFLICT (task_id) DO UPDATE SET
-                            actual_effort_hours = EXCLUDED.actual_effort_hours,
-                            actual_risk_score = EXCLUDED.actual_risk_score,
-                            feedback_at = EXCLUDED.feedback_at
-                    """, (task_id, actual_effort, actual_risk, "synthetic"))
-                    
-                    stats["processed"] += 1
-                    
-                except Exception as e:
-                    logger.error(f"Failed to generate feedback for {task_id}: {e}")
-                    stats["errors"] += 1
-                    continue
-            
-            conn.commit()
-            cursor.close()
-            logger.info(f"Synthetic feedback generated: {stats}")
-            return stats
-            
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                if not dry_run:
+                    # глобального UNIQUE (task_id) нет: не даём /feedback вставить ту же задачу параллельно
+                    # (те же полосы FEEDBACK_LOCK, что и у upsert; без списка задач - все полосы)
+                    if task_ids is None:
+                        cursor.execute(queries.LOCK_ALL_TASKS, (queries.FEEDBACK_LOCK,))
+                    else:
+                        cursor.execute(queries.LOCK_TASKS, (queries.FEEDBACK_LOCK, list(task_ids)))
+                cursor.execute(sql, params)
+                processed, skipped = cursor.fetchone()
+                if dry_run:
+                    conn.rollback()
+                else:
+                    conn.commit()
+                cursor.close()
+                stats = {"processed": processed, "skipped": skipped, "errors": 0}
+                logger.info(f"Synthetic feedback {'dry run' if dry_run else 'generated'}: {stats}")
+                return stats
         except Exception as e:
             logger.error(f"Generate synthetic feedback failed: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
\ No newline at end of file
@@ -0,0 +1,277 @@
+import hashlib
+import json
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Any
+
+INPUT_FIELDS = ("volume", "dependencies", "expertise", "uncertainty")
+# Способы свёртки выходов правил в TSK-режиме: взвешенное среднее и взвешенная сумма
+TSK_METHODS = ("wtaver", "wtsum")
+
+_CHUNK_ELEMENTS = 2_000_000
+
+
+def config_version(config: Dict) -> str:
+    """Стабильный идентификатор версии конфига (хэш канонического JSON)"""
+    payload = json.dumps(config, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class CompiledEngine:
+    """
+    Скомпилированная Mamdani- или TSK-система в виде плоских numpy-массивов.
+
+    Mamdani повторяет семантику skfuzzy.control (fmin/fmax, clip-импликация, апсемплинг
+    универсума выхода в точках среза), но считает сразу пачку входов.
+    TSK (Такаги-Сугено) вместо термов выхода хранит коэффициенты [свободный член, коэффициенты
+    входов] для каждого терма: выход - среднее выходов правил, взвешенное степенями срабатывания.
+    Массивы только читаются, поэтому могут лежать в общей памяти.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.arrays = arrays
+        self.meta = meta
+        self.version: str = meta["version"]
+        self.input_names: List[str] = list(meta["inputs"])
+        self.output_name: str = meta["output"]["name"]
+        self.defuzzify_method: str = meta["output"]["defuzzify_method"]
+        self.inference: str = meta.get("inference", "mamdani")
+        self.rules: List[list] = meta["rules"]
+        self.rule_consequents = np.asarray(meta["rule_consequents"], dtype=np.int64)
+
+        self._universes = [arrays[f"universe:{name}"] for name in self.input_names]
+        self._mfs = [arrays[f"mf:{name}"] for name in self.input_names]
+        if self.inference == "tsk":
+            self._tsk = arrays["tsk:__out__"]
+            return
+        self._out_universe = arrays["universe:__out__"]
+        self._out_mf = arrays["mf:__out__"]
+        self._cons_rules = [
+            np.nonzero(self.rule_consequents == c)[0]
+            for c in range(self._out_mf.shape[0])
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(a.nbytes for a in self.arrays.values()))
+
+    def evaluate(self, inputs: Dict[str, float]) -> float:
+        row = np.array([[inputs[name] for name in self.input_names]], dtype=np.float64)
+        return float(self.evaluate_batch(row)[0])
+
+    def evaluate_batch(self, X: np.ndarray, columns: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        Считает выход для матрицы входов (N, n_inputs).
+        columns задаёт порядок колонок X (по умолчанию self.input_names).
+        Если ни одно правило не сработало для centroid/bisector или TSK, возвращается NaN.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        if columns is not None:
+            order = [list(columns).index(name) for name in self.input_names]
+            X = X[:, order]
+        n = X.shape[0]
+        out = np.empty(n, dtype=np.float64)
+        if self.inference == "tsk":
+            chunk = max(1, _CHUNK_ELEMENTS // max(1, len(self.rules) + self._tsk.shape[0]))
+            for start in range(0, n, chunk):
+                stop = min(start + chunk, n)
+                out[start:stop] = self._tsk_output(X[start:stop])
+            return out
+        seg = self._out_universe.shape[0] - 1
+        n_terms = self._out_mf.shape[0]
+        chunk = max(1, _CHUNK_ELEMENTS // max(1, (seg + 1) * n_terms * 2))
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            cuts = self._activations(X[start:stop])
+            out[start:stop] = self._defuzzify(cuts)
+        return out
+
+    def rule_strengths(self, X: np.ndarray) -> np.ndarray:
+        """Степени срабатывания правил (N, n_rules) для матрицы входов"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        return self._strengths(self._memberships(X))
+
+    def _memberships(self, X: np.ndarray) -> np.ndarray:
+        degrees = []
+        for col, (universe, mf) in enumerate(zip(self._universes, self._mfs)):
+            x = np.clip(X[:, col], universe[0], universe[-1])
+            for term in mf:
+                degrees.append(np.interp(x, universe, term))
+        return np.column_stack(degrees)
+
+    def _strengths(self, M: np.ndarray) -> np.ndarray:
+        if not self.rules:
+            return np.zeros((M.shape[0], 0))
+        return np.column_stack([_eval_program(prog, M) for prog in self.rules])
+
+    def _activations(self, X: np.ndarray) -> np.ndarray:
+        strengths = self._strengths(self._memberships(X))
+        cuts = np.zeros((X.shape[0], self._out_mf.shape[0]))
+        for c, idx in enumerate(self._cons_rules):
+            if idx.size:
+                cuts[:, c] = strengths[:, idx].max(axis=1)
+        return cuts
+
+    def _tsk_output(self, X: np.ndarray) -> np.ndarray:
+        # Линейные выходы считаются по входам, обрезанным до универсумов, - как и принадлежности
+        clipped = np.column_stack([np.clip(X[:, col], u[0], u[-1]) for col, u in enumerate(self._universes)])
+        strengths = self._strengths(self._memberships(X))
+        z = (self._tsk[:, 0] + clipped @ self._tsk[:, 1:].T)[:, self.rule_consequents]
+        total = strengths.sum(axis=1)
+        weighted = (strengths * z).sum(axis=1)
+        if self.defuzzify_method.lower() == "wtsum":
+            result = weighted
+        else:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                result = weighted / total
+        result[total == 0] = np.nan
+        return result
+
+    def _defuzzify(self, cuts: np.ndarray) -> np.ndarray:
+        x, y, valid = self._aggregate(cuts)
+        method = self.defuzzify_method.lower()
+        if "centroid" in method or "bisector" in method:
+            x, y = _compact(x, y, valid)
+            x1, x2 = x[:, :-1], x[:, 1:]
+            y1, y2 = y[:, :-1], y[:, 1:]
+            dx = x2 - x1
+            empty_seg = ((y1 == 0) & (y2 == 0)) | (dx == 0)
+            area = np.where(empty_seg, 0.0, 0.5 * dx * (y1 + y2))
+            total = area.sum(axis=1)
+            empty = ~(np.where(valid, y, 0.0).sum(axis=1) > 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if "centroid" in method:
+                    moment = np.where(empty_seg, 0.0, 0.5 * dx * (y1 + y2) * x1 + dx * dx * (y1 + 2 * y2) / 6.0)
+                    result = moment.sum(axis=1) / np.fmax(total, np.finfo(float).eps)
+                else:
+                    result = _bisector(x1, x2, y1, y2, area, empty_seg, total)
+            result[empty] = np.nan
+            return result
+        y_masked = np.where(valid, y, -np.inf)
+        at_max = valid & (y_masked == y_masked.max(axis=1, keepdims=True))
+        if "mom" in method:
+            return np.where(at_max, x, 0.0).sum(axis=1) / at_max.sum(axis=1)
+        if "som" in method:
+            return np.where(at_max, x, np.inf).min(axis=1)
+        if "lom" in method:
+            return np.where(at_max, x, -np.inf).max(axis=1)
+        raise ValueError(f"Unknown defuzzify method: {self.defuzzify_method}")
+
+    def _aggregate(self, cuts: np.ndarray):
+        """
+        Агрегированная функция принадлежности выхода на апсемплированном универсуме:
+        узлы сетки плюс точки, где каждый терм пересекает свой срез.
+        Порядок арифметики совпадает с skfuzzy, чтобы mom/som/lom давали те же точки максимума.
+        Пересечений мало (у trimf - не больше двух на терм), поэтому они считаются только там,
+        где есть, и вставляются между узлами: строка результата - G узлов + пересечения строки.
+        """
+        u = self._out_universe
+        mf = self._out_mf
+        n, grid = cuts.shape[0], u.shape[0]
+        u0, dx = u[:-1], np.diff(u)
+        m0, m1 = mf[:, :-1], mf[:, 1:]
+        node_y = np.minimum(mf[None, :, :], cuts[:, :, None]).max(axis=1)
+
+        c = cuts[:, :, None]
+        row, term, seg = np.nonzero(((m0 >= c) != (m1 >= c)) & (c > 0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xc = u0[seg] + (cuts[row, term] - m0[term, seg]) * dx[seg] / (m1[term, seg] - m0[term, seg])
+        keep = (xc > u0[seg]) & (xc < u[1:][seg])
+        row, seg, xc = row[keep], seg[keep], xc[keep]
+        order = np.lexsort((xc, seg, row))
+        row, seg, xc = row[order], seg[order], xc[order]
+        slope = (m1 - m0) / dx
+        mf_at = slope[:, seg].T * (xc - u0[seg])[:, None] + m0[:, seg].T
+        yc = np.minimum(mf_at, cuts[row]).max(axis=1)
+
+        # позиция в строке: узел j сдвигается на число пересечений строки левее него,
+        # пересечение встаёт после узла своего сегмента и предыдущих пересечений строки
+        per_row = np.bincount(row, minlength=n)
+        before = np.zeros((n, grid), dtype=np.int64)
+        np.add.at(before, (row, seg + 1), 1)
+        node_pos = np.arange(grid)[None, :] + np.cumsum(before, axis=1)
+        rank = np.arange(row.size) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+        cross_pos = seg + 1 + rank
+
+        width = grid + (int(per_row.max()) if n else 0)
+        x = np.full((n, width), np.nan)
+        y = np.zeros((n, width))
+        rows = np.repeat(np.arange(n), grid)
+        x[rows, node_pos.ravel()] = np.tile(u, n)
+        y[rows, node_pos.ravel()] = node_y.ravel()
+        x[row, cross_pos] = xc
+        y[row, cross_pos] = yc
+        valid = ~np.isnan(x)
+        dup = np.zeros_like(valid)
+        dup[:, 1:] = valid[:, 1:] & valid[:, :-1] & (x[:, 1:] == x[:, :-1])
+        return x, y, valid & ~dup
+
+    def to_payload(self) -> Dict[str, Any]:
+        """JSON-сериализуемое представление (для передачи по сети)"""
+        return {
+            "meta": self.meta,
+            "arrays": {name: {"shape": list(a.shape), "data": a.ravel().tolist()} for name, a in self.arrays.items()}
+        }
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "CompiledEngine":
+        arrays = {
+            name: np.asarray(spec["data"], dtype=np.float64).reshape(spec["shape"])
+            for name, spec in payload["arrays"].items()
+        }
+        return cls(arrays, payload["meta"])
+
+
+def _eval_program(prog: list, M: np.ndarray) -> np.ndarray:
+    op = prog[0]
+    if op == "term":
+        return M[:, prog[1]]
+    if op == "and":
+        return np.fmin(_eval_program(prog[1], M), _eval_program(prog[2], M))
+    if op == "or":
+        return np.fmax(_eval_program(prog[1], M), _eval_program(prog[2], M))
+    if op == "not":
+        return 1.0 - _eval_program(prog[1], M)
+    raise ValueError(f"Unknown rule operator: {op}")
+
+
+def _compact(x: np.ndarray, y: np.ndarray, valid: np.ndarray):
+    """Сдвигает валидные точки влево, хвост заполняет последней валидной точкой"""
+    order = np.argsort(~valid, axis=1, kind="stable")
+    x = np.take_along_axis(x, order, axis=1)
+    y = np.take_along_axis(y, order, axis=1)
+    count = valid.sum(axis=1)
+    cols = np.arange(x.shape[1])[None, :]
+    last = np.take_along_axis(x, (count - 1)[:, None], axis=1)
+    last_y = np.take_along_axis(y, (count - 1)[:, None], axis=1)
+    tail = cols >= count[:, None]
+    return np.where(tail, last, x), np.where(tail, last_y, y)
+
+
+def _bisector(x1, x2, y1, y2, area, empty_seg, total):
+    # Как в skfuzzy: накопленная площадь у пустых сегментов считается нулевой
+    accum = np.where(empty_seg, 0.0, np.cumsum(area, axis=1))
+    half = total / 2.0
+    index = np.argmax(accum >= half[:, None], axis=1)[:, None]
+    prev = np.take_along_axis(accum, np.maximum(index - 1, 0), axis=1)
+    sub = half[:, None] - np.where(index == 0, 0.0, prev)
+    a = np.take_along_axis(x1, index, axis=1)
+    b = np.take_along_axis(x2, index, axis=1)
+    ya = np.take_along_axis(y1, index, axis=1)
+    yb = np.take_along_axis(y2, index, axis=1)
+    w = b - a
+    slope = (yb - ya) / w
+    u = np.where(
+        ya == yb, sub / ya + a,
+        np.where(
+            ya == 0, a + np.sqrt(2.0 * sub * w / yb),
+            np.where(
+                yb == 0, b - np.sqrt(w * w - 2.0 * sub * w / ya),
+                a - (ya - np.sqrt(ya * ya + 2.0 * slope * sub)) / slope
+            )
+        )
+    )
+    return u[:, 0]
@@ -10,4 +10,8 @@ MITIGATION_STRATEGIES = {
     "Medium": ["Code review mandatory", "Break into subtasks", "Add monitoring"],
     "High": ["Architecture review", "Dedicated QA resource", "Phased rollout"],
     "Critical": ["Executive approval required", "Dedicated task force", "Rollback plan mandatory"]
-}
\ No newline at end of file
+}
+
+def risk_category(risk: float) -> str:
+    """Категория риска по итоговой оценке 0-100 (ключ MITIGATION_STRATEGIES)"""
+    return "Low" if risk < 35 else "Medium" if risk < 60 else "High" if risk < 80 else "Critical"
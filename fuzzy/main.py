@@ -1,18 +1,45 @@
 import os
+import copy
+import math
 import json
+import asyncio
+import socket
+import time
+import tempfile
 import numpy as np
 from datetime import datetime
-from typing import Dict, List, Optional, Literal, Union, Any
+from typing import Dict, List, Optional, Literal, Tuple, Union, Any
 from loguru import logger
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
-from schemas import TaskInput, TaskOutput, FeedbackInput, ConfigImportRequest
-from engine import FuzzyAgent, FuzzyOptimizer
-from knowledge import TASK_TYPE_WEIGHTS, MITIGATION_STRATEGIES
+from schemas import TaskInput, TaskOutput, EvaluateBatchRequest, EvaluateRecordsRequest, FeedbackInput, FeedbackBatchRequest, FeedbackBatchResponse, ConfigImportRequest, BacktestRequest, TskFitRequest, RulePruneRequest, SyntheticFeedbackRequest, EvaluateHistoryPage, SweepRequest
+from engine import FuzzyAgent, FuzzyOptimizer, compile_config
+from inference import CompiledEngine, config_version, INPUT_FIELDS
+from knowledge import TASK_TYPE_WEIGHTS, MITIGATION_STRATEGIES, risk_category
 from fuzzy_repository import FuzzyFeedbackRepository
-from database import DatabaseConfig, DatabaseConnection
+from async_fuzzy_repository import AsyncFuzzyFeedbackRepository
+from database import DatabaseConfig, DatabaseConnection, AsyncDatabaseConnection
+from shared_engine import SharedEngineStore
+from state_repository import FuzzyStateRepository, StateListener
+from write_behind import EvaluateWriteBuffer
+from metrics import StreamingMetrics, summarize
+import training_export
+import backtest
+import tsk
+from similarity import SimilarTaskIndex
+from shadow import ShadowRegistry
+from team_registry import TeamEngineRegistry
+from rule_profile import RuleProfiler, prune_rules
+from drift import DriftScheduler
+import queries
+import wire
 
 app = FastAPI(title="Fuzzy Complexity & Risk Agent", version="2.0.0")
+# Тела запросов принимаются и в MessagePack (Content-Type: application/msgpack), см. wire.py
+app.router.route_class = wire.NegotiatedRoute
 
 db_config = DatabaseConfig(
     database=os.getenv("FUZZY_DB_NAME", "fuzzy_agent_db"),
@@ -21,26 +48,291 @@ db_config = DatabaseConfig(
     password=os.getenv("FUZZY_DB_PASSWORD", "postgres"),
     port=int(os.getenv("FUZZY_DB_PORT", 5432))
 )
-db_conn = DatabaseConnection(db_config)
-feedback_repo = FuzzyFeedbackRepository(db_conn)
+db_conn = DatabaseConnection(
+    db_config,
+    min_size=int(os.getenv("FUZZY_DB_POOL_MIN", 1)),
+    max_size=int(os.getenv("FUZZY_DB_POOL_MAX", 10)),
+    acquire_timeout=float(os.getenv("FUZZY_DB_POOL_TIMEOUT", 30))
+)
+async_db_conn = AsyncDatabaseConnection(
+    db_config,
+    min_size=int(os.getenv("FUZZY_DB_POOL_MIN", 1)),
+    max_size=int(os.getenv("FUZZY_DB_POOL_MAX", 10)),
+    acquire_timeout=float(os.getenv("FUZZY_DB_POOL_TIMEOUT", 30))
+)
+feedback_repo = FuzzyFeedbackRepository(db_conn, months_ahead=int(os.getenv("FUZZY_PARTITION_MONTHS_AHEAD", 2)))
+async_repo = AsyncFuzzyFeedbackRepository(async_db_conn)
+state_repo = FuzzyStateRepository(db_conn)
+# Движки агентов по командам: компилируются при первом запросе, LRU не больше FUZZY_TEAM_ENGINE_CACHE_MB;
+# «у команды нет своего конфига» помнится FUZZY_TEAM_MISS_TTL секунд (до FUZZY_TEAM_MISS_CACHE_SIZE команд)
+team_registry = TeamEngineRegistry(
+    state_repo.get_team_config,
+    max_bytes=int(float(os.getenv("FUZZY_TEAM_ENGINE_CACHE_MB", 64)) * 1024 * 1024),
+    miss_ttl=float(os.getenv("FUZZY_TEAM_MISS_TTL", 300)),
+    max_missing=int(os.getenv("FUZZY_TEAM_MISS_CACHE_SIZE", 10000))
+)
+
+# FUZZY_EVALUATE_WRITE_MODE=sync - писать результат /evaluate в БД до ответа, как раньше
+# Конфиги-кандидаты на теневой оценке (/shadow): считаются на тех же задачах, что и live
+shadow_registry = ShadowRegistry()
+evaluate_writer = None
+if os.getenv("FUZZY_EVALUATE_WRITE_MODE", "buffered").lower() == "buffered":
+    evaluate_writer = EvaluateWriteBuffer(
+        async_repo,
+        batch_size=int(os.getenv("FUZZY_EVALUATE_FLUSH_ROWS", 500)),
+        flush_interval=float(os.getenv("FUZZY_EVALUATE_FLUSH_INTERVAL", 0.5)),
+        max_pending=int(os.getenv("FUZZY_EVALUATE_BUFFER_MAX", 10000)),
+        put_timeout=float(os.getenv("FUZZY_EVALUATE_BUFFER_TIMEOUT", 1.0)),
+        shadow=shadow_registry
+    )
+
+REPLICA_ID = f"{socket.gethostname()}-{os.getpid()}"
+FEEDBACK_WINDOW = int(os.getenv("FUZZY_FEEDBACK_WINDOW", 500))
+
+# Движки в общей памяти для воркеров одного развёртывания: каталог по умолчанию привязан к БД сервиса
+# (FUZZY_SHARED_ENGINE_NAMESPACE - задать явно), чтобы два сервиса на одном хосте не делили указатели версий
+engine_store = None
+if os.getenv("FUZZY_SHARED_ENGINES", "true").lower() == "true":
+    try:
+        engine_store = SharedEngineStore(
+            os.getenv("FUZZY_SHARED_ENGINE_DIR") or None,
+            namespace=os.getenv("FUZZY_SHARED_ENGINE_NAMESPACE") or f"{db_config.host}-{db_config.port}-{db_config.database}"
+        )
+    except OSError as e:
+        logger.warning(f"[SHM] Shared engine store disabled: {e}")
+
+effort_agent = FuzzyAgent("configs/effort_config.json", "effort", store=engine_store, feedback_capacity=FEEDBACK_WINDOW)
+risk_agent = FuzzyAgent("configs/risk_config.json", "risk", store=engine_store, feedback_capacity=FEEDBACK_WINDOW)
 
-effort_agent = FuzzyAgent("configs/effort_config.json", "effort")
-risk_agent = FuzzyAgent("configs/risk_config.json", "risk")
+# Индекс похожих задач для GET /evaluate/{task_id}/similar (FUZZY_SIMILAR_INDEX=false - отключить).
+# Входы нормируются на универсумы конфига; из БД индекс перечитывается раз в FUZZY_SIMILAR_REFRESH_INTERVAL секунд
+similar_index = None
+if os.getenv("FUZZY_SIMILAR_INDEX", "true").lower() == "true":
+    similar_index = SimilarTaskIndex(
+        effort_agent.config["universes"],
+        min_rebuild=int(os.getenv("FUZZY_SIMILAR_MIN_REBUILD", 1000))
+    )
+SIMILAR_REFRESH_INTERVAL = float(os.getenv("FUZZY_SIMILAR_REFRESH_INTERVAL", 3600))
 effort_tuner = FuzzyOptimizer(effort_agent)
 risk_tuner = FuzzyOptimizer(risk_agent)
+agents = {"effort": effort_agent, "risk": risk_agent}
+accuracy = {name: StreamingMetrics() for name in agents}
 
+# Автооптимизация по дрейфу (drift.py): проверка на каждые FUZZY_DRIFT_CHECK_EVERY новых фидбэков агента,
+# запуск - если скользящая MAE на последних FUZZY_DRIFT_ERROR_WINDOW фидбэках выше FUZZY_DRIFT_MAX_MAE
+# или выросла относительно базы больше чем на FUZZY_DRIFT_ERROR_INCREASE, либо PSI входа больше FUZZY_DRIFT_PSI;
+# не чаще раза в FUZZY_OPTIMIZE_MIN_INTERVAL секунд и не больше FUZZY_OPTIMIZE_CPU_BUDGET процессорных секунд
+# оптимизации за FUZZY_OPTIMIZE_BUDGET_WINDOW секунд (бюджет считается по реплике)
+optimization_scheduler = DriftScheduler(
+    error_window=int(os.getenv("FUZZY_DRIFT_ERROR_WINDOW", 100)),
+    max_mae=float(os.getenv("FUZZY_DRIFT_MAX_MAE")) if os.getenv("FUZZY_DRIFT_MAX_MAE") else None,
+    error_increase=float(os.getenv("FUZZY_DRIFT_ERROR_INCREASE", 0.25)),
+    psi_threshold=float(os.getenv("FUZZY_DRIFT_PSI", 0.2)),
+    check_every=int(os.getenv("FUZZY_DRIFT_CHECK_EVERY", 10)),
+    min_interval=float(os.getenv("FUZZY_OPTIMIZE_MIN_INTERVAL", 3600)),
+    cpu_budget=float(os.getenv("FUZZY_OPTIMIZE_CPU_BUDGET", 600)),
+    budget_window=float(os.getenv("FUZZY_OPTIMIZE_BUDGET_WINDOW", 86400))
+)
+
+# Профиль срабатывания правил на живом трафике (GET /rules/{agent}/profile). FUZZY_RULE_PROFILE=false - отключить;
+# правило считается сработавшим при степени не ниже FUZZY_RULE_PROFILE_MIN_STRENGTH
+RULE_MIN_STRENGTH = float(os.getenv("FUZZY_RULE_PROFILE_MIN_STRENGTH", 0.05))
+rule_profiler = None
+if os.getenv("FUZZY_RULE_PROFILE", "true").lower() == "true":
+    rule_profiler = RuleProfiler(agents, min_strength=RULE_MIN_STRENGTH)
+    if evaluate_writer is not None:
+        evaluate_writer.profiler = rule_profiler
+
+# Локальный файл чекпоинта остался от однопроцессной версии: используется только для начального заполнения БД
 CHECKPOINT_FILE = "optimizer_state.json"
-def load_checkpoint() -> dict:
+def load_legacy_checkpoint() -> dict:
     if os.path.exists(CHECKPOINT_FILE):
         with open(CHECKPOINT_FILE, "r") as f:
             return json.load(f)
     return {"effort_last": 0, "risk_last": 0, "threshold": 50}
 
-def save_checkpoint(state: dict):
-    with open(CHECKPOINT_FILE, "w") as f:
-        json.dump(state, f)
+state_repo.seed_checkpoint(load_legacy_checkpoint())
+
+def sync_agent_config(agent: FuzzyAgent):
+    """
+    Берёт активный конфиг из БД; если его там ещё нет - регистрирует локальный файл.
+    В общую память публикуется только после этого: конфиг из файла не должен подменить
+    движок уже работающим воркерам
+    """
+    config = state_repo.get_active_config(agent.name)
+    if config is None:
+        state_repo.save_config(agent.name, agent.config, source="file", origin=REPLICA_ID)
+    elif config_version(config) != config_version(agent.config):
+        logger.info(f"[STATE] {agent.name}: loading config version {config_version(config)} from DB")
+        agent.config = config
+        agent.rebuild()
+    agent.publish()
+
+def persist_config(agent: FuzzyAgent, source: str, config: Optional[Dict] = None):
+    # Конфиги хранятся только в БД (agent_configs); файл configs/*.json - лишь начальное значение для пустой БД
+    if config is not None:
+        agent.apply_config(config)
+    else:
+        agent.publish()
+    state_repo.save_config(agent.name, agent.config, source=source, origin=REPLICA_ID)
+    load_shadow_configs(agent.name)
+
+def load_shadow_configs(agent_name: str):
+    shadow_registry.replace(agent_name, state_repo.get_shadow_configs(agent_name))
+
+# FUZZY_AUTO_OPTIMIZE_SHADOW=true - результат автооптимизации уходит на теневую оценку, а не сразу в live
+AUTO_OPTIMIZE_SHADOW = os.getenv("FUZZY_AUTO_OPTIMIZE_SHADOW", "false").lower() == "true"
+
+def stage_optimized_config(agent: FuzzyAgent, candidate: Dict, source: str) -> str:
+    """Регистрирует оптимизированный конфиг кандидатом на теневую оценку; live-конфиг агента не меняется"""
+    version = state_repo.add_shadow_config(agent.name, candidate, source=source, origin=REPLICA_ID)
+    load_shadow_configs(agent.name)
+    return version
 
-checkpoint = load_checkpoint()
+# События других реплик применяются в цикле событий, как и запросы: поток StateListener только
+# передаёт их в цикл (dispatch_state_event), а lock сохраняет порядок событий при ожидании БД
+main_loop: Optional[asyncio.AbstractEventLoop] = None
+state_event_lock = asyncio.Lock()
+
+def dispatch_state_event(event: dict):
+    future = asyncio.run_coroutine_threadsafe(handle_state_event(event), main_loop)
+    future.add_done_callback(
+        lambda f: f.exception() and logger.error(f"[STATE] Failed to handle {event.get('type')} event: {f.exception()}")
+    )
+
+async def apply_optimized_config(agent: FuzzyAgent, config: Dict, base_version: str, source: str,
+                                 shadow: bool) -> Optional[str]:
+    """
+    Выкатывает результат оптимизации (shadow - ставит кандидатом) под state_event_lock, вместе с событиями
+    других реплик. Оптимизатор подбирал параметры на копии конфига base_version: если live за это время
+    сменился (импорт, выкат на другой реплике), результат устарел - None. Иначе версия нового конфига
+    """
+    async with state_event_lock:
+        if config_version(agent.config) != base_version:
+            logger.warning(f"[OPT] {agent.name}: live config changed during optimization, result of {base_version} discarded")
+            return None
+        if shadow:
+            return await run_in_threadpool(stage_optimized_config, agent, config, source)
+        await run_in_threadpool(persist_config, agent, source, config)
+        return config_version(config)
+
+async def handle_state_event(event: dict):
+    agent = agents.get(event.get("agent"))
+    if agent is None:
+        return
+    async with state_event_lock:
+        if event["type"] == "config":
+            if event.get("version") != config_version(agent.config):
+                config = await run_in_threadpool(state_repo.get_active_config, agent.name)
+                if config is not None:
+                    logger.info(f"[STATE] {agent.name}: config version {event.get('version')} published by {event.get('origin')}")
+                    agent.apply_config(config)
+            # выкаченный кандидат снимается с теневой оценки
+            await run_in_threadpool(load_shadow_configs, agent.name)
+        elif event["type"] == "shadow":
+            await run_in_threadpool(load_shadow_configs, agent.name)
+        elif event["type"] == "team_config":
+            team_registry.invalidate(event["team_id"], agent.name)
+        elif event["type"] == "feedback":
+            agent.add_feedback(event["inputs"], event["predicted"], event["target"])
+            if event.get("observed"):
+                accuracy[agent.name].update(*event["observed"])
+        elif event["type"] == "feedback_reload":
+            batch = await async_repo.get_training_batch(agent.name, limit=FEEDBACK_WINDOW)
+            totals = await async_repo.get_accuracy_totals(agent.name)
+            agent.feedback.replace(batch)
+            accuracy[agent.name].reset(totals)
+        elif event["type"] == "accuracy_resync":
+            accuracy[agent.name].reset(await async_repo.get_accuracy_totals(agent.name))
+
+async def observe_feedback(saved: Optional[dict], agent_names: List[str]) -> Dict[str, tuple]:
+    """
+    Обновляет метрики точности по сохранённой строке фидбэка (queries.SAVED_FEEDBACK_COLUMNS).
+    Новая строка добавляется в суммы; перезаписанная - метрики пересчитываются из БД на всех репликах.
+    Возвращает добавленные пары (предсказание, факт) по агентам.
+    """
+    observed = {}
+    if not saved:
+        return observed
+    for agent_name in agent_names:
+        target_col, pred_col = queries.agent_columns(agent_name)
+        if not saved["inserted"]:
+            accuracy[agent_name].reset(await async_repo.get_accuracy_totals(agent_name))
+            await run_in_threadpool(state_repo.publish_accuracy_resync, agent_name, origin=REPLICA_ID)
+        elif saved[pred_col] is not None:
+            observed[agent_name] = (saved[pred_col], queries.clip_target(saved[target_col]))
+            accuracy[agent_name].update(*observed[agent_name])
+    return observed
+
+state_listener = StateListener(db_config, dispatch_state_event, origin=REPLICA_ID)
+
+# Месячные секции evaluate_results/feedback: новые создаются наперёд, при FUZZY_RETENTION_MONTHS > 0
+# секции старше срока уходят в gzip-архив FUZZY_ARCHIVE_DIR
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("FUZZY_PARTITION_MAINTENANCE_INTERVAL", 6 * 3600))
+RETENTION_MONTHS = int(os.getenv("FUZZY_RETENTION_MONTHS", 0))
+ARCHIVE_DIR = os.getenv("FUZZY_ARCHIVE_DIR", "archive")
+maintenance_task: Optional[asyncio.Task] = None
+similar_task: Optional[asyncio.Task] = None
+
+async def run_partition_maintenance() -> List[str]:
+    await run_in_threadpool(feedback_repo.ensure_partitions)
+    if RETENTION_MONTHS <= 0:
+        return []
+    archived = await run_in_threadpool(feedback_repo.archive_partitions, RETENTION_MONTHS, ARCHIVE_DIR)
+    if archived:
+        for agent_name in agents:
+            await reload_agent_feedback(agent_name)
+    return archived
+
+def load_similar_index():
+    similar_index.load(
+        ([row[0] for row in rows], np.array([row[1:] for row in rows], dtype=np.float64))
+        for rows in feedback_repo.iter_evaluate_inputs()
+    )
+
+async def similar_index_loop():
+    while True:
+        try:
+            await run_in_threadpool(load_similar_index)
+        except Exception as e:
+            logger.error(f"[SIMILAR] Index load failed: {e}")
+        await asyncio.sleep(SIMILAR_REFRESH_INTERVAL)
+
+async def partition_maintenance_loop():
+    while True:
+        try:
+            await run_partition_maintenance()
+        except Exception as e:
+            logger.error(f"[PARTITIONS] Maintenance failed: {e}")
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+@app.on_event("startup")
+async def startup_event():
+    await async_db_conn.open()
+    for agent in agents.values():
+        await run_in_threadpool(sync_agent_config, agent)
+        await run_in_threadpool(load_shadow_configs, agent.name)
+        agent.feedback.replace(await async_repo.get_training_batch(agent.name, limit=FEEDBACK_WINDOW))
+        accuracy[agent.name].reset(await async_repo.get_accuracy_totals(agent.name))
+    global main_loop, maintenance_task, similar_task
+    main_loop = asyncio.get_running_loop()
+    state_listener.start()
+    if evaluate_writer is not None:
+        evaluate_writer.start()
+    maintenance_task = asyncio.create_task(partition_maintenance_loop())
+    if similar_index is not None:
+        similar_task = asyncio.create_task(similar_index_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    state_listener.stop()
+    for task in (maintenance_task, similar_task):
+        if task is not None:
+            task.cancel()
+    if evaluate_writer is not None:
+        await evaluate_writer.close()
+    await async_db_conn.close()
+    db_conn.close_pool()
 
 class OptimizationMetrics(BaseModel):
     mae: float
@@ -78,27 +370,82 @@ class OptimizationRequest(BaseModel):
     force: bool = Field(default=False)
     n_trials: int = Field(default=50, ge=10, le=200)
     timeout: int = Field(default=120, ge=30, le=600)
+    shadow: bool = Field(default=False, description="Не выкатывать результат, а поставить кандидатом на теневую оценку")
 
-def run_auto_optimization(agent_name: str):
+def run_auto_optimization(agent_name: str, claimed: int, previous: int):
+    optimized = False
+    # оптимизация идёт целиком в этом потоке: его процессорное время и есть её стоимость
+    cpu_started = time.thread_time()
     try:
         agent = effort_agent if agent_name == "effort" else risk_agent
         tuner = effort_tuner if agent_name == "effort" else risk_tuner
-        training_data = feedback_repo.get_training_data(agent_name, limit=200)
+        training_data = feedback_repo.get_training_batch(agent_name, limit=FEEDBACK_WINDOW)
         if len(training_data) < 15:
             return
-        agent.feedback_history = training_data
+        agent.feedback.replace(training_data)
+        base_version = config_version(agent.config)
         result = tuner.optimize_with_method_selection(min_samples=15, n_trials_per_method=30, timeout_per_method=90)
         if "error" not in result:
-            agent.save_config()
-            total = feedback_repo.get_count()
-            checkpoint[f"{agent_name}_last"] = total
-            save_checkpoint(checkpoint)
-            logger.info(f"[AUTO-OPT] {agent_name} optimized. New MAE: {result['metrics']['mae']:.2f}")
+            # выкат - в цикле событий под state_event_lock, как и конфиги от других реплик
+            version = asyncio.run_coroutine_threadsafe(
+                apply_optimized_config(agent, result["config"], base_version, source="auto_optimization",
+                                       shadow=AUTO_OPTIMIZE_SHADOW),
+                main_loop
+            ).result()
+            if version is None:
+                return
+            if AUTO_OPTIMIZE_SHADOW:
+                logger.info(f"[AUTO-OPT] {agent_name} optimized, candidate {version} on shadow evaluation. MAE: {result['metrics']['mae']:.2f}")
+            else:
+                logger.info(f"[AUTO-OPT] {agent_name} optimized. New MAE: {result['metrics']['mae']:.2f}")
+            optimized = True
     except Exception as e:
         logger.error(f"[AUTO-OPT] Failed for {agent_name}: {e}")
+    finally:
+        optimization_scheduler.record_run(agent_name, time.thread_time() - cpu_started, optimized)
+        if not optimized:
+            state_repo.release_optimization(agent_name, claimed, previous)
+
+async def schedule_auto_optimization(counts: Dict[str, int], background_tasks: BackgroundTasks):
+    """Проверка дрейфа после записи фидбэка; запуск забирает одна реплика (claim_optimization)"""
+    for agent_name in ("effort", "risk"):
+        decision = await run_in_threadpool(optimization_scheduler.decide, agents[agent_name], counts[agent_name])
+        if decision is None or decision["action"] != "optimize":
+            continue
+        previous = await run_in_threadpool(
+            state_repo.claim_optimization, agent_name, counts[agent_name],
+            min_new=1, min_interval=optimization_scheduler.min_interval
+        )
+        if previous is None:
+            optimization_scheduler.cancel(decision, "claimed_by_another_replica")
+            continue
+        logger.info(f"[AUTO-OPT] {agent_name}: scheduled ({decision['reason']}), rolling MAE {decision['rolling_mae']:.2f}, baseline {decision['baseline_mae']}")
+        background_tasks.add_task(run_auto_optimization, agent_name, counts[agent_name], previous)
+
+async def resolve_engine(agent: FuzzyAgent, team_id: Optional[str]) -> Union[FuzzyAgent, CompiledEngine]:
+    """Движок агента команды или общий агент, если команда не указана или своего конфига у неё нет"""
+    if team_id is None:
+        return agent
+    found, engine = team_registry.lookup(team_id, agent.name)
+    if not found:
+        engine = await run_in_threadpool(team_registry.load, team_id, agent.name)
+    return agent if engine is None else engine
+
+async def resolve_agent_engines(team_id: Optional[str]) -> Tuple[Dict[str, CompiledEngine], Dict[str, CompiledEngine]]:
+    """
+    Движки агентов для запроса команды и те из них, что считают общими конфигами (served). Строки,
+    посчитанные движками команд, не сравниваются с теневыми кандидатами общих конфигов
+    """
+    engines, served = {}, {}
+    for name, agent in agents.items():
+        resolved = await resolve_engine(agent, team_id)
+        engines[name] = resolved.current_engine() if resolved is agent else resolved
+        if resolved is agent:
+            served[name] = engines[name]
+    return engines, served
 
 @app.post("/evaluate", response_model=TaskOutput)
-async def evaluate_task(payload: TaskInput):
+async def evaluate_task(payload: TaskInput, request: Request):
     try:
         inputs = {
             "volume": payload.code_changes_lines,
@@ -106,37 +453,284 @@ async def evaluate_task(payload: TaskInput):
             "expertise": payload.team_expertise,
             "uncertainty": payload.requirement_uncertainty_pct
         }
-        complexity_pred = effort_agent.evaluate(inputs)
-        risk_pred = risk_agent.evaluate(inputs)
+        engines, served = await resolve_agent_engines(payload.team_id)
+        complexity_pred = engines["effort"].evaluate(inputs)
+        risk_pred = engines["risk"].evaluate(inputs)
+        if np.isnan(complexity_pred) or np.isnan(risk_pred):
+            raise ValueError("Crisp output cannot be calculated: no rules fired")
         weight = TASK_TYPE_WEIGHTS.get(payload.task_type, 1.0)
         complexity = float(np.clip(complexity_pred * weight, 0, 100))
         risk = float(np.clip(risk_pred * weight, 0, 100))
-        category = "Low" if risk < 35 else "Medium" if risk < 60 else "High" if risk < 80 else "Critical"
+        category = risk_category(risk)
         predictions = {"complexity_score": complexity, "risk_score": risk}
-        feedback_repo.save_evaluate_result(
-            task_id=payload.task_id,
-            inputs=inputs,
-            predictions=predictions,
-            task_type=payload.task_type
-        )
-        return TaskOutput(
+        evaluated_at = datetime.utcnow()
+        row = queries.evaluate_row(payload.task_id, inputs, predictions, payload.task_type, evaluated_at)
+        if evaluate_writer is not None:
+            await evaluate_writer.submit(payload.task_id, row, served)
+        else:
+            await async_repo.save_evaluate_result(
+                task_id=payload.task_id,
+                inputs=inputs,
+                predictions=predictions,
+                task_type=payload.task_type,
+                shadow_rows=shadow_registry.score([row], [served]) if shadow_registry else None
+            )
+            if rule_profiler is not None:
+                rule_profiler.observe([row], [served])
+        if similar_index is not None:
+            similar_index.add(payload.task_id, inputs)
+        return wire.respond(request, TaskOutput(
             task_id=payload.task_id,
             complexity_score=round(complexity, 2),
             risk_score=round(risk, 2),
             risk_category=category,
             mitigation_strategies=MITIGATION_STRATEGIES[category],
-            evaluated_at=datetime.utcnow()
-        )
+            evaluated_at=evaluated_at
+        ))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Поля запроса /evaluate -> входы агентов
+REQUEST_INPUTS = {
+    "code_changes_lines": "volume",
+    "dependencies_count": "dependencies",
+    "team_expertise": "expertise",
+    "requirement_uncertainty_pct": "uncertainty"
+}
+
+@app.post("/evaluate/records")
+async def save_evaluate_records(payload: EvaluateRecordsRequest):
+    """
+    Запись результатов, посчитанных встроенной оценкой (scoring.EmbeddedScorer) на стороне воркера.
+    Предсказания не пересчитываются; stale - записи, посчитанные не текущими версиями общих конфигов
+    """
+    live = {name: agent.current_engine() for name, agent in agents.items()}
+    live_versions = {name: engine.version for name, engine in live.items()}
+    rows, served, stale = [], [], 0
+    for item in payload.items:
+        inputs = {
+            "volume": item.code_changes_lines,
+            "dependencies": item.dependencies_count,
+            "expertise": item.team_expertise,
+            "uncertainty": item.requirement_uncertainty_pct
+        }
+        predictions = {"complexity_score": item.complexity_score, "risk_score": item.risk_score}
+        rows.append(queries.evaluate_row(item.task_id, inputs, predictions, item.task_type, item.evaluated_at or datetime.utcnow()))
+        # посчитано текущим общим конфигом (а не конфигом команды или старой версией) - известно только по версии
+        served.append({name: engine for name, engine in live.items() if item.versions.get(name) == engine.version})
+        stale += any(live_versions.get(name) != version for name, version in item.versions.items())
+        if similar_index is not None:
+            similar_index.add(item.task_id, inputs)
+    try:
+        await save_evaluate_rows(rows, served)
+    except Exception as e:
+        logger.error(f"[RECORDS] Saving {len(rows)} evaluate records failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "saved", "received": len(payload.items), "stale": stale, "live_versions": live_versions}
+
+async def save_evaluate_rows(rows: List[tuple], served: List[Dict[str, CompiledEngine]]):
+    """
+    Пачка строк queries.EVALUATE_ROW_COLUMNS: в write-behind буфер или сразу в БД (с теневыми кандидатами).
+    served - для каждой строки общие движки агентов, посчитавшие её (см. resolve_agent_engines)
+    """
+    if evaluate_writer is not None:
+        for row, row_served in zip(rows, served):
+            await evaluate_writer.submit(row[0], row, row_served)
+        return
+    # повтор task_id в одной пачке: остаётся последняя запись, как при повторной оценке
+    latest = {row[0]: (row, row_served) for row, row_served in zip(rows, served)}
+    rows = [row for row, _ in latest.values()]
+    served = [row_served for _, row_served in latest.values()]
+    await async_repo.save_evaluate_results_bulk(rows, shadow_registry.score(rows, served) if shadow_registry else None)
+    if rule_profiler is not None:
+        await asyncio.to_thread(rule_profiler.observe, rows, served)
+
+@app.post("/evaluate/batch")
+async def evaluate_task_batch(payload: EvaluateBatchRequest, request: Request):
+    """
+    Как /evaluate для пачки задач за один запрос: движки считают все задачи команды одним evaluate_batch.
+    Задачи, для которых выход не определён, возвращаются в errors, остальные сохраняются
+    """
+    evaluated_at = datetime.utcnow()
+    outputs: Dict[int, TaskOutput] = {}
+    errors, rows, served = [], [], []
+    teams: Dict[Optional[str], List[int]] = {}
+    for i, item in enumerate(payload.items):
+        teams.setdefault(item.team_id, []).append(i)
+    for team_id, positions in teams.items():
+        items = [payload.items[i] for i in positions]
+        X = np.array([[getattr(item, field) for field in REQUEST_INPUTS] for item in items], dtype=np.float64)
+        engines, team_served = await resolve_agent_engines(team_id)
+        complexity_pred = engines["effort"].evaluate_batch(X, columns=INPUT_FIELDS)
+        risk_pred = engines["risk"].evaluate_batch(X, columns=INPUT_FIELDS)
+        for i, item, x, c_pred, r_pred in zip(positions, items, X.tolist(), complexity_pred.tolist(), risk_pred.tolist()):
+            if np.isnan(c_pred) or np.isnan(r_pred):
+                errors.append({"task_id": item.task_id, "error": "Crisp output cannot be calculated: no rules fired"})
+                continue
+            weight = TASK_TYPE_WEIGHTS.get(item.task_type, 1.0)
+            complexity = float(np.clip(c_pred * weight, 0, 100))
+            risk = float(np.clip(r_pred * weight, 0, 100))
+            category = risk_category(risk)
+            inputs = dict(zip(INPUT_FIELDS, x))
+            rows.append(queries.evaluate_row(
+                item.task_id, inputs, {"complexity_score": complexity, "risk_score": risk}, item.task_type, evaluated_at
+            ))
+            served.append(team_served)
+            if similar_index is not None:
+                similar_index.add(item.task_id, inputs)
+            outputs[i] = TaskOutput(
+                task_id=item.task_id,
+                complexity_score=round(complexity, 2),
+                risk_score=round(risk, 2),
+                risk_category=category,
+                mitigation_strategies=MITIGATION_STRATEGIES[category],
+                evaluated_at=evaluated_at
+            )
+    try:
+        await save_evaluate_rows(rows, served)
+    except Exception as e:
+        logger.error(f"[BATCH] Saving {len(rows)} evaluate results failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return wire.respond(
+        request, {"results": [outputs[i] for i in sorted(outputs)], "errors": errors}, compact=wire.compact_batch
+    )
+
+SWEEP_MAX_POINTS = int(os.getenv("FUZZY_SWEEP_MAX_POINTS", 40000))
+
+def sweep_surface(agent: Union[FuzzyAgent, CompiledEngine], X: np.ndarray, weight: float, shape: tuple) -> list:
+    """Оценки агента по сетке в форме shape; как в /evaluate - вес типа задачи, 0-100, None вместо NaN"""
+    scores = np.round(np.clip(agent.evaluate_batch(X, columns=INPUT_FIELDS) * weight, 0, 100), 2)
+    surface = scores.astype(object)
+    surface[np.isnan(scores)] = None
+    return surface.reshape(shape).tolist()
+
+@app.post("/evaluate/sweep")
+async def evaluate_sweep(payload: SweepRequest):
+    """
+    Поверхность отклика обоих агентов: базовая точка варьируется по одной или двум осям
+    (start..stop включительно с шагом step), вся сетка считается одним батчем и нигде не сохраняется
+    """
+    counts = []
+    for axis in payload.axes:
+        if axis.stop < axis.start:
+            raise HTTPException(status_code=400, detail=f"Axis {axis.field}: stop < start")
+        span = (axis.stop - axis.start) / axis.step
+        if not math.isfinite(span):
+            raise HTTPException(status_code=400, detail=f"Axis {axis.field}: too many points")
+        # допуск - чтобы stop, кратный шагу, не терялся из-за округления
+        counts.append(math.floor(span + 1e-9) + 1)
+    if len({axis.field for axis in payload.axes}) != len(payload.axes):
+        raise HTTPException(status_code=400, detail="Axes must use different fields")
+    # размер сетки проверяется до выделения памяти под оси
+    points = math.prod(counts)
+    if points > SWEEP_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"Grid of {points} points exceeds FUZZY_SWEEP_MAX_POINTS={SWEEP_MAX_POINTS}")
+    axes = [axis.start + axis.step * np.arange(count) for axis, count in zip(payload.axes, counts)]
+    shape = tuple(counts)
+
+    started = time.perf_counter()
+    X = np.empty((points, len(INPUT_FIELDS)))
+    for field, name in REQUEST_INPUTS.items():
+        X[:, INPUT_FIELDS.index(name)] = getattr(payload, field)
+    for axis, grid in zip(payload.axes, np.meshgrid(*axes, indexing="ij")):
+        X[:, INPUT_FIELDS.index(REQUEST_INPUTS[axis.field])] = grid.ravel()
+    weight = TASK_TYPE_WEIGHTS.get(payload.task_type, 1.0)
+    complexity = await run_in_threadpool(sweep_surface, await resolve_engine(effort_agent, payload.team_id), X, weight, shape)
+    risk = await run_in_threadpool(sweep_surface, await resolve_engine(risk_agent, payload.team_id), X, weight, shape)
+    return {
+        "axes": [{"field": axis.field, "values": values.tolist()} for axis, values in zip(payload.axes, axes)],
+        "points": points,
+        "complexity_score": complexity,
+        "risk_score": risk,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+# Объявлен до /evaluate/{task_id}, иначе "history" совпадёт с task_id
+@app.get("/evaluate/history", response_model=EvaluateHistoryPage)
+async def get_evaluate_history(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Поля через запятую: " + ", ".join(queries.HISTORY_FIELDS)),
+    task_type: Optional[List[str]] = Query(None),
+    risk_category: Optional[List[Literal["Low", "Medium", "High", "Critical", "Unknown"]]] = Query(None),
+    complexity_min: Optional[float] = None,
+    complexity_max: Optional[float] = None,
+    risk_min: Optional[float] = None,
+    risk_max: Optional[float] = None,
+    has_feedback: Optional[bool] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    История оценок, новые первыми, страницами по limit.
+    Результаты из буфера отложенной записи появляются здесь после сброса (FUZZY_EVALUATE_FLUSH_INTERVAL)
+    """
+    selected = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(queries.HISTORY_FIELDS)
+    unknown = [f for f in selected if f not in queries.HISTORY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {unknown}")
+    try:
+        return await async_repo.get_evaluate_history_page(
+            selected, limit, cursor,
+            task_types=task_type,
+            risk_categories=risk_category,
+            complexity_range=(complexity_min, complexity_max),
+            risk_range=(risk_min, risk_max),
+            has_feedback=has_feedback,
+            since=since,
+            until=until
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/evaluate/{task_id}")
 async def get_evaluate_result(task_id: str):
-    result = feedback_repo.get_evaluate_by_task_id(task_id)
+    if evaluate_writer is not None:
+        await evaluate_writer.ensure_written(task_id)
+    result = await async_repo.get_evaluate_by_task_id(task_id)
     if not result:
         raise HTTPException(status_code=404, detail=f"No evaluation found for task_id: {task_id}")
     return result
 
+@app.get("/evaluate/{task_id}/similar")
+async def get_similar_tasks(task_id: str, k: int = Query(10, ge=1, le=100), with_feedback: bool = False):
+    """
+    k ближайших исторических задач по входам (расстояние - в нормированном на универсумы пространстве)
+    вместе с их фидбэком. with_feedback=true - только задачи с фактическими значениями
+    """
+    if similar_index is None:
+        raise HTTPException(status_code=503, detail="Similar task index is disabled (FUZZY_SIMILAR_INDEX=false)")
+    if not similar_index.ready:
+        raise HTTPException(status_code=503, detail="Similar task index is loading")
+    if evaluate_writer is not None:
+        await evaluate_writer.ensure_written(task_id)
+    target = await async_repo.get_evaluate_by_task_id(task_id)
+    if not target:
+        raise HTTPException(status_code=404, detail=f"No evaluation found for task_id: {task_id}")
+    inputs = [target["inputs"][name] for name in INPUT_FIELDS]
+    point = similar_index.normalize(inputs)
+    fetch = k if not with_feedback else 4 * k
+    while True:
+        neighbours = similar_index.query(inputs, fetch, exclude=task_id)
+        if evaluate_writer is not None:
+            await evaluate_writer.ensure_written(*(tid for tid, _ in neighbours))
+        rows = await async_repo.get_evaluate_by_task_ids([tid for tid, _ in neighbours])
+        similar = []
+        for tid, _ in neighbours:
+            row = rows.get(tid)
+            if row is None or (with_feedback and row["feedback"] is None):
+                continue
+            # расстояние по текущим входам из БД (в индексе точка могла устареть после повторной оценки)
+            distance = float(np.linalg.norm(
+                similar_index.normalize([row["inputs"][name] for name in INPUT_FIELDS]) - point
+            ))
+            similar.append({**row, "distance": round(distance, 6)})
+        if len(similar) >= k or len(neighbours) < fetch or fetch >= 64 * k:
+            break
+        fetch *= 4
+    similar.sort(key=lambda row: row["distance"])
+    return {"task_id": task_id, "k": k, "similar": similar[:k], "index": similar_index.stats()}
+
 @app.post("/feedback")
 async def submit_feedback(payload: FeedbackInput, background_tasks: BackgroundTasks):
     try:
@@ -146,30 +740,67 @@ async def submit_feedback(payload: FeedbackInput, background_tasks: BackgroundTa
             "expertise": payload.team_expertise,
             "uncertainty": payload.requirement_uncertainty_pct
         }
-        predictions = {
-            "complexity_score": effort_agent.evaluate(inputs),
-            "risk_score": risk_agent.evaluate(inputs)
-        }
         actual_data = {
             "actual_effort_hours": payload.actual_effort_hours,
             "actual_risk_score": payload.actual_risk_score
         }
-        feedback_repo.save_feedback(task_id=payload.task_id, actual_data=actual_data)
-        if payload.actual_effort_hours is not None:
-            target_effort = min(max(payload.actual_effort_hours, 0.0), 100.0)
-            effort_agent.add_feedback(inputs, predictions["complexity_score"], target_effort)
-        if payload.actual_risk_score is not None:
-            target_risk = min(max(payload.actual_risk_score * 100, 0.0), 100.0)
-            risk_agent.add_feedback(inputs, predictions["risk_score"], target_risk)
-        total_count = feedback_repo.get_count()
-        if total_count >= checkpoint["effort_last"] + checkpoint["threshold"]:
-            background_tasks.add_task(run_auto_optimization, "effort")
-        if total_count >= checkpoint["risk_last"] + checkpoint["threshold"]:
-            background_tasks.add_task(run_auto_optimization, "risk")
+        if evaluate_writer is not None:
+            await evaluate_writer.ensure_written(payload.task_id)
+        saved = await async_repo.save_feedback(task_id=payload.task_id, actual_data=actual_data)
+        if saved is None:
+            raise ValueError(f"No evaluation found for task_id: {payload.task_id}")
+        agent_names = [name for name, value in (("effort", payload.actual_effort_hours), ("risk", payload.actual_risk_score))
+                       if value is not None]
+        observed = await observe_feedback(saved, agent_names)
+        for agent_name in agent_names:
+            target_col, pred_col = queries.agent_columns(agent_name)
+            predicted, target = saved[pred_col], queries.clip_target(saved[target_col])
+            agents[agent_name].add_feedback(inputs, predicted, target)
+            await run_in_threadpool(state_repo.publish_feedback, agent_name, inputs, predicted, target,
+                                    origin=REPLICA_ID, observed=observed.get(agent_name))
+        counts = await async_repo.get_counts()
+        total_count = counts["total"]
+        await schedule_auto_optimization(counts, background_tasks)
         return {"status": "feedback_saved", "total_samples": total_count}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+async def reload_agent_feedback(agent_name: str):
+    """Перечитывает окно фидбэка и метрики агента из БД после массовой записи и оповещает реплики"""
+    agents[agent_name].feedback.replace(await async_repo.get_training_batch(agent_name, limit=FEEDBACK_WINDOW))
+    accuracy[agent_name].reset(await async_repo.get_accuracy_totals(agent_name))
+    await run_in_threadpool(state_repo.publish_feedback_reload, agent_name, origin=REPLICA_ID)
+
+@app.post("/feedback/batch", response_model=FeedbackBatchResponse)
+async def submit_feedback_batch(payload: FeedbackBatchRequest, background_tasks: BackgroundTasks):
+    """
+    Пакетная загрузка фактических значений (например, выгрузка из трекера по итогам спринта).
+    Предсказания не пересчитываются: фидбэк привязывается к уже сохранённым evaluate_results.
+    """
+    try:
+        items = [item.model_dump() for item in payload.items]
+        task_ids = [item["task_id"] for item in items]
+        if evaluate_writer is not None:
+            await evaluate_writer.ensure_written(*task_ids)
+        saved = {row["task_id"] for row in await async_repo.save_feedback_batch(items)}
+        unknown = sorted(set(task_ids) - saved)
+        for agent_name, field in (("effort", "actual_effort_hours"), ("risk", "actual_risk_score")):
+            if not any(item[field] is not None and item["task_id"] in saved for item in items):
+                continue
+            await reload_agent_feedback(agent_name)
+        counts = await async_repo.get_counts()
+        total_count = counts["total"]
+        await schedule_auto_optimization(counts, background_tasks)
+        return FeedbackBatchResponse(
+            status="feedback_saved",
+            received=len(items),
+            saved=len(saved),
+            unknown_task_ids=unknown,
+            total_samples=total_count
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/config/export")
 async def export_config(agent: str = Query("all", pattern="^(all|effort|risk)$")):
     result = {}
@@ -186,37 +817,362 @@ async def import_config(payload: ConfigImportRequest, agent: str = Query("all",
         if not required.issubset(payload.config.keys()):
             raise ValueError("Missing required config sections")
         if agent in ("all", "effort"):
-            with open("configs/effort_config.json", "w") as f:
-                json.dump(payload.config, f, indent=2, ensure_ascii=False)
             effort_agent.config = payload.config
             effort_agent.rebuild()
+            await run_in_threadpool(persist_config, effort_agent, "import")
         if agent in ("all", "risk"):
-            with open("configs/risk_config.json", "w") as f:
-                json.dump(payload.config, f, indent=2, ensure_ascii=False)
             risk_agent.config = payload.config
             risk_agent.rebuild()
+            await run_in_threadpool(persist_config, risk_agent, "import")
         return {"status": "config_imported", "reloaded_agents": agent}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Import failed: {str(e)}")
 
+@app.post("/config/backtest")
+async def backtest_config(payload: BacktestRequest):
+    """
+    Как конфиг-кандидат отработал бы на истории: сохранённые входы и факты за [since, until)
+    пересчитываются кандидатом и текущим конфигом; MAE/RMSE/Spearman в целом, по task_type и по корзинам bucket
+    """
+    required = {"universes", "antecedents", "consequent", "rules"}
+    if not required.issubset(payload.config.keys()):
+        raise HTTPException(status_code=400, detail="Missing required config sections")
+    try:
+        candidate = compile_config(payload.config)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Config compilation failed: {str(e)}")
+    if evaluate_writer is not None:
+        await evaluate_writer.flush()
+    chunks = training_export.iter_chunks(
+        feedback_repo.iter_training_export(payload.agent, payload.since, payload.until, payload.task_types)
+    )
+    result = await run_in_threadpool(backtest.run_backtest, chunks, candidate, agents[payload.agent], payload.bucket)
+    logger.info(f"[BACKTEST] {payload.agent}: {result['rows']} rows in {result['elapsed_ms']:.0f} ms")
+    return {
+        "agent": payload.agent,
+        "candidate_version": candidate.version,
+        "live_version": config_version(agents[payload.agent].config),
+        **result
+    }
+
+@app.post("/config/tsk")
+async def fit_tsk_config(payload: TskFitRequest):
+    """
+    TSK-версия текущего Mamdani-конфига агента: те же антецеденты и правила, термы выхода подогнаны МНК.
+    Возвращает конфиг (для /config/import, /config/backtest), отклонение от Mamdani и задержки обоих движков;
+    shadow=true - сразу регистрирует его кандидатом на теневую оценку
+    """
+    agent = agents[payload.agent]
+    try:
+        result = await run_in_threadpool(
+            tsk.fit_tsk, copy.deepcopy(agent.config), payload.order, payload.samples, payload.seed
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    version = config_version(result["config"])
+    logger.info(f"[TSK] {payload.agent}: fitted {payload.order} TSK {version}, MAE vs Mamdani {result['fidelity']['mae']:.3f}")
+    status = "fitted"
+    if payload.shadow:
+        await run_in_threadpool(
+            state_repo.add_shadow_config, payload.agent, result["config"], source="tsk", origin=REPLICA_ID
+        )
+        await run_in_threadpool(load_shadow_configs, payload.agent)
+        status = "shadow_registered"
+    return {
+        "status": status,
+        "agent": payload.agent,
+        "source_version": config_version(agent.config),
+        "version": version,
+        **result
+    }
+
+async def resolve_compiled(agent: FuzzyAgent, team_id: Optional[str]) -> CompiledEngine:
+    engine = await resolve_engine(agent, team_id)
+    return engine.current_engine() if isinstance(engine, FuzzyAgent) else engine
+
+@app.get("/engine/versions")
+async def get_engine_versions(team_id: Optional[str] = None):
+    """Версии движков, которыми сейчас считает /evaluate (для сверки кэша встроенной оценки)"""
+    return {name: (await resolve_compiled(agent, team_id)).version for name, agent in agents.items()}
+
+@app.get("/engine/{agent_name}")
+async def get_engine(request: Request, agent_name: Literal["effort", "risk"], team_id: Optional[str] = None):
+    """Скомпилированный движок агента (CompiledEngine.to_payload) для встроенной оценки; нужен только numpy"""
+    engine = await resolve_compiled(agents[agent_name], team_id)
+    return wire.respond(
+        request, {"agent": agent_name, "version": engine.version, "team_id": team_id, "engine": engine.to_payload()}
+    )
+
+@app.get("/rules/{agent_name}/profile")
+async def get_rule_profile(agent_name: Literal["effort", "risk"], version: Optional[str] = None):
+    """
+    Статистика правил на трафике этой реплики с момента запуска: hit_rate, effective_rate,
+    средняя/максимальная степень и вклад в выход (см. rule_profile). По умолчанию - live-версия конфига
+    """
+    if rule_profiler is None:
+        raise HTTPException(status_code=404, detail="Rule profiling is disabled (FUZZY_RULE_PROFILE=false)")
+    agent = agents[agent_name]
+    live_version = config_version(agent.config)
+    if evaluate_writer is not None:
+        await evaluate_writer.flush()
+    stats = rule_profiler.snapshot(agent_name, version or live_version)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No profile for {agent_name} version {version or live_version}")
+    return {
+        "agent": agent_name,
+        "version": version or live_version,
+        "live_version": live_version,
+        "rows": stats.rows,
+        "min_strength": stats.min_strength,
+        "versions": rule_profiler.versions(agent_name),
+        "rules": stats.summary()
+    }
+
+@app.post("/rules/{agent_name}/prune")
+async def prune_agent_rules(agent_name: Literal["effort", "risk"], payload: RulePruneRequest = RulePruneRequest()):
+    """
+    Предлагает прореженную базу правил: правила с наименьшим вкладом на истории с фидбэком удаляются,
+    пока MAE против факта растёт не больше max_mae_increase. Возвращает конфиг, удалённые правила,
+    точность до/после и задержку обоих движков; live-конфиг не меняется (shadow=true - на теневую оценку)
+    """
+    agent = agents[agent_name]
+    if evaluate_writer is not None:
+        await evaluate_writer.flush()
+    history = await run_in_threadpool(
+        lambda: training_export.collect(training_export.iter_chunks(
+            feedback_repo.iter_training_export(agent_name, payload.since, payload.until, payload.task_types)
+        ))
+    )
+    if len(history) == 0:
+        raise HTTPException(status_code=400, detail=f"No feedback history for {agent_name} in the requested period")
+    result = await run_in_threadpool(
+        prune_rules, copy.deepcopy(agent.config), history.batch.inputs, history.batch.target,
+        payload.max_mae_increase, RULE_MIN_STRENGTH
+    )
+    version = config_version(result["config"])
+    logger.info(f"[RULES] {agent_name}: pruned {result['rules_before']} -> {result['rules_after']} rules ({version})")
+    status = "proposed"
+    if payload.shadow and result["rules_after"] < result["rules_before"]:
+        await run_in_threadpool(
+            state_repo.add_shadow_config, agent_name, result["config"], source="prune", origin=REPLICA_ID
+        )
+        await run_in_threadpool(load_shadow_configs, agent_name)
+        status = "shadow_registered"
+    return {"status": status, "agent": agent_name, "source_version": config_version(agent.config), "version": version, **result}
+
+@app.get("/shadow")
+async def get_shadow_candidates(agent: str = Query("all", pattern="^(all|effort|risk)$")):
+    """
+    Кандидаты на теневой оценке и их точность против live на одних и тех же задачах с фидбэком.
+    live - предсказания, которые реально вернул сервис; undefined - задачи, где выход кандидата не определён
+    """
+    result = {}
+    for agent_name in (agents if agent == "all" else [agent]):
+        candidates = await run_in_threadpool(state_repo.list_shadow_configs, agent_name)
+        totals = await run_in_threadpool(feedback_repo.get_shadow_accuracy, agent_name)
+        loaded = shadow_registry.versions(agent_name)
+        for candidate in candidates:
+            row = totals.get(candidate["version"])
+            count = int(row["count"]) if row else 0
+            candidate["loaded"] = candidate["version"] in loaded
+            candidate["undefined"] = int(row["undefined"]) if row else 0
+            candidate["candidate"] = summarize(
+                count, *((row["sum_abs_error"], row["sum_sq_error"], row["sum_error"]) if row else (0, 0, 0))
+            )
+            candidate["live"] = summarize(
+                count, *((row["live_sum_abs_error"], row["live_sum_sq_error"], row["live_sum_error"]) if row else (0, 0, 0))
+            )
+        result[agent_name] = {"live_version": config_version(agents[agent_name].config), "candidates": candidates}
+    return result
+
+@app.post("/shadow/{agent_name}")
+async def add_shadow_candidate(agent_name: Literal["effort", "risk"], payload: ConfigImportRequest):
+    """Регистрирует конфиг-кандидат: с этого момента он считается на каждом /evaluate рядом с live"""
+    required = {"universes", "antecedents", "consequent", "rules"}
+    if not required.issubset(payload.config.keys()):
+        raise HTTPException(status_code=400, detail="Missing required config sections")
+    try:
+        compile_config(payload.config)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Config compilation failed: {str(e)}")
+    if config_version(payload.config) == config_version(agents[agent_name].config):
+        raise HTTPException(status_code=400, detail="Config is already live")
+    version = await run_in_threadpool(
+        state_repo.add_shadow_config, agent_name, payload.config, source="api", origin=REPLICA_ID
+    )
+    await run_in_threadpool(load_shadow_configs, agent_name)
+    return {"status": "shadow_registered", "agent": agent_name, "version": version}
+
+@app.delete("/shadow/{agent_name}/{version}")
+async def remove_shadow_candidate(agent_name: Literal["effort", "risk"], version: str):
+    """Снимает кандидата с теневой оценки и удаляет его предсказания"""
+    if not await run_in_threadpool(state_repo.remove_shadow_config, agent_name, version, origin=REPLICA_ID):
+        raise HTTPException(status_code=404, detail=f"No shadow candidate {version} for {agent_name}")
+    await run_in_threadpool(load_shadow_configs, agent_name)
+    deleted = await run_in_threadpool(feedback_repo.delete_shadow_predictions, agent_name, version)
+    return {"status": "shadow_removed", "agent": agent_name, "version": version, "predictions_deleted": deleted}
+
+@app.post("/shadow/{agent_name}/{version}/promote")
+async def promote_shadow_candidate(agent_name: Literal["effort", "risk"], version: str):
+    """Делает кандидата live-конфигом агента (как /config/import) и возвращает его теневую точность"""
+    configs = await run_in_threadpool(state_repo.get_shadow_configs, agent_name)
+    if version not in configs:
+        raise HTTPException(status_code=404, detail=f"No shadow candidate {version} for {agent_name}")
+    accuracy_before = (await get_shadow_candidates(agent_name))[agent_name]["candidates"]
+    agent = agents[agent_name]
+    agent.config = configs[version]
+    agent.rebuild()
+    await run_in_threadpool(persist_config, agent, "shadow_promotion")
+    await run_in_threadpool(feedback_repo.delete_shadow_predictions, agent_name, version)
+    return {
+        "status": "promoted",
+        "agent": agent_name,
+        "version": version,
+        "shadow_accuracy": next((c for c in accuracy_before if c["version"] == version), None)
+    }
+
+@app.get("/teams")
+async def list_team_configs(team_id: Optional[str] = None):
+    """Команды со своими конфигами агентов и состояние кэша их движков на этой реплике"""
+    return {
+        "teams": await run_in_threadpool(state_repo.list_team_configs, team_id),
+        "cache": team_registry.stats()
+    }
+
+@app.get("/teams/{team_id}/config/{agent_name}")
+async def get_team_config(team_id: str, agent_name: Literal["effort", "risk"]):
+    config = await run_in_threadpool(state_repo.get_team_config, team_id, agent_name)
+    if config is None:
+        raise HTTPException(status_code=404, detail=f"Team {team_id} uses the shared {agent_name} config")
+    return config
+
+@app.put("/teams/{team_id}/config/{agent_name}")
+async def put_team_config(team_id: str, agent_name: Literal["effort", "risk"], payload: ConfigImportRequest):
+    """Задаёт конфиг агента команды; движок скомпилируется при первом запросе с этим team_id"""
+    if len(team_id) > 100:
+        raise HTTPException(status_code=400, detail="team_id is longer than 100 characters")
+    required = {"universes", "antecedents", "consequent", "rules"}
+    if not required.issubset(payload.config.keys()):
+        raise HTTPException(status_code=400, detail="Missing required config sections")
+    try:
+        compile_config(payload.config)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Config compilation failed: {str(e)}")
+    version = await run_in_threadpool(
+        state_repo.save_team_config, team_id, agent_name, payload.config, source="api", origin=REPLICA_ID
+    )
+    team_registry.invalidate(team_id, agent_name)
+    return {"status": "team_config_saved", "team_id": team_id, "agent": agent_name, "version": version}
+
+@app.delete("/teams/{team_id}/config/{agent_name}")
+async def delete_team_config(team_id: str, agent_name: Literal["effort", "risk"]):
+    """Возвращает команду на общий конфиг агента"""
+    if not await run_in_threadpool(state_repo.delete_team_config, team_id, agent_name, origin=REPLICA_ID):
+        raise HTTPException(status_code=404, detail=f"Team {team_id} uses the shared {agent_name} config")
+    team_registry.invalidate(team_id, agent_name)
+    return {"status": "team_config_deleted", "team_id": team_id, "agent": agent_name}
+
+@app.get("/health")
+async def health():
+    """Дешёвая проверка живости для клиентов (без обращения к БД)"""
+    return {
+        "status": "ok",
+        "replica": REPLICA_ID,
+        "versions": {name: agent.engine.version for name, agent in agents.items()}
+    }
+
 @app.get("/metrics")
 async def get_metrics():
-    total = feedback_repo.get_count()
-    eff_hist = effort_agent.feedback_history
-    risk_hist = risk_agent.feedback_history
+    counts = await async_repo.get_counts()
     return {
-        "total_feedback": total,
-        "next_optimization_in": max(0, checkpoint["threshold"] - (total - max(checkpoint["effort_last"], checkpoint["risk_last"]))),
-        "effort": FuzzyOptimizer(effort_agent)._compute_metrics(eff_hist) if eff_hist else {"mae": 0, "rmse": 0, "spearman_rho": 0},
-        "risk": FuzzyOptimizer(risk_agent)._compute_metrics(risk_hist) if risk_hist else {"mae": 0, "rmse": 0, "spearman_rho": 0}
+        "total_feedback": counts["total"],
+        "feedback_counts": counts,
+        "optimization_scheduler": optimization_scheduler.status(),
+        "effort": accuracy["effort"].snapshot(effort_agent.feedback.snapshot()),
+        "risk": accuracy["risk"].snapshot(risk_agent.feedback.snapshot()),
+        "db_pool": db_conn.pool_stats(),
+        "db_pool_async": async_db_conn.pool_stats(),
+        "evaluate_writer": evaluate_writer.stats() if evaluate_writer is not None else None,
+        "similar_index": similar_index.stats() if similar_index is not None else None,
+        "shadow_candidates": {name: shadow_registry.versions(name) for name in agents},
+        "team_engines": team_registry.stats()
     }
 
+@app.get("/metrics/range")
+async def get_metrics_range(since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """Метрики точности за произвольный период [since, until), посчитанные в БД по сохранённым предсказаниям"""
+    result = {"since": since, "until": until}
+    for agent_name in agents:
+        totals = await async_repo.get_accuracy_totals(agent_name, since, until)
+        result[agent_name] = summarize(
+            totals["count"], totals["sum_abs_error"], totals["sum_sq_error"], totals["sum_error"]
+        )
+    return result
+
+@app.get("/training-data/export")
+async def export_training_data(
+    agent: Literal["effort", "risk"],
+    format: Literal["npz", "parquet", "arrow"] = "npz",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    task_type: Optional[List[str]] = Query(None),
+    batch_size: int = Query(10000, ge=100, le=100000)
+):
+    """
+    Обучающие данные агента за [since, until) по типам задач одним колоночным файлом.
+    Выгрузка идёт из серверного курсора пачками по batch_size строк во временный файл,
+    который удаляется после отправки
+    """
+    fd, path = tempfile.mkstemp(prefix=f"training_{agent}_", suffix=f".{format}")
+    os.close(fd)
+    try:
+        chunks = training_export.iter_chunks(
+            feedback_repo.iter_training_export(agent, since, until, task_type, batch_size)
+        )
+        rows = await run_in_threadpool(training_export.write_export, chunks, path, format)
+    except RuntimeError as e:
+        os.remove(path)
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception:
+        os.remove(path)
+        raise
+    logger.info(f"[EXPORT] {agent}: {rows} rows exported as {format}")
+    return FileResponse(
+        path,
+        filename=f"training_{agent}.{format}",
+        headers={"X-Row-Count": str(rows)},
+        background=BackgroundTask(os.remove, path)
+    )
+
 @app.post("/dev/generate-synthetic-feedback", include_in_schema=False)
-async def generate_synthetic_feedback():
+async def generate_synthetic_feedback(payload: SyntheticFeedbackRequest = SyntheticFeedbackRequest()):
     if os.getenv("FUZZY_DEV_MODE", "false").lower() != "true":
         raise HTTPException(status_code=403, detail="Endpoint disabled. Set FUZZY_DEV_MODE=true.")
-    result = feedback_repo.generate_synthetic_feedback()
-    return {"status": "completed", **result}
+    if evaluate_writer is not None:
+        await evaluate_writer.flush()
+    try:
+        result = await run_in_threadpool(
+            feedback_repo.generate_synthetic_feedback,
+            payload.task_ids,
+            (payload.inflation_min, payload.inflation_max),
+            payload.seed,
+            payload.dry_run
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not payload.dry_run and result["processed"]:
+        for agent_name in agents:
+            await reload_agent_feedback(agent_name)
+    return {"status": "dry_run" if payload.dry_run else "completed", **result}
+
+@app.get("/optimize/decisions")
+async def get_optimization_decisions(agent: Optional[Literal["effort", "risk"]] = None,
+                                     limit: int = Query(50, ge=1, le=200)):
+    """Журнал решений планировщика автооптимизации (новые первыми) и его текущее состояние"""
+    return {
+        "decisions": optimization_scheduler.decisions(agent, limit),
+        "scheduler": optimization_scheduler.status()
+    }
 
 @app.post("/optimize", response_model=OptimizationResponse)
 async def trigger_optimization(payload: OptimizationRequest = OptimizationRequest()):
@@ -230,7 +1186,7 @@ async def trigger_optimization(payload: OptimizationRequest = OptimizationReques
         try:
             agent = effort_agent if agent_name == "effort" else risk_agent
             tuner = effort_tuner if agent_name == "effort" else risk_tuner
-            available_samples = feedback_repo.get_count()
+            available_samples = (await async_repo.get_counts())[agent_name]
             logger.debug(f"[API-OPT] {agent_name}: available samples={available_samples}")
             
             if available_samples < payload.min_samples and not payload.force:
@@ -241,7 +1197,7 @@ async def trigger_optimization(payload: OptimizationRequest = OptimizationReques
                 )
                 continue
             
-            training_data = feedback_repo.get_training_data(agent_name, limit=500)
+            training_data = await async_repo.get_training_batch(agent_name, limit=FEEDBACK_WINDOW)
             if len(training_data) < payload.min_samples and not payload.force:
                 results[agent_name] = OptimizationResultSkipped(
                     status="skipped",
@@ -250,9 +1206,12 @@ async def trigger_optimization(payload: OptimizationRequest = OptimizationReques
                 )
                 continue
             
-            agent.feedback_history = training_data
+            agent.feedback.replace(training_data)
+            base_version = config_version(agent.config)
             
-            result = tuner.optimize_with_method_selection(
+            # optuna работает минуты: в пуле потоков на копии агента, живой агент отвечает как обычно
+            result = await run_in_threadpool(
+                tuner.optimize_with_method_selection,
                 min_samples=payload.min_samples,
                 preferred_method=payload.method,
                 n_trials_per_method=payload.n_trials,
@@ -267,9 +1226,19 @@ async def trigger_optimization(payload: OptimizationRequest = OptimizationReques
                     method_used=result.get("selected_method")
                 )
             else:
-                agent.save_config()
-                checkpoint[f"{agent_name}_last"] = available_samples
-                save_checkpoint(checkpoint)
+                version = await apply_optimized_config(
+                    agent, result["config"], base_version, source="manual_optimization", shadow=payload.shadow
+                )
+                if version is None:
+                    results[agent_name] = OptimizationResultFailed(
+                        status="failed",
+                        error="Live config changed during optimization, result discarded",
+                        method_used=result["selected_method"]
+                    )
+                    continue
+                if payload.shadow:
+                    logger.info(f"[API-OPT] {agent_name}: candidate {version} registered for shadow evaluation")
+                await run_in_threadpool(state_repo.set_checkpoint, agent_name, available_samples)
                 results[agent_name] = OptimizationResultSuccess(
                     status="success",
                     method_used=result["selected_method"],
@@ -279,7 +1248,7 @@ async def trigger_optimization(payload: OptimizationRequest = OptimizationReques
                         spearman_rho=round(result["metrics"]["spearman_rho"], 4)
                     ),
                     samples_used=len(training_data),
-                    config_updated=True
+                    config_updated=not payload.shadow
                 )
                 logger.success(f"[API-OPT] {agent_name}: optimization completed successfully")
         except Exception as e:
@@ -294,5 +1263,5 @@ async def trigger_optimization(payload: OptimizationRequest = OptimizationReques
         agents_processed=len(agents),
         success_count=success_count,
         results=results,
-        checkpoint_updated=checkpoint
+        checkpoint_updated=await run_in_threadpool(state_repo.get_checkpoint)
     )
\ No newline at end of file
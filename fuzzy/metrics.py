@@ -0,0 +1,84 @@
+# metrics.py
+import math
+import threading
+from typing import Dict, Optional
+import numpy as np
+from scipy import stats
+from feedback_store import FeedbackBatch
+
+
+class StreamingMetrics:
+    """
+    Накопительные метрики точности агента по сохранённым предсказаниям и фактам.
+
+    Суммы (count, |e|, e^2, e) дают MAE/RMSE/bias за всё время за O(1);
+    метрики скользящего окна считаются по FeedbackStore агента.
+    Ошибка e = predicted - target, то есть положительный bias - завышение.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count = 0
+        self._sum_abs = 0.0
+        self._sum_sq = 0.0
+        self._sum_err = 0.0
+
+    def update(self, predicted: Optional[float], target: Optional[float]):
+        if predicted is None or target is None:
+            return
+        err = predicted - target
+        with self._lock:
+            self._count += 1
+            self._sum_abs += abs(err)
+            self._sum_sq += err * err
+            self._sum_err += err
+
+    def reset(self, totals: Dict[str, float]):
+        """Заменяет состояние суммами из БД (см. queries.accuracy_totals_query)"""
+        with self._lock:
+            self._count = int(totals.get("count") or 0)
+            self._sum_abs = float(totals.get("sum_abs_error") or 0.0)
+            self._sum_sq = float(totals.get("sum_sq_error") or 0.0)
+            self._sum_err = float(totals.get("sum_error") or 0.0)
+
+    def snapshot(self, window: Optional[FeedbackBatch] = None) -> Dict:
+        with self._lock:
+            count, sum_abs, sum_sq, sum_err = self._count, self._sum_abs, self._sum_sq, self._sum_err
+        result = summarize(count, sum_abs, sum_sq, sum_err)
+        result["window"] = window_metrics(window)
+        # spearman_rho на верхнем уровне - для совместимости с прежним форматом /metrics
+        result["spearman_rho"] = result["window"]["spearman_rho"]
+        return result
+
+
+def summarize(count: int, sum_abs: float, sum_sq: float, sum_err: float) -> Dict:
+    if count == 0:
+        return {"count": 0, "mae": 0.0, "rmse": 0.0, "bias": 0.0}
+    return {
+        "count": count,
+        "mae": sum_abs / count,
+        "rmse": math.sqrt(sum_sq / count),
+        "bias": sum_err / count
+    }
+
+
+def window_metrics(window: Optional[FeedbackBatch]) -> Dict:
+    """Метрики по окну фидбэка (сохранённое предсказание против факта)"""
+    if window is None or len(window) == 0:
+        return {"size": 0, "mae": 0.0, "rmse": 0.0, "bias": 0.0, "spearman_rho": 0.0}
+    known = ~np.isnan(window.predicted)
+    predicted, target = window.predicted[known], window.target[known]
+    if predicted.size == 0:
+        return {"size": 0, "mae": 0.0, "rmse": 0.0, "bias": 0.0, "spearman_rho": 0.0}
+    err = predicted - target
+    rho = 0.0
+    if predicted.size >= 5:
+        rho_val, _ = stats.spearmanr(predicted, target)
+        rho = float(rho_val) if not np.isnan(rho_val) else 0.0
+    return {
+        "size": int(predicted.size),
+        "mae": float(np.mean(np.abs(err))),
+        "rmse": float(np.sqrt(np.mean(err ** 2))),
+        "bias": float(np.mean(err)),
+        "spearman_rho": rho
+    }
@@ -0,0 +1,44 @@
+# migrate.py
+"""
+Разовые миграции БД агента, запускаются вручную до старта (обновлённого) сервиса.
+
+    python migrate.py legacy-tables    # несекционированные evaluate_results/feedback -> месячные секции
+
+Подключение берётся из тех же FUZZY_DB_*, что и у сервиса. Миграция идёт под advisory-блокировкой
+схемы (queries.SCHEMA_LOCK): параллельный запуск дождётся первого и ничего не сделает.
+"""
+import argparse
+import os
+import sys
+from typing import List
+
+from database import DatabaseConfig, DatabaseConnection
+from fuzzy_repository import FuzzyFeedbackRepository
+
+COMMANDS = ("legacy-tables",)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Fuzzy agent one-off DB migrations")
+    parser.add_argument("command", choices=COMMANDS)
+    args = parser.parse_args(argv)
+
+    db_config = DatabaseConfig(
+        database=os.getenv("FUZZY_DB_NAME", "fuzzy_agent_db"),
+        host=os.getenv("FUZZY_DB_HOST", "postgres"),
+        user=os.getenv("FUZZY_DB_USER", "postgres"),
+        password=os.getenv("FUZZY_DB_PASSWORD", "postgres"),
+        port=int(os.getenv("FUZZY_DB_PORT", 5432))
+    )
+    repo = FuzzyFeedbackRepository(
+        DatabaseConnection(db_config, max_size=1),
+        months_ahead=int(os.getenv("FUZZY_PARTITION_MONTHS_AHEAD", 2)),
+        ensure_tables=False
+    )
+    if args.command == "legacy-tables":
+        repo.migrate_legacy_tables()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
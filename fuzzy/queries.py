@@ -0,0 +1,616 @@
+# queries.py
+"""SQL, общий для синхронного (psycopg2) и асинхронного (psycopg3) репозиториев"""
+import base64
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+EVALUATE_COLUMNS = [
+    "id", "task_id", "input_volume", "input_dependencies",
+    "input_expertise", "input_uncertainty", "task_type",
+    "predicted_complexity", "predicted_risk", "evaluated_at",
+    "actual_effort_hours", "actual_risk_score", "user_rating", "feedback_at"
+]
+
+EVALUATE_ROW_COLUMNS = (
+    "task_id", "input_volume", "input_dependencies", "input_expertise", "input_uncertainty",
+    "task_type", "predicted_complexity", "predicted_risk", "evaluated_at"
+)
+
+# evaluate_results и feedback секционированы по месяцам (см. FuzzyFeedbackRepository._ensure_tables),
+# поэтому глобального UNIQUE (task_id) и ON CONFLICT (task_id) нет: upsert - это UPDATE + INSERT
+# недостающих строк, а одновременная запись одной задачи сериализуется advisory-блокировками.
+# Блокировки берутся по полосам hashtext(task_id) в порядке возрастания (без дедлоков и без
+# переполнения таблицы блокировок на больших пачках) отдельным запросом до upsert: снимок upsert
+# должен видеть строки транзакций, которые держали блокировку.
+EVALUATE_LOCK, FEEDBACK_LOCK, SCHEMA_LOCK = 1, 2, 3
+TASK_LOCK_STRIPES = 256
+
+LOCK_TASKS = f"""
+    SELECT pg_advisory_xact_lock(%s, stripe)
+    FROM (
+        SELECT DISTINCT hashtext(task_id) & {TASK_LOCK_STRIPES - 1} AS stripe
+        FROM unnest(%s::varchar[]) AS t(task_id)
+        ORDER BY 1
+    ) s
+"""
+
+# Все полосы по возрастанию - для запросов, которые пишут по произвольному множеству задач
+LOCK_ALL_TASKS = f"""
+    SELECT pg_advisory_xact_lock(%s, stripe)
+    FROM (SELECT generate_series(0, {TASK_LOCK_STRIPES - 1}) AS stripe ORDER BY 1) s
+"""
+
+LOCK_STAGED_TASKS = f"""
+    SELECT pg_advisory_xact_lock({EVALUATE_LOCK}, stripe)
+    FROM (
+        SELECT DISTINCT hashtext(task_id) & {TASK_LOCK_STRIPES - 1} AS stripe
+        FROM evaluate_results_staging
+        ORDER BY 1
+    ) s
+"""
+
+_EVALUATE_VALUE_COLUMNS = EVALUATE_ROW_COLUMNS[1:-1]
+
+
+def _upsert_evaluate(source: str, evaluated_at: str) -> str:
+    """CTE updated/inserted: upsert строк source (колонки EVALUATE_ROW_COLUMNS) в evaluate_results"""
+    assignments = ",\n            ".join(f"{col} = s.{col}" for col in _EVALUATE_VALUE_COLUMNS)
+    return f"""
+    updated AS (
+        UPDATE evaluate_results e SET
+            {assignments},
+            evaluated_at = {evaluated_at}
+        FROM {source} s
+        WHERE e.task_id = s.task_id
+        RETURNING e.id, e.task_id
+    ), inserted AS (
+        INSERT INTO evaluate_results ({', '.join(EVALUATE_ROW_COLUMNS)})
+        SELECT s.task_id, {', '.join(f"s.{col}" for col in _EVALUATE_VALUE_COLUMNS)}, {evaluated_at}
+        FROM {source} s
+        WHERE NOT EXISTS (SELECT 1 FROM updated u WHERE u.task_id = s.task_id)
+        RETURNING id, task_id
+    )"""
+
+
+UPSERT_EVALUATE_RESULT = """
+    WITH incoming (""" + ", ".join(EVALUATE_ROW_COLUMNS[:-1]) + """) AS (
+        VALUES (%s::varchar, %s::float8, %s::float8, %s::float8, %s::float8, %s::varchar, %s::float8, %s::float8)
+    ),""" + _upsert_evaluate("incoming", "NOW()") + """
+    SELECT id FROM updated UNION ALL SELECT id FROM inserted
+"""
+
+# Пакетная запись evaluate_results: COPY во временную таблицу соединения, затем один upsert
+CREATE_EVALUATE_STAGING = """
+    CREATE TEMP TABLE IF NOT EXISTS evaluate_results_staging (
+        task_id VARCHAR(255),
+        input_volume FLOAT,
+        input_dependencies FLOAT,
+        input_expertise FLOAT,
+        input_uncertainty FLOAT,
+        task_type VARCHAR(50),
+        predicted_complexity FLOAT,
+        predicted_risk FLOAT,
+        evaluated_at TIMESTAMP
+    ) ON COMMIT DELETE ROWS
+"""
+
+COPY_EVALUATE_STAGING = f"COPY evaluate_results_staging ({', '.join(EVALUATE_ROW_COLUMNS)}) FROM STDIN"
+
+# Возвращает число записанных строк (обновлённых + вставленных)
+UPSERT_EVALUATE_FROM_STAGING = (
+    "WITH" + _upsert_evaluate("evaluate_results_staging", "COALESCE(s.evaluated_at, NOW())") + """
+    SELECT (SELECT COUNT(*) FROM updated) + (SELECT COUNT(*) FROM inserted)
+"""
+)
+
+# Предсказания задач, по которым только что записан фидбэк (для метрик точности)
+# inserted = FALSE, если строка фидбэка уже была и обновилась
+SAVED_FEEDBACK_COLUMNS = ("task_id", "predicted_complexity", "predicted_risk", "actual_effort_hours", "actual_risk_score", "inserted")
+
+# Upsert фидбэка из CTE incoming (task_id, actual_effort_hours, actual_risk_score, user_rating):
+# пустые actual_* не затирают сохранённые, строки без записи в evaluate_results отбрасываются
+_UPSERT_FEEDBACK_FROM_INCOMING = """,
+    updated AS (
+        UPDATE feedback f SET
+            actual_effort_hours = COALESCE(i.actual_effort_hours, f.actual_effort_hours),
+            actual_risk_score = COALESCE(i.actual_risk_score, f.actual_risk_score),
+            user_rating = COALESCE(i.user_rating, f.user_rating),
+            feedback_at = NOW()
+        FROM incoming i
+        WHERE f.task_id = i.task_id
+        RETURNING f.task_id, f.actual_effort_hours, f.actual_risk_score, FALSE AS inserted
+    ), inserted AS (
+        INSERT INTO feedback (task_id, actual_effort_hours, actual_risk_score, user_rating)
+        SELECT i.task_id, i.actual_effort_hours, i.actual_risk_score, i.user_rating
+        FROM incoming i
+        WHERE EXISTS (SELECT 1 FROM evaluate_results e WHERE e.task_id = i.task_id)
+          AND NOT EXISTS (SELECT 1 FROM updated u WHERE u.task_id = i.task_id)
+        RETURNING task_id, actual_effort_hours, actual_risk_score, TRUE AS inserted
+    ), saved AS (
+        SELECT * FROM updated UNION ALL SELECT * FROM inserted
+    )
+    SELECT s.task_id, e.predicted_complexity, e.predicted_risk, s.actual_effort_hours, s.actual_risk_score, s.inserted
+    FROM saved s
+    JOIN evaluate_results e ON e.task_id = s.task_id
+"""
+
+UPSERT_FEEDBACK_WITH_PREDICTIONS = """
+    WITH incoming (task_id, actual_effort_hours, actual_risk_score, user_rating) AS (
+        VALUES (%s::varchar, %s::float8, %s::float8, %s::varchar)
+    )""" + _UPSERT_FEEDBACK_FROM_INCOMING
+
+# Пакетный фидбэк: массивы колонок разворачиваются через unnest, для повторов task_id берётся последняя строка
+UPSERT_FEEDBACK_BATCH = """
+    WITH incoming AS (
+        SELECT DISTINCT ON (task_id) task_id, actual_effort_hours, actual_risk_score, user_rating
+        FROM unnest(%s::varchar[], %s::float8[], %s::float8[], %s::varchar[], %s::int[])
+            AS t(task_id, actual_effort_hours, actual_risk_score, user_rating, ord)
+        ORDER BY task_id, ord DESC
+    )""" + _UPSERT_FEEDBACK_FROM_INCOMING
+
+# Предсказания конфигов-кандидатов (теневая оценка, см. shadow.ShadowRegistry); predicted NULL - выход не определён
+SHADOW_PREDICTION_COLUMNS = ("task_id", "agent", "version", "predicted")
+
+UPSERT_SHADOW_PREDICTIONS = """
+    INSERT INTO shadow_predictions (task_id, agent, version, predicted)
+    SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::float8[])
+    ON CONFLICT (agent, version, task_id) DO UPDATE SET
+        predicted = EXCLUDED.predicted,
+        evaluated_at = NOW()
+"""
+
+DELETE_SHADOW_PREDICTIONS = "DELETE FROM shadow_predictions WHERE agent = %s AND version = %s"
+
+# Счётчики фидбэка поддерживаются триггерами на feedback (см. FuzzyFeedbackRepository._ensure_tables):
+# effort/risk - строки с соответствующим actual_*, total - строки хотя бы с одним из них
+FEEDBACK_COUNTERS = "SELECT name, total FROM feedback_counters"
+
+RECOUNT_FEEDBACK = """
+    SELECT
+        COUNT(*) FILTER (WHERE actual_effort_hours IS NOT NULL),
+        COUNT(*) FILTER (WHERE actual_risk_score IS NOT NULL),
+        COUNT(*) FILTER (WHERE actual_effort_hours IS NOT NULL OR actual_risk_score IS NOT NULL)
+    FROM feedback
+"""
+
+_EVALUATE_WITH_FEEDBACK = """
+    SELECT
+        e.id, e.task_id,
+        e.input_volume, e.input_dependencies, e.input_expertise, e.input_uncertainty,
+        e.task_type,
+        e.predicted_complexity, e.predicted_risk,
+        e.evaluated_at,
+        f.actual_effort_hours, f.actual_risk_score, f.user_rating, f.feedback_at
+    FROM evaluate_results e
+    LEFT JOIN feedback f ON e.task_id = f.task_id
+"""
+
+EVALUATE_BY_TASK_ID = _EVALUATE_WITH_FEEDBACK + """
+    WHERE e.task_id = %s
+    ORDER BY e.evaluated_at DESC
+    LIMIT 1
+"""
+
+EVALUATE_BY_TASK_IDS = _EVALUATE_WITH_FEEDBACK + """
+    WHERE e.task_id = ANY(%s)
+"""
+
+EVALUATE_INPUTS = """
+    SELECT task_id, input_volume, input_dependencies, input_expertise, input_uncertainty
+    FROM evaluate_results
+    WHERE input_volume IS NOT NULL AND input_dependencies IS NOT NULL
+      AND input_expertise IS NOT NULL AND input_uncertainty IS NOT NULL
+"""
+
+
+def counters_to_dict(rows: Sequence[Sequence]) -> Dict[str, int]:
+    counts = {"effort": 0, "risk": 0, "total": 0}
+    counts.update({name: total for name, total in rows})
+    return counts
+
+
+def clip_target(value: Optional[float]) -> Optional[float]:
+    """Факт в шкале 0-100, как его видят оптимизатор и метрики"""
+    return None if value is None else min(max(value, 0.0), 100.0)
+
+
+def agent_columns(agent_name: str):
+    """(колонка факта, колонка предсказания) для агента"""
+    if agent_name == "effort":
+        return "actual_effort_hours", "predicted_complexity"
+    return "actual_risk_score", "predicted_risk"
+
+
+def training_data_query(agent_name: str, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Последние записи для обучения (новые первыми), параметр запроса - limit.
+    since/until ограничивают feedback_at, и планировщик отбрасывает лишние месячные секции feedback.
+    Возвращает (sql, params без limit)
+    """
+    target_col, pred_col = agent_columns(agent_name)
+    conditions = [f"f.{target_col} IS NOT NULL"]
+    params = []
+    if since is not None:
+        conditions.append("f.feedback_at >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("f.feedback_at < %s")
+        params.append(until)
+    sql = f"""
+        SELECT
+            e.input_volume, e.input_dependencies, e.input_expertise, e.input_uncertainty,
+            e.{pred_col}, f.{target_col}, f.feedback_at
+        FROM evaluate_results e
+        INNER JOIN feedback f ON e.task_id = f.task_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY f.feedback_at DESC LIMIT %s
+    """
+    return sql, tuple(params)
+
+
+def synthetic_feedback_query(task_ids: Optional[Sequence[str]], inflation_min: float, inflation_max: float,
+                             seed: Optional[int] = None, dry_run: bool = False):
+    """
+    Синтетический фидбэк для задач без фидбэка одним запросом.
+    actual_* = round(predicted * k, 2), обрезанное до 0-100, k ~ U[inflation_min, inflation_max].
+    С seed множитель детерминирован для пары (task_id, seed) - не зависит от порядка строк и
+    повторяется между запусками; без seed используется random().
+    Результат - одна строка (processed, skipped); при dry_run processed - сколько строк было бы вставлено.
+    """
+    conditions = ["NOT EXISTS (SELECT 1 FROM feedback f WHERE f.task_id = e.task_id)"]
+    params: list = []
+    if seed is None:
+        uniform = "random()"
+    else:
+        uniform = "(hashtextextended(e.task_id, %s) & 2147483647)::float8 / 2147483647"
+        params.append(seed)
+    if task_ids is not None:
+        conditions.append("e.task_id = ANY(%s)")
+        params.append(list(task_ids))
+    candidates = f"""
+        SELECT e.task_id, e.predicted_complexity, e.predicted_risk,
+               %s + (%s - %s) * {uniform} AS k
+        FROM evaluate_results e
+        WHERE {" AND ".join(conditions)}
+    """
+    params = [inflation_min, inflation_max, inflation_min] + params
+    if dry_run:
+        sql = f"""
+            SELECT COUNT(*) FILTER (WHERE predicted_complexity IS NOT NULL AND predicted_risk IS NOT NULL),
+                   COUNT(*) FILTER (WHERE predicted_complexity IS NULL OR predicted_risk IS NULL)
+            FROM ({candidates}) c
+        """
+        return sql, tuple(params)
+    sql = f"""
+        WITH c AS ({candidates}),
+        inserted AS (
+            INSERT INTO feedback (task_id, actual_effort_hours, actual_risk_score, user_rating, feedback_at)
+            SELECT task_id,
+                   LEAST(GREATEST(ROUND((predicted_complexity * k)::numeric, 2), 0), 100),
+                   LEAST(GREATEST(ROUND((predicted_risk * k)::numeric, 2), 0), 100),
+                   'synthetic', NOW()
+            FROM c
+            WHERE predicted_complexity IS NOT NULL AND predicted_risk IS NOT NULL
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM inserted),
+               (SELECT COUNT(*) FROM c WHERE predicted_complexity IS NULL OR predicted_risk IS NULL)
+    """
+    return sql, tuple(params)
+
+
+TRAINING_EXPORT_COLUMNS = (
+    "input_volume", "input_dependencies", "input_expertise", "input_uncertainty",
+    "predicted", "target", "feedback_at", "task_type"
+)
+
+
+def training_export_query(agent_name: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          task_types: Optional[Sequence[str]] = None):
+    """
+    Выгрузка обучающих данных за [since, until) по типам задач в хронологическом порядке.
+    Колонки TRAINING_EXPORT_COLUMNS: факт обрезан до 0-100, feedback_at - unix-время (float8),
+    чтобы строки курсора сразу ложились в float64-массивы.
+    """
+    target_col, pred_col = agent_columns(agent_name)
+    conditions = [f"f.{target_col} IS NOT NULL"]
+    params = []
+    if since is not None:
+        conditions.append("f.feedback_at >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("f.feedback_at < %s")
+        params.append(until)
+    if task_types:
+        conditions.append("e.task_type = ANY(%s)")
+        params.append(list(task_types))
+    sql = f"""
+        SELECT
+            e.input_volume, e.input_dependencies, e.input_expertise, e.input_uncertainty,
+            e.{pred_col}, LEAST(GREATEST(f.{target_col}, 0), 100),
+            EXTRACT(EPOCH FROM f.feedback_at)::float8, e.task_type
+        FROM evaluate_results e
+        INNER JOIN feedback f ON e.task_id = f.task_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY f.feedback_at, f.id
+    """
+    return sql, tuple(params)
+
+
+ACCURACY_TOTALS_COLUMNS = ("count", "sum_abs_error", "sum_sq_error", "sum_error")
+
+
+def accuracy_totals_query(agent_name: str, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Суммы ошибок (predicted - clip(actual)) по фидбэку за [since, until).
+    Те же величины копит metrics.StreamingMetrics, так что её состояние восстанавливается из БД.
+    """
+    target_col, pred_col = agent_columns(agent_name)
+    conditions = [f"f.{target_col} IS NOT NULL", f"e.{pred_col} IS NOT NULL"]
+    params = []
+    if since is not None:
+        conditions.append("f.feedback_at >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("f.feedback_at < %s")
+        params.append(until)
+    sql = f"""
+        SELECT COUNT(*), COALESCE(SUM(ABS(err)), 0), COALESCE(SUM(err * err), 0), COALESCE(SUM(err), 0)
+        FROM (
+            SELECT e.{pred_col} - LEAST(GREATEST(f.{target_col}, 0), 100) AS err
+            FROM evaluate_results e
+            INNER JOIN feedback f ON e.task_id = f.task_id
+            WHERE {" AND ".join(conditions)}
+        ) s
+    """
+    return sql, tuple(params)
+
+
+SHADOW_ACCURACY_COLUMNS = (
+    "version", "count", "undefined",
+    "sum_abs_error", "sum_sq_error", "sum_error",
+    "live_sum_abs_error", "live_sum_sq_error", "live_sum_error"
+)
+
+
+def shadow_accuracy_query(agent_name: str):
+    """
+    Суммы ошибок кандидатов и live-конфига на одних и тех же задачах с фидбэком, по версиям кандидатов.
+    Live - сохранённое в evaluate_results предсказание; задачи с неопределённым выходом кандидата
+    считаются отдельно (undefined) и в суммы не входят. Параметр запроса - agent
+    """
+    target_col, pred_col = agent_columns(agent_name)
+    return f"""
+        SELECT
+            s.version,
+            COUNT(*) FILTER (WHERE s.predicted IS NOT NULL),
+            COUNT(*) FILTER (WHERE s.predicted IS NULL),
+            COALESCE(SUM(ABS(s.predicted - t.target)), 0),
+            COALESCE(SUM((s.predicted - t.target) ^ 2), 0),
+            COALESCE(SUM(s.predicted - t.target), 0),
+            COALESCE(SUM(ABS(t.live - t.target)) FILTER (WHERE s.predicted IS NOT NULL), 0),
+            COALESCE(SUM((t.live - t.target) ^ 2) FILTER (WHERE s.predicted IS NOT NULL), 0),
+            COALESCE(SUM(t.live - t.target) FILTER (WHERE s.predicted IS NOT NULL), 0)
+        FROM shadow_predictions s
+        CROSS JOIN LATERAL (
+            SELECT e.{pred_col} AS live, LEAST(GREATEST(f.{target_col}, 0), 100) AS target
+            FROM evaluate_results e
+            INNER JOIN feedback f ON e.task_id = f.task_id
+            WHERE e.task_id = s.task_id AND f.{target_col} IS NOT NULL AND e.{pred_col} IS NOT NULL
+        ) t
+        WHERE s.agent = %s
+        GROUP BY s.version
+    """
+
+
+def evaluate_params(task_id: str, inputs: Dict, predictions: Dict, task_type: Optional[str]) -> tuple:
+    return (
+        task_id, inputs["volume"], inputs["dependencies"],
+        inputs["expertise"], inputs["uncertainty"],
+        task_type, predictions["complexity_score"], predictions["risk_score"]
+    )
+
+
+def evaluate_row(task_id: str, inputs: Dict, predictions: Dict, task_type: Optional[str], evaluated_at: datetime) -> tuple:
+    """Строка для пакетной записи (порядок EVALUATE_ROW_COLUMNS)"""
+    return evaluate_params(task_id, inputs, predictions, task_type) + (evaluated_at,)
+
+
+def shadow_params(rows: List[tuple]) -> tuple:
+    """Колонки строк SHADOW_PREDICTION_COLUMNS для UPSERT_SHADOW_PREDICTIONS"""
+    return tuple(list(column) for column in zip(*rows))
+
+
+def feedback_params(task_id: str, actual_data: Dict) -> tuple:
+    return (
+        task_id,
+        actual_data.get("actual_effort_hours"),
+        actual_data.get("actual_risk_score"),
+        actual_data.get("user_rating")
+    )
+
+
+def feedback_batch_params(items: Sequence[Dict]) -> tuple:
+    """Колоночные массивы для UPSERT_FEEDBACK_BATCH"""
+    return (
+        [item["task_id"] for item in items],
+        [item.get("actual_effort_hours") for item in items],
+        [item.get("actual_risk_score") for item in items],
+        [item.get("user_rating") for item in items],
+        list(range(len(items)))
+    )
+
+
+def rows_to_training_data(rows: Sequence[Sequence]) -> List[Dict]:
+    data = []
+    for r in rows:
+        target = clip_target(r[5])
+        if target is None:
+            continue
+
+        data.append({
+            "inputs": {
+                "volume": r[0], "dependencies": r[1],
+                "expertise": r[2], "uncertainty": r[3]
+            },
+            "predicted": r[4],
+            "target": target
+        })
+    return data
+
+
+# Категории риска: [нижняя граница, верхняя граница) по predicted_risk
+RISK_CATEGORY_BOUNDS = {
+    "Low": (None, 35),
+    "Medium": (35, 60),
+    "High": (60, 80),
+    "Critical": (80, None),
+}
+
+
+def calculate_risk_category(risk_score: Optional[float]) -> str:
+    """Категория риска по шкале 0-100"""
+    if risk_score is None:
+        return "Unknown"
+    for category, (lower, upper) in RISK_CATEGORY_BOUNDS.items():
+        if (lower is None or risk_score >= lower) and (upper is None or risk_score < upper):
+            return category
+    return "Unknown"
+
+
+# Поля ответа /evaluate/history (ключи format_evaluate_row) и нужные для них колонки
+HISTORY_FIELDS = {
+    "task_id": ("e.task_id",),
+    "inputs": ("e.input_volume", "e.input_dependencies", "e.input_expertise", "e.input_uncertainty"),
+    "task_type": ("e.task_type",),
+    "predictions": ("e.predicted_complexity", "e.predicted_risk"),
+    "feedback": ("f.actual_effort_hours", "f.actual_risk_score", "f.user_rating", "f.feedback_at"),
+    "evaluated_at": ("e.evaluated_at",),
+}
+
+
+def encode_history_cursor(evaluated_at: datetime, row_id: int) -> str:
+    payload = json.dumps([evaluated_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str):
+    """(evaluated_at, id) последней строки предыдущей страницы; ValueError для битого курсора"""
+    try:
+        evaluated_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(evaluated_at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid history cursor: {cursor}") from e
+
+
+def evaluate_history_query(fields: Sequence[str], limit: int, after: Optional[tuple] = None,
+                           task_types: Optional[Sequence[str]] = None,
+                           risk_categories: Optional[Sequence[str]] = None,
+                           complexity_range: tuple = (None, None), risk_range: tuple = (None, None),
+                           has_feedback: Optional[bool] = None,
+                           since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Страница истории оценок (новые первыми) с keyset-пагинацией по (evaluated_at, id):
+    after - ключ последней строки предыдущей страницы. Страница читается по индексу
+    idx_evaluate_at_id с этой точки, поэтому стоимость не зависит от глубины прокрутки.
+    Выбираются только колонки запрошенных полей HISTORY_FIELDS (feedback - с LEFT JOIN),
+    плюс id и evaluated_at для курсора. Берётся limit + 1 строка, чтобы знать, есть ли следующая страница.
+    Возвращает (sql, params, columns)
+    """
+    columns = ["e.id", "e.evaluated_at"]
+    for field in fields:
+        columns += [col for col in HISTORY_FIELDS[field] if col not in columns]
+    conditions = []
+    params: list = []
+    if after is not None:
+        # отдельное условие по evaluated_at - для отсечения секций планировщиком
+        conditions.append("e.evaluated_at <= %s AND (e.evaluated_at, e.id) < (%s, %s)")
+        params += [after[0], after[0], after[1]]
+    if since is not None:
+        conditions.append("e.evaluated_at >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("e.evaluated_at < %s")
+        params.append(until)
+    if task_types:
+        conditions.append("e.task_type = ANY(%s)")
+        params.append(list(task_types))
+    if risk_categories:
+        ranges = []
+        for category in risk_categories:
+            if category == "Unknown":
+                ranges.append("e.predicted_risk IS NULL")
+                continue
+            lower, upper = RISK_CATEGORY_BOUNDS[category]
+            bounds = []
+            if lower is not None:
+                bounds.append("e.predicted_risk >= %s")
+                params.append(lower)
+            if upper is not None:
+                bounds.append("e.predicted_risk < %s")
+                params.append(upper)
+            ranges.append("(" + " AND ".join(bounds) + ")")
+        conditions.append("(" + " OR ".join(ranges) + ")")
+    for column, (lower, upper) in (("e.predicted_complexity", complexity_range), ("e.predicted_risk", risk_range)):
+        if lower is not None:
+            conditions.append(f"{column} >= %s")
+            params.append(lower)
+        if upper is not None:
+            conditions.append(f"{column} <= %s")
+            params.append(upper)
+    if has_feedback is not None:
+        conditions.append(
+            f"{'' if has_feedback else 'NOT '}EXISTS ("
+            "SELECT 1 FROM feedback fb WHERE fb.task_id = e.task_id "
+            "AND (fb.actual_effort_hours IS NOT NULL OR fb.actual_risk_score IS NOT NULL))"
+        )
+    join = "LEFT JOIN feedback f ON f.task_id = e.task_id" if "feedback" in fields else ""
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f"""
+        SELECT {', '.join(columns)}
+        FROM evaluate_results e
+        {join}
+        {where}
+        ORDER BY e.evaluated_at DESC, e.id DESC
+        LIMIT %s
+    """
+    params.append(limit + 1)
+    return sql, tuple(params), [col.split(".", 1)[1] for col in columns]
+
+
+def format_history_row(row: Dict, fields: Sequence[str]) -> Dict:
+    """Строка evaluate_history_query -> запрошенные поля в формате format_evaluate_row"""
+    formatted = format_evaluate_row([row.get(col) for col in EVALUATE_COLUMNS])
+    return {field: formatted[field] for field in fields}
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def format_evaluate_row(row: Sequence) -> Dict:
+    """Форматирует строку EVALUATE_BY_TASK_ID в ответ для UI"""
+    result = dict(zip(EVALUATE_COLUMNS, row))
+    return {
+        "task_id": result["task_id"],
+        "inputs": {
+            "volume": result["input_volume"],
+            "dependencies": result["input_dependencies"],
+            "expertise": result["input_expertise"],
+            "uncertainty": result["input_uncertainty"]
+        },
+        "task_type": result["task_type"],
+        "predictions": {
+            "complexity_score": round(result["predicted_complexity"], 2) if result["predicted_complexity"] else None,
+            "risk_score": round(result["predicted_risk"], 2) if result["predicted_risk"] else None,
+            "risk_category": calculate_risk_category(result["predicted_risk"])
+        },
+        "feedback": {
+            "actual_effort_hours": result["actual_effort_hours"],
+            "actual_risk_score": result["actual_risk_score"],
+            "user_rating": result["user_rating"],
+            "feedback_at": _isoformat(result["feedback_at"])
+        } if result["actual_effort_hours"] or result["actual_risk_score"] else None,
+        "evaluated_at": _isoformat(result["evaluated_at"])
+    }
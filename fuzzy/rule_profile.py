@@ -0,0 +1,242 @@
+# rule_profile.py
+"""
+Профиль срабатывания правил и прореживание базы правил.
+
+Для каждого правила копятся: доля входов, на которых оно сработало не слабее min_strength (hit_rate),
+средняя и максимальная степень срабатывания и вклад в выход (contribution) - доля агрегированной
+активации выхода, которая приходится на правило. В Mamdani на выход влияет только максимальное правило
+терма (срез терма - max по его правилам), поэтому вклад правила, которое всегда перекрыто другим правилом
+того же терма, нулевой: effective_rate - доля входов, где правило задаёт срез своего терма.
+В TSK вклад - нормированный вес правила во взвешенном среднем.
+"""
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from loguru import logger
+from engine import compile_config
+from inference import CompiledEngine, INPUT_FIELDS, config_version
+from backtest import score
+from tsk import latency_us
+
+# Положение входов в строке queries.EVALUATE_ROW_COLUMNS
+_INPUTS = slice(1, 1 + len(INPUT_FIELDS))
+# Точек на сетке универсумов для проверки, что прореживание не оставляет входы без сработавших правил
+COVERAGE_SAMPLES = 5000
+
+
+def rule_activity(engine: CompiledEngine, X: np.ndarray) -> tuple:
+    """Степени срабатывания (N, n_rules) и вклад каждого правила в агрегированную активацию выхода"""
+    strengths = engine.rule_strengths(X)
+    n, n_rules = strengths.shape
+    if engine.inference == "tsk":
+        effective = strengths > 0
+        total = strengths.sum(axis=1, keepdims=True)
+    else:
+        effective = np.zeros((n, n_rules), dtype=bool)
+        total = np.zeros((n, 1))
+        rows = np.arange(n)
+        for c in range(len(engine.meta["output"]["terms"])):
+            idx = np.nonzero(engine.rule_consequents == c)[0]
+            if idx.size == 0:
+                continue
+            # при равных степенях срез задаёт первое правило терма
+            best = strengths[:, idx].argmax(axis=1)
+            cut = strengths[rows, idx[best]]
+            effective[rows, idx[best]] = cut > 0
+            total[:, 0] += cut
+    share = np.divide(np.where(effective, strengths, 0.0), total, out=np.zeros((n, n_rules)), where=total > 0)
+    return strengths, share, effective
+
+
+def rule_texts(config: Dict) -> List[str]:
+    """Правила конфига в порядке движка (строки без '=>' compile_config пропускает)"""
+    return [rule for rule in config["rules"] if "=>" in rule]
+
+
+class RuleStats:
+    """Накопитель статистики правил одной версии конфига"""
+
+    def __init__(self, rules: List[str], min_strength: float = 0.05):
+        n_rules = len(rules)
+        self.rules = rules
+        self.min_strength = min_strength
+        self.rows = 0
+        self.hits = np.zeros(n_rules, dtype=np.int64)
+        self.effective = np.zeros(n_rules, dtype=np.int64)
+        self.strength_sum = np.zeros(n_rules)
+        self.strength_max = np.zeros(n_rules)
+        self.share_sum = np.zeros(n_rules)
+
+    def add(self, engine: CompiledEngine, X: np.ndarray):
+        if len(X) == 0:
+            return
+        strengths, share, effective = rule_activity(engine, X)
+        self.rows += len(X)
+        self.hits += np.count_nonzero(strengths >= self.min_strength, axis=0)
+        self.effective += np.count_nonzero(effective, axis=0)
+        self.strength_sum += strengths.sum(axis=0)
+        self.strength_max = np.maximum(self.strength_max, strengths.max(axis=0, initial=0.0))
+        self.share_sum += share.sum(axis=0)
+
+    def contribution(self) -> np.ndarray:
+        return self.share_sum / max(self.rows, 1)
+
+    def summary(self) -> List[Dict]:
+        rows = max(self.rows, 1)
+        return [
+            {
+                "index": i,
+                "rule": text,
+                "hit_rate": float(self.hits[i] / rows),
+                "effective_rate": float(self.effective[i] / rows),
+                "mean_strength": float(self.strength_sum[i] / rows),
+                "max_strength": float(self.strength_max[i]),
+                "contribution": float(self.share_sum[i] / rows),
+            }
+            for i, text in enumerate(self.rules)
+        ]
+
+
+class RuleProfiler:
+    """
+    Профиль правил live-агентов на реальном трафике. Строки evaluate_results подаются пачками
+    (на сбросе write-behind буфера) вместе с движками, которые их посчитали (served), и статистика
+    копится по версии этого движка - оптимизация и импорт не смешивают правила разных баз.
+    Строки, посчитанные конфигами команд, в профиль общего конфига не попадают.
+    Хранится не больше max_versions версий на агента.
+    """
+
+    def __init__(self, agents: Dict[str, Any], min_strength: float = 0.05, max_versions: int = 8):
+        self.agents = agents
+        self.min_strength = min_strength
+        self.max_versions = max_versions
+        self._lock = threading.Lock()
+        self._stats: Dict[str, "OrderedDict[str, RuleStats]"] = {name: OrderedDict() for name in agents}
+
+    def observe(self, rows: Sequence[tuple], served: Sequence[Dict[str, CompiledEngine]]):
+        """Учитывает пачку строк queries.EVALUATE_ROW_COLUMNS; served - общие движки агентов по строкам"""
+        if not rows:
+            return
+        X = np.array([row[_INPUTS] for row in rows], dtype=np.float64)
+        for name, agent in self.agents.items():
+            by_version: Dict[str, tuple] = {}
+            for i, row_served in enumerate(served):
+                engine = row_served.get(name)
+                if engine is not None:
+                    by_version.setdefault(engine.version, (engine, []))[1].append(i)
+            for engine, positions in by_version.values():
+                self._add(name, agent, engine, X[positions])
+
+    def _add(self, name: str, agent, engine: CompiledEngine, X: np.ndarray):
+        with self._lock:
+            stats = self._stats[name].get(engine.version)
+            texts = stats.rules if stats is not None else None
+        if texts is None:
+            # текст правил берётся из конфига; строки старой версии, которой ещё нет в профиле, не учитываются
+            config = agent.config
+            if config_version(config) != engine.version:
+                logger.debug(f"[RULES] {name}: no rule texts for version {engine.version}, {len(X)} row(s) skipped")
+                return
+            texts = rule_texts(config)
+        try:
+            batch = RuleStats(texts, self.min_strength)
+            batch.add(engine, X[:, [INPUT_FIELDS.index(field) for field in engine.input_names]])
+        except Exception as e:
+            logger.warning(f"[RULES] {name}: profiling skipped: {e}")
+            return
+        with self._lock:
+            versions = self._stats[name]
+            stats = versions.get(engine.version)
+            if stats is None:
+                versions[engine.version] = batch
+                while len(versions) > self.max_versions:
+                    versions.popitem(last=False)
+                return
+            versions.move_to_end(engine.version)
+            stats.rows += batch.rows
+            stats.hits += batch.hits
+            stats.effective += batch.effective
+            stats.strength_sum += batch.strength_sum
+            stats.strength_max = np.maximum(stats.strength_max, batch.strength_max)
+            stats.share_sum += batch.share_sum
+
+    def snapshot(self, agent: str, version: str) -> Optional[RuleStats]:
+        with self._lock:
+            stats = self._stats[agent].get(version)
+            return copy.deepcopy(stats) if stats is not None else None
+
+    def versions(self, agent: str) -> Dict[str, int]:
+        with self._lock:
+            return {version: stats.rows for version, stats in self._stats[agent].items()}
+
+
+def _with_rules(config: Dict, keep: List[int]) -> Dict:
+    texts = rule_texts(config)
+    pruned = copy.deepcopy(config)
+    pruned["rules"] = [texts[i] for i in keep]
+    return pruned
+
+
+def prune_rules(config: Dict, X: np.ndarray, target: np.ndarray, max_mae_increase: float = 0.5,
+                min_strength: float = 0.05, seed: int = 0) -> Dict:
+    """
+    Жадное прореживание: правила перебираются от меньшего вклада на истории к большему, правило
+    удаляется, если MAE против факта выросла не больше чем на max_mae_increase относительно полной базы
+    и не появилось входов без сработавших правил - ни в истории, ни на случайной сетке универсумов.
+    X - входы в порядке INPUT_FIELDS, target - факт.
+    """
+    engine = compile_config(config)
+    columns = [INPUT_FIELDS.index(name) for name in engine.input_names]
+    X = X[:, columns]
+    unique, inverse = np.unique(X, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    stats = RuleStats(rule_texts(config), min_strength)
+    stats.add(engine, X)
+
+    universes = np.array([config["universes"][name] for name in engine.input_names], dtype=np.float64)
+    lows, highs, steps = universes[:, 0], universes[:, 1], universes[:, 2]
+    rng = np.random.default_rng(seed)
+    grid = lows + rng.integers(0, np.floor((highs - lows) / steps) + 1, size=(COVERAGE_SAMPLES, len(lows))) * steps
+    probe = np.vstack([unique, grid])
+
+    def evaluate(candidate: CompiledEngine) -> tuple:
+        predicted = candidate.evaluate_batch(probe)
+        return predicted[:len(unique)][inverse], int(np.count_nonzero(np.isnan(predicted)))
+
+    full_pred, full_undefined = evaluate(engine)
+    full = score(full_pred, target)
+    kept = list(range(len(engine.rules)))
+    removed = []
+    current, current_pred = full, full_pred
+    for index in np.argsort(stats.contribution(), kind="stable"):
+        trial = [i for i in kept if i != index]
+        if not trial:
+            break
+        candidate = compile_config(_with_rules(config, trial))
+        predicted, undefined = evaluate(candidate)
+        metrics = score(predicted, target)
+        if undefined <= full_undefined and metrics["mae"] - full["mae"] <= max_mae_increase:
+            kept, current, current_pred = trial, metrics, predicted
+            removed.append(int(index))
+
+    pruned_config = _with_rules(config, kept)
+    pruned = compile_config(pruned_config)
+    profile = stats.summary()
+    changed = np.abs(current_pred - full_pred)
+    changed = changed[np.isfinite(changed)]
+    return {
+        "config": pruned_config,
+        "rows": int(len(target)),
+        "rules_before": len(engine.rules),
+        "rules_after": len(kept),
+        "removed": [profile[i] for i in removed],
+        "profile": profile,
+        "accuracy": {"full": full, "pruned": current},
+        "prediction_change": {
+            "mean_abs": float(changed.mean()) if changed.size else 0.0,
+            "max_abs": float(changed.max()) if changed.size else 0.0
+        },
+        "latency_us": {"full": latency_us(engine, grid), "pruned": latency_us(pruned, grid)}
+    }
@@ -9,6 +9,26 @@ class TaskInput(BaseModel):
     team_expertise: float
     requirement_uncertainty_pct: float
     task_type: str = "feature"
+    team_id: Optional[str] = Field(None, max_length=100, description="Команда/проект: её конфиги агентов, если заданы")
+
+class EvaluateBatchRequest(BaseModel):
+    items: List[TaskInput] = Field(min_length=1, max_length=1000)
+
+class EvaluateRecord(BaseModel):
+    """Результат, посчитанный встроенной оценкой (scoring.EmbeddedScorer), - только для записи"""
+    task_id: str
+    code_changes_lines: float
+    dependencies_count: float
+    team_expertise: float
+    requirement_uncertainty_pct: float
+    task_type: str = "feature"
+    complexity_score: float = Field(ge=0, le=100)
+    risk_score: float = Field(ge=0, le=100)
+    evaluated_at: Optional[datetime] = None
+    versions: Dict[str, str] = Field(default_factory=dict, description="Версии конфигов, которыми посчитан результат")
+
+class EvaluateRecordsRequest(BaseModel):
+    items: List[EvaluateRecord] = Field(min_length=1, max_length=10000)
 
 class TaskOutput(BaseModel):
     task_id: str
@@ -29,9 +49,50 @@ class FeedbackInput(BaseModel):
     actual_effort_hours: Optional[float] = Field(default=None, ge=0, le=500)
     actual_risk_score: Optional[float] = Field(default=None, ge=0, le=100)
 
+class FeedbackBatchItem(BaseModel):
+    """Фактические значения по уже оценённой задаче (входы и предсказания берутся из evaluate_results)"""
+    task_id: str
+    actual_effort_hours: Optional[float] = Field(default=None, ge=0, le=500)
+    actual_risk_score: Optional[float] = Field(default=None, ge=0, le=100)
+    user_rating: Optional[str] = Field(default=None, max_length=20)
+
+class FeedbackBatchRequest(BaseModel):
+    items: List[FeedbackBatchItem] = Field(min_length=1, max_length=10000)
+
+class FeedbackBatchResponse(BaseModel):
+    status: Literal["feedback_saved"]
+    received: int
+    saved: int
+    unknown_task_ids: List[str]
+    total_samples: int
+
 class ConfigImportRequest(BaseModel):
     config: Dict[str, Any]
 
+class BacktestRequest(BaseModel):
+    agent: Literal["effort", "risk"]
+    config: Dict[str, Any] = Field(..., description="Конфиг-кандидат в формате /config/import")
+    since: Optional[datetime] = Field(None, description="Начало периода по времени фидбэка (включительно)")
+    until: Optional[datetime] = Field(None, description="Конец периода (не включительно)")
+    task_types: Optional[List[str]] = None
+    bucket: Literal["day", "week", "month"] = "month"
+
+class TskFitRequest(BaseModel):
+    """Подгонка TSK-модели под текущий Mamdani-конфиг агента (см. tsk.fit_tsk)"""
+    agent: Literal["effort", "risk"]
+    order: Literal["constant", "linear"] = "linear"
+    samples: int = Field(20000, ge=1000, le=200000, description="Точек на сетке универсумов входов")
+    seed: Optional[int] = None
+    shadow: bool = Field(False, description="Сразу поставить результат на теневую оценку (/shadow)")
+
+class RulePruneRequest(BaseModel):
+    """Прореживание базы правил агента на истории с фидбэком за [since, until)"""
+    max_mae_increase: float = Field(0.5, ge=0, le=100, description="Допустимый рост MAE против полной базы")
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    task_types: Optional[List[str]] = None
+    shadow: bool = Field(False, description="Поставить прореженный конфиг на теневую оценку (/shadow)")
+
 class AgentMetrics(BaseModel):
     mae: float
     rmse: float
@@ -73,6 +134,7 @@ class SyntheticFeedbackRequest(BaseModel):
     inflation_min: float = Field(1.2, ge=1.0, le=2.0, description="Минимальный множитель завышения")
     inflation_max: float = Field(1.3, ge=1.0, le=2.0, description="Максимальный множитель завышения")
     dry_run: bool = Field(False, description="Если True — только подсчёт, без записи в БД")
+    seed: Optional[int] = Field(None, description="Зерно для воспроизводимых значений. Если None — случайные")
 
 class OptimizationRequest(BaseModel):
     agent: Literal["effort", "risk", "all"] = Field(
@@ -126,4 +188,25 @@ class OptimizationResponse(BaseModel):
     agents_processed: int
     success_count: int
     results: Dict[str, AgentOptimizationResult]
-    checkpoint_updated: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    checkpoint_updated: Optional[Dict[str, Any]] = None
+
+class EvaluateHistoryPage(BaseModel):
+    """Страница GET /evaluate/history; next_cursor передаётся в cursor для следующей страницы"""
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class SweepAxis(BaseModel):
+    field: Literal["code_changes_lines", "dependencies_count", "team_expertise", "requirement_uncertainty_pct"]
+    start: float
+    stop: float
+    step: float = Field(..., gt=0)
+
+class SweepRequest(BaseModel):
+    """Базовая точка (как в /evaluate, без task_id) и одна-две оси, по которым она варьируется"""
+    code_changes_lines: float
+    dependencies_count: float
+    team_expertise: float
+    requirement_uncertainty_pct: float
+    task_type: str = "feature"
+    team_id: Optional[str] = Field(None, max_length=100)
+    axes: List[SweepAxis] = Field(..., min_length=1, max_length=2)
@@ -0,0 +1,299 @@
+# scoring.py
+"""
+Встраиваемая оценка задач: воркеры держат скомпилированные движки агентов в памяти процесса
+и считают то же, что /evaluate, без HTTP на каждую задачу.
+
+Движки берутся из сервиса (HttpEngineSource: GET /engine/versions и GET /engine/{agent} -
+CompiledEngine.to_payload, для работы нужен только numpy) или прямо из БД (DatabaseEngineSource:
+активные конфиги agent_configs / team_agent_configs, компиляция через engine.compile_config -
+нужны зависимости сервиса). Версии сверяются не чаще refresh_interval секунд, движок
+перезагружается только при смене версии. В сервис уходит только запись результатов
+(POST /evaluate/records) - пачками, в фоне, вне горячего пути.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+from loguru import logger
+from inference import CompiledEngine
+from knowledge import TASK_TYPE_WEIGHTS, MITIGATION_STRATEGIES, risk_category
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+AGENTS = ("effort", "risk")
+
+
+class HttpEngineSource:
+    """
+    Движки и запись результатов через HTTP API сервиса (одна keep-alive сессия).
+    session - чужая сессия (например, FuzzyLogicClient), её закрывает владелец
+    """
+
+    def __init__(self, base_url: str, team_id: Optional[str] = None, timeout: float = 10.0,
+                 session: Optional["aiohttp.ClientSession"] = None):
+        if aiohttp is None:
+            raise RuntimeError("HttpEngineSource requires aiohttp")
+        self.base_url = base_url.rstrip("/")
+        self.params = {"team_id": team_id} if team_id else {}
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = session
+        self._owns_session = session is None
+
+    def _client(self) -> "aiohttp.ClientSession":
+        if self._owns_session and (self._session is None or self._session.closed):
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def versions(self) -> Dict[str, str]:
+        async with self._client().get(f"{self.base_url}/engine/versions", params=self.params,
+                                      timeout=self.timeout) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def engine(self, agent: str) -> CompiledEngine:
+        # массивы движка в MessagePack заметно короче JSON (см. wire.py)
+        headers = {"Accept": "application/msgpack"} if msgpack is not None else None
+        async with self._client().get(f"{self.base_url}/engine/{agent}", params=self.params, headers=headers,
+                                      timeout=self.timeout) as response:
+            response.raise_for_status()
+            if response.content_type == "application/msgpack":
+                body = msgpack.unpackb(await response.read(), raw=False)
+            else:
+                body = await response.json()
+            return CompiledEngine.from_payload(body["engine"])
+
+    async def save_records(self, records: List[Dict]) -> Dict:
+        async with self._client().post(f"{self.base_url}/evaluate/records", json={"items": records},
+                                       timeout=self.timeout) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def close(self):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class DatabaseEngineSource:
+    """Активные конфиги из БД сервиса; конфиг команды, если задан, важнее общего"""
+
+    VERSIONS_QUERY = """
+        SELECT a.agent, COALESCE(t.version, a.version), COALESCE(t.config, a.config)
+        FROM agent_configs a
+        LEFT JOIN team_agent_configs t ON t.agent = a.agent AND t.team_id = %s
+        WHERE a.is_active
+    """
+
+    def __init__(self, dsn: str, team_id: Optional[str] = None):
+        if psycopg2 is None:
+            raise RuntimeError("DatabaseEngineSource requires psycopg2")
+        self.dsn = dsn
+        self.team_id = team_id
+
+    def _fetch(self) -> Dict[str, tuple]:
+        conn = psycopg2.connect(self.dsn)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.VERSIONS_QUERY, (self.team_id,))
+            rows = cursor.fetchall()
+            cursor.close()
+            return {agent: (version, config) for agent, version, config in rows}
+        finally:
+            conn.close()
+
+    async def versions(self) -> Dict[str, str]:
+        return {agent: version for agent, (version, _) in (await asyncio.to_thread(self._fetch)).items()}
+
+    async def engine(self, agent: str) -> CompiledEngine:
+        from engine import compile_config
+        configs = await asyncio.to_thread(self._fetch)
+        if agent not in configs:
+            raise LookupError(f"No active config for {agent}")
+        return compile_config(configs[agent][1])
+
+
+class EmbeddedScorer:
+    """
+    Локальная оценка задач с кэшем движков по версиям.
+
+    source - откуда брать движки (HttpEngineSource или DatabaseEngineSource), persist - куда писать
+    результаты (HttpEngineSource; None - не писать). Если сервис/БД недоступны при сверке версий,
+    оценка продолжается на закэшированных движках.
+    """
+
+    def __init__(self, source, persist: Optional[HttpEngineSource] = None, refresh_interval: float = 30.0,
+                 flush_size: int = 100, flush_interval: float = 1.0, max_pending: int = 10000):
+        self.source = source
+        self.persist = persist
+        self.refresh_interval = refresh_interval
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.engines: Dict[str, CompiledEngine] = {}
+        # версии, которые сообщил источник (с ними и сверяемся)
+        self._versions: Dict[str, str] = {}
+        self._checked_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+        self._pending: List[Dict] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"scored": 0, "reloads": 0, "refresh_errors": 0, "persisted": 0, "persist_errors": 0, "dropped": 0}
+
+    async def start(self):
+        await self.refresh(force=True)
+        if self.persist is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"[EMBEDDED] Final flush failed, {len(self._pending)} evaluate records lost: {e}")
+        for source in {id(s): s for s in (self.source, self.persist) if s is not None}.values():
+            close = getattr(source, "close", None)
+            if close is not None:
+                await close()
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Сверяет версии и перезагружает сменившиеся движки. True - что-то перезагружено"""
+        if not force and time.monotonic() - self._checked_at < self.refresh_interval and self.engines:
+            return False
+        async with self._refresh_lock:
+            if not force and time.monotonic() - self._checked_at < self.refresh_interval and self.engines:
+                return False
+            reloaded = False
+            try:
+                versions = await self.source.versions()
+                for agent in AGENTS:
+                    if agent in versions and self._versions.get(agent) != versions[agent]:
+                        self.engines[agent] = await self.source.engine(agent)
+                        self._versions[agent] = versions[agent]
+                        self._stats["reloads"] += 1
+                        reloaded = True
+                        logger.info(f"[EMBEDDED] {agent}: loaded config version {self.engines[agent].version}")
+            except Exception as e:
+                self._stats["refresh_errors"] += 1
+                if not all(agent in self.engines for agent in AGENTS):
+                    raise
+                logger.warning(f"[EMBEDDED] Version check failed, scoring with cached engines: {e}")
+            self._checked_at = time.monotonic()
+            return reloaded
+
+    def score(self, task_id: str, code_changes_lines: float, dependencies_count: float,
+              team_expertise: float, requirement_uncertainty_pct: float, task_type: str = "feature") -> Dict:
+        """То же, что ответ /evaluate; ValueError, если ни одно правило не сработало"""
+        inputs = {
+            "volume": code_changes_lines,
+            "dependencies": dependencies_count,
+            "expertise": team_expertise,
+            "uncertainty": requirement_uncertainty_pct
+        }
+        complexity_pred = self.engines["effort"].evaluate(inputs)
+        risk_pred = self.engines["risk"].evaluate(inputs)
+        if np.isnan(complexity_pred) or np.isnan(risk_pred):
+            raise ValueError(f"Crisp output cannot be calculated for task '{task_id}': no rules fired")
+        weight = TASK_TYPE_WEIGHTS.get(task_type, 1.0)
+        complexity = float(np.clip(complexity_pred * weight, 0, 100))
+        risk = float(np.clip(risk_pred * weight, 0, 100))
+        category = risk_category(risk)
+        evaluated_at = datetime.utcnow()
+        self._stats["scored"] += 1
+        if self.persist is not None:
+            self._enqueue({
+                "task_id": task_id,
+                "code_changes_lines": code_changes_lines,
+                "dependencies_count": dependencies_count,
+                "team_expertise": team_expertise,
+                "requirement_uncertainty_pct": requirement_uncertainty_pct,
+                "task_type": task_type,
+                "complexity_score": complexity,
+                "risk_score": risk,
+                "evaluated_at": evaluated_at.isoformat(),
+                "versions": dict(self._versions)
+            })
+        return {
+            "task_id": task_id,
+            "complexity_score": round(complexity, 2),
+            "risk_score": round(risk, 2),
+            "risk_category": category,
+            "mitigation_strategies": MITIGATION_STRATEGIES[category],
+            "evaluated_at": evaluated_at.isoformat()
+        }
+
+    async def evaluate_task(self, task_id: str, code_changes_lines: float, dependencies_count: float,
+                            team_expertise: float, requirement_uncertainty_pct: float,
+                            task_type: str = "feature") -> Dict:
+        """Сверка версий (не чаще refresh_interval) и локальная оценка"""
+        await self.refresh()
+        return self.score(task_id, code_changes_lines, dependencies_count,
+                          team_expertise, requirement_uncertainty_pct, task_type)
+
+    async def flush(self) -> int:
+        """Отправляет накопленные результаты в сервис; при ошибке они остаются в очереди"""
+        if self.persist is None or not self._pending:
+            return 0
+        # пачка забирается из очереди до отправки: _enqueue во время ожидания может вытеснять старые записи
+        limit = self.flush_size * 10
+        batch, self._pending = self._pending[:limit], self._pending[limit:]
+        try:
+            await self.persist.save_records(batch)
+        except Exception:
+            self._stats["persist_errors"] += 1
+            self._pending[:0] = batch
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                del self._pending[:overflow]
+                self._stats["dropped"] += overflow
+            raise
+        self._stats["persisted"] += len(batch)
+        return len(batch)
+
+    def stats(self) -> Dict:
+        return {
+            **self._stats,
+            "pending": len(self._pending),
+            "versions": dict(self._versions)
+        }
+
+    def _enqueue(self, record: Dict):
+        if len(self._pending) >= self.max_pending:
+            # сервис долго недоступен: старые записи теряются, оценка не блокируется
+            self._pending.pop(0)
+            self._stats["dropped"] += 1
+        self._pending.append(record)
+        if len(self._pending) >= self.flush_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while self._pending:
+                    await self.flush()
+            except Exception as e:
+                logger.error(f"[EMBEDDED] Persist failed, {len(self._pending)} records kept for retry: {e}")
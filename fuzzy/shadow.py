@@ -0,0 +1,76 @@
+# shadow.py
+import threading
+from typing import Dict, List, Sequence
+import numpy as np
+from loguru import logger
+from engine import compile_config
+from inference import CompiledEngine, INPUT_FIELDS
+from knowledge import TASK_TYPE_WEIGHTS
+
+# Положение входов и типа задачи в строке queries.EVALUATE_ROW_COLUMNS
+_INPUTS = slice(1, 1 + len(INPUT_FIELDS))
+_TASK_TYPE = 1 + len(INPUT_FIELDS)
+
+
+class ShadowRegistry:
+    """
+    Конфиги-кандидаты агентов на теневой оценке.
+
+    Кандидаты считают те же задачи, что и live-конфиг, но их выход не возвращается клиенту,
+    а сохраняется в shadow_predictions - когда по задаче придёт фидбэк, точность кандидата
+    сравнивается с live (queries.shadow_accuracy_query). Предсказания считаются по готовым
+    строкам evaluate_results: при write-behind - на сбросе буфера, одним evaluate_batch
+    на кандидата по всей пачке.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines: Dict[str, Dict[str, CompiledEngine]] = {}
+
+    def __bool__(self) -> bool:
+        with self._lock:
+            return any(self._engines.values())
+
+    def replace(self, agent: str, configs: Dict[str, Dict]):
+        """Заменяет кандидатов агента ({version: config}, см. FuzzyStateRepository.get_shadow_configs)"""
+        engines = {}
+        for version, config in configs.items():
+            try:
+                engines[version] = compile_config(config)
+            except Exception as e:
+                logger.error(f"[SHADOW] {agent}: candidate {version} failed to compile, skipped: {e}")
+        with self._lock:
+            self._engines[agent] = engines
+        logger.info(f"[SHADOW] {agent}: {len(engines)} candidate(s) on shadow evaluation")
+
+    def versions(self, agent: str) -> List[str]:
+        with self._lock:
+            return list(self._engines.get(agent, {}))
+
+    def score(self, rows: Sequence[tuple], served: Sequence[Dict[str, CompiledEngine]]) -> List[tuple]:
+        """
+        Предсказания всех кандидатов для строк queries.EVALUATE_ROW_COLUMNS в строках
+        queries.SHADOW_PREDICTION_COLUMNS. Вес типа задачи и обрезка до 0-100 - как у live в /evaluate.
+        served - общие движки, посчитавшие каждую строку: кандидаты агента считают только строки, где live
+        дал общий конфиг агента (не конфиг команды), иначе shadow_accuracy_query сравнил бы разные модели
+        """
+        with self._lock:
+            engines = {agent: dict(candidates) for agent, candidates in self._engines.items() if candidates}
+        if not rows or not engines:
+            return []
+        X = np.array([row[_INPUTS] for row in rows], dtype=np.float64)
+        weights = np.array([TASK_TYPE_WEIGHTS.get(row[_TASK_TYPE], 1.0) for row in rows])
+        task_ids = [row[0] for row in rows]
+        shadow_rows = []
+        for agent, candidates in engines.items():
+            shared = np.array([agent in row_served for row_served in served], dtype=bool)
+            if not shared.any():
+                continue
+            agent_ids = [task_id for task_id, keep in zip(task_ids, shared) if keep]
+            for version, engine in candidates.items():
+                predicted = np.clip(engine.evaluate_batch(X[shared], columns=INPUT_FIELDS) * weights[shared], 0, 100)
+                shadow_rows.extend(
+                    (task_id, agent, version, None if np.isnan(value) else value)
+                    for task_id, value in zip(agent_ids, predicted.tolist())
+                )
+        return shadow_rows
@@ -0,0 +1,128 @@
+import os
+import re
+import glob
+import json
+import time
+import tempfile
+import numpy as np
+from typing import Dict, Optional, Tuple
+from loguru import logger
+from inference import CompiledEngine
+
+
+def default_shared_dir(namespace: Optional[str] = None) -> str:
+    """
+    Каталог в /dev/shm. namespace (например, адрес БД сервиса) разводит указатели {name}.current
+    разных развёртываний на одном хосте
+    """
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    if not namespace:
+        return os.path.join(base, "fuzzy-engines")
+    return os.path.join(base, "fuzzy-engines-" + re.sub(r"[^A-Za-z0-9_.-]+", "_", namespace).strip("_"))
+
+
+class SharedEngineStore:
+    """
+    Хранилище скомпилированных движков в memory-mapped файлах (по умолчанию в /dev/shm).
+
+    Каждая версия конфига - отдельный неизменяемый сегмент {name}-{version}.bin
+    с описанием {name}-{version}.json. Текущая версия указана в {name}.current,
+    который подменяется атомарно через os.replace. Все воркеры мапят один и тот же
+    сегмент только на чтение, поэтому массивы лежат в памяти в одном экземпляре.
+    """
+
+    def __init__(self, directory: Optional[str] = None, refresh_interval: float = 1.0, keep_versions: int = 2,
+                 namespace: Optional[str] = None):
+        self.directory = directory or default_shared_dir(namespace)
+        self.refresh_interval = refresh_interval
+        self.keep_versions = keep_versions
+        self._checked: Dict[str, Tuple[float, Optional[str]]] = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _base(self, name: str, version: str) -> str:
+        return os.path.join(self.directory, f"{name}-{version}")
+
+    def _pointer(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.current")
+
+    def _atomic_write(self, path: str, data: bytes):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def publish(self, name: str, engine: CompiledEngine, config: Dict) -> str:
+        """Записывает сегмент версии (если его ещё нет) и делает его текущим"""
+        version = engine.version
+        base = self._base(name, version)
+        if not os.path.exists(base + ".json"):
+            layout = {}
+            offset = 0
+            chunks = []
+            for key, arr in engine.arrays.items():
+                arr = np.ascontiguousarray(arr)
+                layout[key] = {"offset": offset, "shape": list(arr.shape), "dtype": arr.dtype.str}
+                chunks.append(arr.tobytes())
+                # выравниваем следующий массив по 8 байт
+                pad = (-arr.nbytes) % 8
+                chunks.append(b"\0" * pad)
+                offset += arr.nbytes + pad
+            self._atomic_write(base + ".bin", b"".join(chunks))
+            header = {"layout": layout, "meta": engine.meta, "config": config}
+            self._atomic_write(base + ".json", json.dumps(header, ensure_ascii=False).encode("utf-8"))
+            logger.info(f"[SHM] {name}: published version {version} ({offset} bytes)")
+
+        self._atomic_write(self._pointer(name), version.encode("ascii"))
+        self._checked[name] = (time.monotonic(), version)
+        self._cleanup(name, version)
+        return version
+
+    def _read_pointer(self, name: str) -> Optional[str]:
+        try:
+            with open(self._pointer(name), "r", encoding="ascii") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current_version(self, name: str) -> Optional[str]:
+        """Текущая версия; файл-указатель перечитывается не чаще refresh_interval"""
+        now = time.monotonic()
+        cached = self._checked.get(name)
+        if cached and now - cached[0] < self.refresh_interval:
+            return cached[1]
+        version = self._read_pointer(name)
+        self._checked[name] = (now, version)
+        return version
+
+    def attach(self, name: str) -> Optional[Tuple[CompiledEngine, Dict]]:
+        """Мапит текущий сегмент только на чтение; возвращает (движок, конфиг)"""
+        version = self._read_pointer(name)
+        if version is None:
+            return None
+        base = self._base(name, version)
+        try:
+            with open(base + ".json", "r", encoding="utf-8") as f:
+                header = json.load(f)
+            buffer = np.memmap(base + ".bin", dtype=np.uint8, mode="r")
+        except FileNotFoundError:
+            logger.warning(f"[SHM] {name}: segment {version} disappeared before attach")
+            return None
+        arrays = {
+            key: np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]), buffer=buffer, offset=spec["offset"])
+            for key, spec in header["layout"].items()
+        }
+        self._checked[name] = (time.monotonic(), version)
+        return CompiledEngine(arrays, header["meta"]), header["config"]
+
+    def _cleanup(self, name: str, current: str):
+        """Удаляет старые сегменты; уже смапленные воркерами остаются валидными до unmap"""
+        segments = sorted(glob.glob(os.path.join(self.directory, f"{name}-*.json")), key=os.path.getmtime, reverse=True)
+        for path in segments[self.keep_versions:]:
+            base = path[:-len(".json")]
+            if base == self._base(name, current):
+                continue
+            for suffix in (".json", ".bin"):
+                try:
+                    os.remove(base + suffix)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,143 @@
+# similarity.py
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from loguru import logger
+from scipy.spatial import cKDTree
+from inference import INPUT_FIELDS
+
+
+class SimilarTaskIndex:
+    """
+    Ближайшие исторические задачи в пространстве входов (INPUT_FIELDS), нормированных на диапазоны универсумов.
+
+    cKDTree неизменяем, поэтому новые оценки копятся в «хвосте», который просматривается перебором.
+    Когда хвост больше rebuild_fraction от дерева (и не меньше min_rebuild строк), дерево
+    пересобирается вместе с хвостом в фоновом потоке. Повторная оценка задачи оставляет старую точку
+    до полной перезагрузки из БД (load) - в выдаче task_id не повторяются.
+    """
+
+    def __init__(self, ranges: Dict[str, Sequence[float]], min_rebuild: int = 1000, rebuild_fraction: float = 0.05):
+        self._lower = np.array([ranges[name][0] for name in INPUT_FIELDS], dtype=np.float64)
+        scale = np.array([ranges[name][1] - ranges[name][0] for name in INPUT_FIELDS], dtype=np.float64)
+        self._scale = np.where(scale > 0, scale, 1.0)
+        self.min_rebuild = min_rebuild
+        self.rebuild_fraction = rebuild_fraction
+        self.ready = False
+        self._lock = threading.Lock()
+        self._tree: Optional[cKDTree] = None
+        self._tree_ids = np.empty(0, dtype=object)
+        self._tail_points: List[np.ndarray] = []
+        self._tail_ids: List[str] = []
+        self._rebuilding = False
+        self._stats = {"loads": 0, "rebuilds": 0, "last_build_ms": 0.0}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return (self._tree.n if self._tree is not None else 0) + len(self._tail_ids)
+
+    def normalize(self, X: np.ndarray) -> np.ndarray:
+        return (np.asarray(X, dtype=np.float64) - self._lower) / self._scale
+
+    def load(self, chunks: Iterable[Tuple[Sequence[str], np.ndarray]]):
+        """
+        Полная перестройка по пачкам (task_ids, входы (n, 4)) из БД.
+        Из хвоста убираются задачи, попавшие в загрузку; остальные (оценённые во время загрузки
+        или ещё не записанные в БД) остаются до следующей пересборки
+        """
+        started = time.perf_counter()
+        ids, points = [], []
+        for chunk_ids, chunk_points in chunks:
+            ids.append(np.asarray(chunk_ids, dtype=object))
+            points.append(self.normalize(chunk_points))
+        tree_ids = np.concatenate(ids) if ids else np.empty(0, dtype=object)
+        tree = cKDTree(np.concatenate(points)) if points else None
+        loaded = set(tree_ids.tolist())
+        with self._lock:
+            self._tree, self._tree_ids = tree, tree_ids
+            keep = [i for i, task_id in enumerate(self._tail_ids) if task_id not in loaded]
+            self._tail_points = [self._tail_points[i] for i in keep]
+            self._tail_ids = [self._tail_ids[i] for i in keep]
+            self.ready = True
+            self._stats["loads"] += 1
+            self._stats["last_build_ms"] = (time.perf_counter() - started) * 1000
+        logger.info(f"[SIMILAR] Index loaded: {len(tree_ids)} tasks in {self._stats['last_build_ms']:.0f} ms")
+
+    def add(self, task_id: str, inputs: Dict[str, float]):
+        """Добавляет новую оценку; при большом хвосте запускает фоновую пересборку дерева"""
+        point = self.normalize([inputs[name] for name in INPUT_FIELDS])
+        with self._lock:
+            self._tail_points.append(point)
+            self._tail_ids.append(task_id)
+            tree_size = self._tree.n if self._tree is not None else 0
+            start = (not self._rebuilding
+                     and len(self._tail_ids) >= max(self.min_rebuild, tree_size * self.rebuild_fraction))
+            if start:
+                self._rebuilding = True
+        if start:
+            threading.Thread(target=self._merge_tail, name="similar-index-rebuild", daemon=True).start()
+
+    def query(self, inputs: Sequence[float], k: int, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """До k пар (task_id, расстояние в нормированном пространстве), ближайшие первыми"""
+        x = self.normalize(inputs)
+        with self._lock:
+            tree, tree_ids = self._tree, self._tree_ids
+            tail_points = np.array(self._tail_points) if self._tail_points else None
+            tail_ids = list(self._tail_ids)
+        # запас на собственную точку и устаревшие дубликаты задачи
+        wanted = 2 * k + 1
+        candidates = []
+        if tree is not None and tree.n:
+            dist, idx = tree.query(x, k=min(wanted, tree.n))
+            dist, idx = np.atleast_1d(dist), np.atleast_1d(idx)
+            candidates += zip(tree_ids[idx].tolist(), dist.tolist())
+        if tail_points is not None:
+            dist = np.linalg.norm(tail_points - x, axis=1)
+            nearest = np.argsort(dist)[:wanted]
+            candidates += zip((tail_ids[i] for i in nearest), dist[nearest].tolist())
+        candidates.sort(key=lambda item: item[1])
+        result, seen = [], {exclude}
+        for task_id, distance in candidates:
+            if task_id in seen:
+                continue
+            seen.add(task_id)
+            result.append((task_id, distance))
+            if len(result) == k:
+                break
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "last_build_ms": round(self._stats["last_build_ms"], 3),
+                "ready": self.ready,
+                "tree_size": self._tree.n if self._tree is not None else 0,
+                "tail_size": len(self._tail_ids),
+            }
+
+    def _merge_tail(self):
+        try:
+            started = time.perf_counter()
+            with self._lock:
+                tree, tree_ids = self._tree, self._tree_ids
+                merged = len(self._tail_ids)
+                tail_points = np.array(self._tail_points[:merged])
+                tail_ids = np.array(self._tail_ids[:merged], dtype=object)
+            points = tail_points if tree is None else np.vstack([tree.data, tail_points])
+            new_tree = cKDTree(points)
+            with self._lock:
+                # load() мог заменить дерево, пока строилось новое - тогда хвост вольётся в следующий раз
+                if self._tree is tree:
+                    self._tree = new_tree
+                    self._tree_ids = np.concatenate([tree_ids, tail_ids])
+                    del self._tail_points[:merged]
+                    del self._tail_ids[:merged]
+                    self._stats["rebuilds"] += 1
+                    self._stats["last_build_ms"] = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            logger.error(f"[SIMILAR] Index rebuild failed: {e}")
+        finally:
+            with self._lock:
+                self._rebuilding = False
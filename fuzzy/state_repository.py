@@ -0,0 +1,379 @@
+# state_repository.py
+import json
+import select
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import psycopg2
+from loguru import logger
+from database import DatabaseConnection, DatabaseConfig
+from inference import config_version
+
+STATE_CHANNEL = "fuzzy_state"
+
+
+class FuzzyStateRepository:
+    """Общее состояние реплик fuzzy-сервиса: версии конфигов и чекпоинт оптимизации"""
+
+    def __init__(self, connection: DatabaseConnection, default_threshold: int = 50):
+        self.connection = connection
+        self.default_threshold = default_threshold
+        self._ensure_tables()
+
+    def _ensure_tables(self):
+        """Создание таблиц agent_configs, team_agent_configs и optimizer_checkpoint"""
+        try:
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS agent_configs (
+                        id SERIAL PRIMARY KEY,
+                        agent VARCHAR(50) NOT NULL,
+                        version VARCHAR(32) NOT NULL,
+                        config JSONB NOT NULL,
+                        is_active BOOLEAN NOT NULL DEFAULT FALSE,
+                        source VARCHAR(50),
+                        created_at TIMESTAMP DEFAULT NOW(),
+                        UNIQUE (agent, version)
+                    );
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_agent_configs_active
+                        ON agent_configs(agent) WHERE is_active;
+                    ALTER TABLE agent_configs ADD COLUMN IF NOT EXISTS is_shadow BOOLEAN NOT NULL DEFAULT FALSE;
+                """)
+                # Конфиги агентов по командам (проектам): только текущий, история - не нужна
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS team_agent_configs (
+                        team_id VARCHAR(100) NOT NULL,
+                        agent VARCHAR(50) NOT NULL,
+                        version VARCHAR(32) NOT NULL,
+                        config JSONB NOT NULL,
+                        source VARCHAR(50),
+                        updated_at TIMESTAMP DEFAULT NOW(),
+                        PRIMARY KEY (team_id, agent)
+                    );
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS optimizer_checkpoint (
+                        agent VARCHAR(50) PRIMARY KEY,
+                        last_count INTEGER NOT NULL DEFAULT 0,
+                        threshold INTEGER NOT NULL,
+                        updated_at TIMESTAMP DEFAULT NOW()
+                    );
+                """)
+                conn.commit()
+                cursor.close()
+                logger.info("Tables agent_configs, team_agent_configs and optimizer_checkpoint ensured")
+        except Exception as e:
+            logger.error(f"Failed to ensure state tables: {e}")
+            raise
+
+    def get_active_config(self, agent: str) -> Optional[Dict]:
+        """Активный конфиг агента или None, если в БД его ещё нет"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT config FROM agent_configs WHERE agent = %s AND is_active", (agent,))
+            row = cursor.fetchone()
+            cursor.close()
+            return row[0] if row else None
+
+    def save_config(self, agent: str, config: Dict, source: str = None, origin: str = None) -> str:
+        """Сохраняет новую версию конфига, делает её активной и оповещает реплики"""
+        version = config_version(config)
+        try:
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE agent_configs SET is_active = FALSE WHERE agent = %s AND is_active", (agent,))
+                cursor.execute("""
+                    INSERT INTO agent_configs (agent, version, config, is_active, source)
+                    VALUES (%s, %s, %s, TRUE, %s)
+                    ON CONFLICT (agent, version) DO UPDATE SET is_active = TRUE, is_shadow = FALSE
+                """, (agent, version, json.dumps(config, ensure_ascii=False), source))
+                self._notify(cursor, {"type": "config", "agent": agent, "version": version, "origin": origin})
+                conn.commit()
+                cursor.close()
+                return version
+        except Exception as e:
+            logger.error(f"Save config for {agent} failed: {e}")
+            raise
+
+    def get_shadow_configs(self, agent: str) -> Dict[str, Dict]:
+        """Конфиги-кандидаты агента на теневой оценке: {version: config}"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT version, config FROM agent_configs WHERE agent = %s AND is_shadow ORDER BY created_at
+            """, (agent,))
+            rows = cursor.fetchall()
+            cursor.close()
+            return dict(rows)
+
+    def list_shadow_configs(self, agent: str) -> List[Dict]:
+        """Кандидаты агента без самих конфигов: [{"version", "source", "created_at"}]"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT version, source, created_at FROM agent_configs
+                WHERE agent = %s AND is_shadow ORDER BY created_at
+            """, (agent,))
+            rows = cursor.fetchall()
+            cursor.close()
+            return [{"version": version, "source": source, "created_at": created_at}
+                    for version, source, created_at in rows]
+
+    def add_shadow_config(self, agent: str, config: Dict, source: str = None, origin: str = None) -> str:
+        """Регистрирует конфиг-кандидат для теневой оценки и оповещает реплики. Активный конфиг не трогает"""
+        version = config_version(config)
+        try:
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO agent_configs (agent, version, config, is_active, is_shadow, source)
+                    VALUES (%s, %s, %s, FALSE, TRUE, %s)
+                    ON CONFLICT (agent, version) DO UPDATE SET is_shadow = NOT agent_configs.is_active
+                """, (agent, version, json.dumps(config, ensure_ascii=False), source))
+                self._notify(cursor, {"type": "shadow", "agent": agent, "version": version, "origin": origin})
+                conn.commit()
+                cursor.close()
+                return version
+        except Exception as e:
+            logger.error(f"Add shadow config for {agent} failed: {e}")
+            raise
+
+    def remove_shadow_config(self, agent: str, version: str, origin: str = None) -> bool:
+        """Снимает кандидата с теневой оценки; False, если такого кандидата нет"""
+        try:
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    UPDATE agent_configs SET is_shadow = FALSE WHERE agent = %s AND version = %s AND is_shadow
+                """, (agent, version))
+                removed = cursor.rowcount > 0
+                if removed:
+                    self._notify(cursor, {"type": "shadow", "agent": agent, "version": version, "origin": origin})
+                conn.commit()
+                cursor.close()
+                return removed
+        except Exception as e:
+            logger.error(f"Remove shadow config for {agent} failed: {e}")
+            raise
+
+    def get_team_config(self, team_id: str, agent: str) -> Optional[Dict]:
+        """Конфиг агента команды или None - тогда команда использует общий конфиг"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT config FROM team_agent_configs WHERE team_id = %s AND agent = %s", (team_id, agent))
+            row = cursor.fetchone()
+            cursor.close()
+            return row[0] if row else None
+
+    def list_team_configs(self, team_id: Optional[str] = None) -> List[Dict]:
+        """Команды со своими конфигами: [{"team_id", "agent", "version", "source", "updated_at"}]"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT team_id, agent, version, source, updated_at FROM team_agent_configs
+                WHERE %(team_id)s::varchar IS NULL OR team_id = %(team_id)s
+                ORDER BY team_id, agent
+            """, {"team_id": team_id})
+            columns = ("team_id", "agent", "version", "source", "updated_at")
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            cursor.close()
+            return rows
+
+    def save_team_config(self, team_id: str, agent: str, config: Dict, source: str = None, origin: str = None) -> str:
+        """Сохраняет конфиг агента команды и оповещает реплики (они сбрасывают закэшированный движок)"""
+        version = config_version(config)
+        try:
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO team_agent_configs (team_id, agent, version, config, source)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (team_id, agent) DO UPDATE SET
+                        version = EXCLUDED.version,
+                        config = EXCLUDED.config,
+                        source = EXCLUDED.source,
+                        updated_at = NOW()
+                """, (team_id, agent, version, json.dumps(config, ensure_ascii=False), source))
+                self._notify(cursor, {"type": "team_config", "team_id": team_id, "agent": agent, "origin": origin})
+                conn.commit()
+                cursor.close()
+                return version
+        except Exception as e:
+            logger.error(f"Save team config for {team_id}/{agent} failed: {e}")
+            raise
+
+    def delete_team_config(self, team_id: str, agent: str, origin: str = None) -> bool:
+        """Удаляет конфиг команды (она возвращается на общий); False, если его не было"""
+        try:
+            with self.connection.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM team_agent_configs WHERE team_id = %s AND agent = %s", (team_id, agent))
+                deleted = cursor.rowcount > 0
+                if deleted:
+                    self._notify(cursor, {"type": "team_config", "team_id": team_id, "agent": agent, "origin": origin})
+                conn.commit()
+                cursor.close()
+                return deleted
+        except Exception as e:
+            logger.error(f"Delete team config for {team_id}/{agent} failed: {e}")
+            raise
+
+    def seed_checkpoint(self, state: Dict):
+        """Заполняет чекпоинт начальными значениями (не перезаписывает существующие)"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            threshold = state.get("threshold", self.default_threshold)
+            for agent in ("effort", "risk"):
+                cursor.execute("""
+                    INSERT INTO optimizer_checkpoint (agent, last_count, threshold)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (agent) DO NOTHING
+                """, (agent, state.get(f"{agent}_last", 0), threshold))
+            conn.commit()
+            cursor.close()
+
+    def get_checkpoint(self) -> Dict:
+        """Чекпоинт в прежнем формате: {"effort_last", "risk_last", "threshold"}"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT agent, last_count, threshold FROM optimizer_checkpoint")
+            rows = cursor.fetchall()
+            cursor.close()
+        state = {"effort_last": 0, "risk_last": 0, "threshold": self.default_threshold}
+        for agent, last_count, threshold in rows:
+            state[f"{agent}_last"] = last_count
+            state["threshold"] = threshold
+        return state
+
+    def claim_optimization(self, agent: str, total: int, min_new: Optional[int] = None,
+                           min_interval: float = 0) -> Optional[int]:
+        """
+        Атомарно забирает пересечение порога: только одна реплика получит предыдущий
+        last_count, остальные - None. Возвращённое значение нужно для release_optimization.
+        min_new - сколько новых фидбэков нужно с прошлой оптимизации (по умолчанию threshold из таблицы),
+        min_interval - сколько секунд должно пройти с прошлой оптимизации на любой реплике
+        (до первой оптимизации не действует)
+        """
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT last_count, threshold, EXTRACT(EPOCH FROM NOW() - updated_at)
+                FROM optimizer_checkpoint WHERE agent = %s FOR UPDATE
+            """, (agent,))
+            row = cursor.fetchone()
+            if row is None or total < row[0] + (row[1] if min_new is None else min_new) \
+                    or (row[0] > 0 and row[2] is not None and row[2] < min_interval):
+                conn.rollback()
+                cursor.close()
+                return None
+            cursor.execute("""
+                UPDATE optimizer_checkpoint SET last_count = %s, updated_at = NOW() WHERE agent = %s
+            """, (total, agent))
+            conn.commit()
+            cursor.close()
+            return row[0]
+
+    def release_optimization(self, agent: str, claimed: int, previous: int):
+        """Откатывает захват, если оптимизация не удалась (и никто не сдвинул счётчик дальше)"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE optimizer_checkpoint SET last_count = %s, updated_at = NOW()
+                WHERE agent = %s AND last_count = %s
+            """, (previous, agent, claimed))
+            conn.commit()
+            cursor.close()
+
+    def set_checkpoint(self, agent: str, last_count: int):
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE optimizer_checkpoint SET last_count = %s, updated_at = NOW() WHERE agent = %s
+            """, (last_count, agent))
+            conn.commit()
+            cursor.close()
+
+    def publish_feedback(self, agent: str, inputs: Dict, predicted: float, target: float, origin: str = None,
+                         observed: Optional[Tuple[float, float]] = None):
+        """
+        Рассылает запись фидбэка репликам, чтобы окно обучения было одинаковым везде.
+        observed - пара (сохранённое предсказание, факт) для метрик точности
+        """
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            self._notify(cursor, {
+                "type": "feedback", "agent": agent, "inputs": inputs,
+                "predicted": predicted, "target": target, "origin": origin,
+                "observed": observed
+            })
+            conn.commit()
+            cursor.close()
+
+    def publish_feedback_reload(self, agent: str, origin: str = None):
+        """Просит реплики перечитать окно фидбэка из БД (после пакетной загрузки)"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            self._notify(cursor, {"type": "feedback_reload", "agent": agent, "origin": origin})
+            conn.commit()
+            cursor.close()
+
+    def publish_accuracy_resync(self, agent: str, origin: str = None):
+        """Просит реплики пересчитать метрики точности агента из БД (фидбэк по задаче перезаписан)"""
+        with self.connection.connection() as conn:
+            cursor = conn.cursor()
+            self._notify(cursor, {"type": "accuracy_resync", "agent": agent, "origin": origin})
+            conn.commit()
+            cursor.close()
+
+    @staticmethod
+    def _notify(cursor, payload: Dict):
+        cursor.execute("SELECT pg_notify(%s, %s)", (STATE_CHANNEL, json.dumps(payload, default=float)))
+
+
+class StateListener(threading.Thread):
+    """Фоновый поток: LISTEN на канале состояния, вызывает handler для событий других реплик"""
+
+    def __init__(self, config: DatabaseConfig, handler: Callable[[Dict], None], origin: str,
+                 channel: str = STATE_CHANNEL, reconnect_delay: float = 5.0):
+        super().__init__(name="fuzzy-state-listener", daemon=True)
+        self.config = config
+        self.handler = handler
+        self.origin = origin
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.config.get_connection_params())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {self.channel}")
+                logger.info(f"[STATE] Listening on '{self.channel}' as {self.origin}")
+                while not self._stop_event.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"[STATE] Listener error, reconnecting in {self.reconnect_delay}s: {e}")
+                time.sleep(self.reconnect_delay)
+            finally:
+                if conn and not conn.closed:
+                    conn.close()
+
+    def _dispatch(self, raw: str):
+        try:
+            event = json.loads(raw)
+            if event.get("origin") == self.origin:
+                return
+            self.handler(event)
+        except Exception as e:
+            logger.error(f"[STATE] Failed to handle event {raw[:200]}: {e}")
@@ -0,0 +1,132 @@
+# team_registry.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from loguru import logger
+from engine import compile_config
+from inference import CompiledEngine
+
+# Объекты Python вокруг массивов движка (meta, списки правил) в nbytes не входят - учитываются оценкой
+ENGINE_OVERHEAD_BYTES = 16 * 1024
+
+
+class TeamEngineRegistry:
+    """
+    Движки агентов по командам (проектам): конфиг команды хранится в БД и компилируется
+    при первом обращении. Скомпилированные движки лежат в LRU, ограниченном по памяти
+    (CompiledEngine.nbytes + ENGINE_OVERHEAD_BYTES): при превышении max_bytes вытесняются
+    давно не использованные. None - у команды нет своего конфига, используется общий агент.
+
+    «Своего конфига нет» запоминается отдельно на miss_ttl секунд (не больше max_missing записей):
+    запросы с неизвестными team_id не ходят в БД каждый раз и не вытесняют из LRU настоящие движки.
+    """
+
+    def __init__(self, loader: Callable[[str, str], Optional[Dict]], max_bytes: int = 64 * 1024 * 1024,
+                 miss_ttl: float = 300.0, max_missing: int = 10000):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.miss_ttl = miss_ttl
+        self.max_missing = max_missing
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[CompiledEngine, int]]" = OrderedDict()
+        self._bytes = 0
+        # (команда, агент) -> time.monotonic() истечения, старые первыми
+        self._missing: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        # invalidate во время load: устаревший конфиг не должен попасть в кэш. Поколение нужно, только
+        # пока у команды идёт загрузка (_loading), после последней - удаляется
+        self._generation: Dict[str, int] = {}
+        self._loading: Dict[str, int] = {}
+        self._stats = {"hits": 0, "misses": 0, "compiles": 0, "evictions": 0, "compile_ms": 0.0}
+
+    def lookup(self, team_id: str, agent: str) -> Tuple[bool, Optional[CompiledEngine]]:
+        """Только кэш: (найдено ли, движок или None). Не ходит в БД - можно звать из event loop"""
+        key = (team_id, agent)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self._stats["hits"] += 1
+                return True, entry[0]
+            expires = self._missing.get(key)
+            if expires is not None:
+                if expires > time.monotonic():
+                    self._stats["hits"] += 1
+                    return True, None
+                del self._missing[key]
+            self._stats["misses"] += 1
+            return False, None
+
+    def load(self, team_id: str, agent: str) -> Optional[CompiledEngine]:
+        """Читает конфиг команды и компилирует движок (блокирующий вызов)"""
+        with self._lock:
+            generation = self._generation.get(team_id, 0)
+            self._loading[team_id] = self._loading.get(team_id, 0) + 1
+        try:
+            config = self.loader(team_id, agent)
+            engine = None
+            if config is not None:
+                started = time.perf_counter()
+                engine = compile_config(config)
+                with self._lock:
+                    self._stats["compiles"] += 1
+                    self._stats["compile_ms"] += (time.perf_counter() - started) * 1000
+            self._put((team_id, agent), engine, generation)
+        finally:
+            with self._lock:
+                self._loading[team_id] -= 1
+                if not self._loading[team_id]:
+                    del self._loading[team_id]
+                    self._generation.pop(team_id, None)
+        return engine
+
+    def get(self, team_id: str, agent: str) -> Optional[CompiledEngine]:
+        found, engine = self.lookup(team_id, agent)
+        return engine if found else self.load(team_id, agent)
+
+    def invalidate(self, team_id: str, agent: Optional[str] = None):
+        """Сбрасывает кэш команды (после изменения её конфига на любой реплике)"""
+        with self._lock:
+            if team_id in self._loading:
+                self._generation[team_id] = self._generation.get(team_id, 0) + 1
+            for key in [key for key in self._cache if key[0] == team_id and agent in (None, key[1])]:
+                self._bytes -= self._cache.pop(key)[1]
+            for key in [key for key in self._missing if key[0] == team_id and agent in (None, key[1])]:
+                del self._missing[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "compile_ms": round(self._stats["compile_ms"], 3),
+                "entries": len(self._cache) + len(self._missing),
+                "engines": len(self._cache),
+                "missing": len(self._missing),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _put(self, key: Tuple[str, str], engine: Optional[CompiledEngine], generation: int):
+        evicted = 0
+        with self._lock:
+            if self._generation.get(key[0], 0) != generation:
+                return
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._missing.pop(key, None)
+            if engine is None:
+                self._missing[key] = time.monotonic() + self.miss_ttl
+                while len(self._missing) > self.max_missing:
+                    self._missing.popitem(last=False)
+                return
+            size = engine.nbytes + ENGINE_OVERHEAD_BYTES
+            self._cache[key] = (engine, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._cache) > 1:
+                _, (_, freed) = self._cache.popitem(last=False)
+                self._bytes -= freed
+                evicted += 1
+            self._stats["evictions"] += evicted
+        if evicted:
+            logger.debug(f"[TEAMS] Evicted {evicted} engine(s), cache {self._bytes} / {self.max_bytes} bytes")
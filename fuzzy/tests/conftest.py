@@ -0,0 +1,6 @@
+# conftest.py
+import os
+import sys
+
+# Модули сервиса лежат плоско в каталоге fuzzy
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,32 @@
+# test_backtest.py
+"""Бэктест сравнивает candidate/live с записанными предсказаниями в одной шкале (вес типа задачи, 0-100)"""
+import json
+import os
+import numpy as np
+from backtest import run_backtest
+from engine import compile_config
+from feedback_store import FeedbackBatch
+from inference import INPUT_FIELDS
+from knowledge import TASK_TYPE_WEIGHTS
+from training_export import TrainingChunk
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs", "effort_config.json")
+
+
+def test_live_matches_recorded_predictions():
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        engine = compile_config(json.load(f))
+    rng = np.random.default_rng(0)
+    n = 200
+    X = np.column_stack([rng.integers(0, 1000, n), rng.integers(0, 15, n), rng.integers(1, 6, n), rng.integers(0, 100, n)])
+    X = X.astype(np.float64)
+    names = sorted(TASK_TYPE_WEIGHTS)
+    codes = rng.integers(-1, len(names), n).astype(np.int16)
+    weights = np.array([1.0 if code < 0 else TASK_TYPE_WEIGHTS[names[code]] for code in codes])
+    recorded = np.clip(engine.evaluate_batch(X, columns=INPUT_FIELDS) * weights, 0, 100)
+    batch = FeedbackBatch(X, recorded, rng.uniform(0, 100, n), np.full(n, 1.7e9))
+
+    result = run_backtest([TrainingChunk(batch, codes, names)], engine, engine)
+    overall = result["overall"]
+    assert overall["live"]["mae"] == overall["recorded"]["mae"]
+    assert overall["candidate"] == overall["live"]
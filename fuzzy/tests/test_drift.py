@@ -0,0 +1,65 @@
+# test_drift.py
+"""База DriftScheduler набирается на фидбэке после смены версии, а не на окне оптимизатора"""
+import time
+import numpy as np
+from drift import DriftScheduler
+from feedback_store import FeedbackStore
+from inference import INPUT_FIELDS
+
+
+class _Engine:
+    def __init__(self, version: str, value: float):
+        self.version = version
+        self.value = value
+
+    def evaluate_batch(self, X, columns=None):
+        return np.full(len(X), self.value)
+
+
+class _Agent:
+    name = "effort"
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.feedback = FeedbackStore(500)
+
+    def current_engine(self):
+        return self.engine
+
+
+def _feed(agent, count: int, target: float, timestamp: float):
+    for _ in range(count):
+        agent.feedback.append({name: 1.0 for name in INPUT_FIELDS}, None, target, timestamp)
+
+
+def test_baseline_uses_feedback_after_version_change():
+    scheduler = DriftScheduler(error_window=20, min_samples=10, check_every=1, error_increase=0.25)
+    agent = _Agent(_Engine("v1", 50.0))
+    # окно, на котором «подбирались» параметры: ошибка 0
+    _feed(agent, 40, 50.0, time.time() - 60)
+
+    decision = scheduler.decide(agent, 40)
+    assert decision["reason"] == "collecting_baseline"
+    assert decision["baseline_mae"] is None
+
+    _feed(agent, 20, 60.0, time.time() + 1)
+    decision = scheduler.decide(agent, 60)
+    assert decision["baseline_mae"] == 10.0
+    assert decision["reason"] == "no_drift"
+
+    _feed(agent, 20, 70.0, time.time() + 1)
+    decision = scheduler.decide(agent, 80)
+    assert decision["action"] == "optimize"
+    assert "error_increase" in decision["triggers"]
+
+
+def test_cancel_clears_min_interval():
+    scheduler = DriftScheduler(error_window=10, min_samples=10, check_every=1, max_mae=1.0)
+    agent = _Agent(_Engine("v1", 50.0))
+    _feed(agent, 10, 70.0, time.time() + 1)
+
+    decision = scheduler.decide(agent, 10)
+    assert decision["action"] == "optimize"
+    scheduler.cancel(decision, "claimed_by_another_replica")
+    assert scheduler.status()["agents"]["effort"]["next_run_allowed_in_sec"] == 0
+    assert scheduler.decide(agent, 11)["action"] == "optimize"
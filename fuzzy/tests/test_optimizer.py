@@ -0,0 +1,42 @@
+# test_optimizer.py
+"""Оптимизатор, созданный для Mamdani-конфига, работает и после выката TSK-конфига"""
+import os
+import numpy as np
+from engine import FuzzyAgent, FuzzyOptimizer, compile_config
+from inference import INPUT_FIELDS
+import tsk
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs", "effort_config.json")
+
+
+def _feed(agent: FuzzyAgent, count: int = 40):
+    rng = np.random.default_rng(0)
+    for _ in range(count):
+        inputs = {
+            name: float(rng.uniform(*agent.config["universes"][name][:2]))
+            for name in INPUT_FIELDS
+        }
+        agent.add_feedback(inputs, None, float(rng.uniform(20, 80)))
+
+
+def test_optimizer_space_follows_tsk_promotion():
+    agent = FuzzyAgent(CONFIG_PATH, "effort")
+    tuner = FuzzyOptimizer(agent)
+    assert all(mtype != "linear" for *_, mtype, _ in tuner.param_indices)
+
+    config = tsk.fit_tsk(agent.config, "linear", 2000, 0)["config"]
+    for term in config["consequent"]["mfs"].values():
+        term["optimizable"] = True
+    agent.apply_config(config)
+    _feed(agent)
+
+    result = tuner.optimize_with_method_selection(min_samples=15, n_trials_per_method=10, timeout_per_method=30)
+    assert "error" not in result, result
+    assert result["selected_method"] in ("wtaver", "wtsum")
+    assert compile_config(result["config"]).output_name == agent.engine.output_name
+
+    tuner._prepare_optimization_space()
+    consequent_types = {mtype for var, _, _, mtype, _ in tuner.param_indices if var == "__cons__"}
+    assert consequent_types == {"linear"}
+    bounds = tuner._get_param_bounds()
+    assert all(low <= high for _, low, high in bounds)
@@ -0,0 +1,36 @@
+# test_rule_profile.py
+"""Профиль правил ведётся по движку, посчитавшему строку, и не включает строки команд"""
+import copy
+import os
+from datetime import datetime
+from engine import FuzzyAgent, compile_config
+from queries import evaluate_row
+from rule_profile import RuleProfiler
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs", "effort_config.json")
+
+
+def _rows(count: int) -> list:
+    inputs = {"volume": 300, "dependencies": 3, "expertise": 3, "uncertainty": 40}
+    predictions = {"complexity_score": 50.0, "risk_score": 50.0}
+    return [evaluate_row(f"T-{i}", inputs, predictions, "feature", datetime.utcnow()) for i in range(count)]
+
+
+def test_profile_follows_serving_engine():
+    agent = FuzzyAgent(CONFIG_PATH, "effort")
+    live = agent.engine
+    profiler = RuleProfiler({"effort": agent}, max_versions=1)
+
+    profiler.observe(_rows(3), [{"effort": live}, {}, {"effort": live}])
+    assert profiler.versions("effort") == {live.version: 2}
+
+    # агент временно на другом движке (например, пробном) - строки, посчитанные live, идут в live-версию
+    trial = copy.deepcopy(agent.config)
+    trial["consequent"]["defuzzify_method"] = "mom"
+    agent.engine = compile_config(trial)
+    profiler.observe(_rows(2), [{"effort": live}, {"effort": live}])
+    assert profiler.versions("effort") == {live.version: 4}
+
+    # версия без текста правил в конфиге агента не вытесняет live
+    profiler.observe(_rows(1), [{"effort": agent.engine}])
+    assert profiler.versions("effort") == {live.version: 4}
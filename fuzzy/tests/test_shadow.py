@@ -0,0 +1,27 @@
+# test_shadow.py
+"""Теневые кандидаты общего конфига не считают строки, которые live посчитал конфигом команды"""
+import copy
+import json
+import os
+from datetime import datetime
+from engine import compile_config
+from queries import evaluate_row
+from shadow import ShadowRegistry
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs", "effort_config.json")
+
+
+def test_team_rows_are_not_shadow_scored():
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    candidate = copy.deepcopy(config)
+    candidate["consequent"]["defuzzify_method"] = "mom"
+    registry = ShadowRegistry()
+    registry.replace("effort", {"cand": candidate})
+    live = compile_config(config)
+
+    inputs = {"volume": 300, "dependencies": 3, "expertise": 3, "uncertainty": 40}
+    predictions = {"complexity_score": 50.0, "risk_score": 50.0}
+    rows = [evaluate_row(task_id, inputs, predictions, "feature", datetime.utcnow()) for task_id in ("shared", "team")]
+    shadow_rows = registry.score(rows, [{"effort": live}, {}])
+    assert [(task_id, agent, version) for task_id, agent, version, _ in shadow_rows] == [("shared", "effort", "cand")]
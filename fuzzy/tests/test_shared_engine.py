@@ -0,0 +1,54 @@
+# test_shared_engine.py
+"""Подбор параметров не трогает живого агента и его движок из общей памяти"""
+import copy
+import os
+import numpy as np
+from engine import FuzzyAgent, FuzzyOptimizer
+from inference import INPUT_FIELDS
+from shared_engine import SharedEngineStore
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs", "effort_config.json")
+
+
+def _feed(agent: FuzzyAgent, count: int = 40):
+    rng = np.random.default_rng(0)
+    for _ in range(count):
+        inputs = {name: float(rng.uniform(*agent.config["universes"][name][:2])) for name in INPUT_FIELDS}
+        agent.add_feedback(inputs, None, float(rng.uniform(20, 80)))
+
+
+def test_optimization_runs_on_a_detached_copy(tmp_path):
+    store = SharedEngineStore(str(tmp_path), refresh_interval=0)
+    agent = FuzzyAgent(CONFIG_PATH, "effort", store=store)
+    agent.publish()
+    published = agent.current_engine().version
+    live_config = copy.deepcopy(agent.config)
+    _feed(agent)
+
+    result = FuzzyOptimizer(agent).optimize_with_method_selection(
+        min_samples=15, preferred_method="centroid", n_trials_per_method=10, timeout_per_method=30
+    )
+    assert "error" not in result, result
+    assert agent.config == live_config
+    assert agent.current_engine().version == published
+    assert result["config"] != live_config
+
+    # выкат результата - обычный apply_config с публикацией; другие воркеры его видят
+    other = FuzzyAgent(CONFIG_PATH, "effort", store=store)
+    other.publish()
+    agent.apply_config(result["config"])
+    assert other.current_engine().version == agent.current_engine().version != published
+
+
+def test_new_agent_does_not_publish_file_config(tmp_path):
+    store = SharedEngineStore(str(tmp_path), refresh_interval=0)
+    running = FuzzyAgent(CONFIG_PATH, "effort", store=store)
+    config = copy.deepcopy(running.config)
+    config["consequent"]["defuzzify_method"] = "mom"
+    running.apply_config(config)
+    published = store.current_version("effort")
+
+    # новый воркер стартует с конфигом из файла и до сверки с БД ничего не выкладывает
+    FuzzyAgent(CONFIG_PATH, "effort", store=store)
+    assert store.current_version("effort") == published
+    assert running.current_engine().version == published
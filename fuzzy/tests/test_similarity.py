@@ -0,0 +1,28 @@
+# test_similarity.py
+"""Полная перезагрузка индекса похожих задач не оставляет в хвосте уже загруженные точки"""
+import numpy as np
+from inference import INPUT_FIELDS
+from similarity import SimilarTaskIndex
+
+RANGES = {name: (0.0, 100.0) for name in INPUT_FIELDS}
+
+
+def _inputs(value: float) -> dict:
+    return {name: value for name in INPUT_FIELDS}
+
+
+def test_load_drops_loaded_tail_entries():
+    index = SimilarTaskIndex(RANGES, min_rebuild=10 ** 6)
+    index.add("a", _inputs(10))
+    index.add("b", _inputs(20))
+    index.add("a", _inputs(30))
+
+    # в БД уже есть a (с последними входами), b ещё не записана
+    index.load([(["a", "c"], np.array([[30.0] * len(INPUT_FIELDS), [50.0] * len(INPUT_FIELDS)]))])
+    assert index.stats()["tail_size"] == 1
+    assert len(index) == 3
+
+    # устаревшая точка a (10) больше не находится
+    nearest = index.query([10.0] * len(INPUT_FIELDS), k=3)
+    assert [task_id for task_id, _ in nearest] == ["b", "a", "c"]
+    assert nearest[1][1] > 0.3
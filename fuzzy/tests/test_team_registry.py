@@ -0,0 +1,66 @@
+# test_team_registry.py
+"""Промахи по командам без конфига не занимают LRU движков; поколения не копятся"""
+import json
+import os
+from team_registry import TeamEngineRegistry
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs", "effort_config.json")
+
+
+def _registry(**kwargs):
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    calls = []
+
+    def loader(team_id, agent):
+        calls.append(team_id)
+        return config if team_id.startswith("team") else None
+
+    return TeamEngineRegistry(loader, **kwargs), calls
+
+
+def test_missing_teams_do_not_evict_engines():
+    registry, calls = _registry(max_missing=5)
+    engine = registry.get("team-a", "effort")
+    assert engine is not None
+    for i in range(100):
+        assert registry.get(f"unknown-{i}", "effort") is None
+    assert registry.lookup("team-a", "effort") == (True, engine)
+    assert registry.stats()["missing"] == 5
+
+    # промах помнится до истечения miss_ttl
+    calls.clear()
+    assert registry.get("unknown-99", "effort") is None
+    assert calls == []
+
+
+def test_miss_expires_and_invalidate_clears_it():
+    registry, calls = _registry(miss_ttl=0)
+    registry.get("unknown", "effort")
+    assert registry.lookup("unknown", "effort") == (False, None)
+
+    registry, calls = _registry()
+    registry.get("unknown", "effort")
+    registry.invalidate("unknown")
+    assert registry.lookup("unknown", "effort") == (False, None)
+
+
+def test_generations_are_dropped_after_loads():
+    registry, _ = _registry()
+    for i in range(50):
+        registry.get(f"team-{i}", "effort")
+        registry.invalidate(f"team-{i}")
+    assert registry._generation == {} and registry._loading == {}
+
+
+def test_invalidate_during_load_discards_stale_config():
+    registry = None
+
+    def loader(team_id, agent):
+        registry.invalidate(team_id, agent)
+        return None
+
+    registry = TeamEngineRegistry(loader)
+    registry.load("team-a", "effort")
+    assert registry.lookup("team-a", "effort") == (False, None)
+    assert registry._generation == {}
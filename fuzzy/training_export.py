@@ -0,0 +1,168 @@
+# training_export.py
+"""
+Колоночная выгрузка обучающих данных (фидбэк + сохранённые предсказания) для тюнинга и офлайн-анализа.
+
+Строки приходят пачками из серверного курсора (FuzzyFeedbackRepository.iter_training_export)
+и сразу складываются в float64-массивы: в памяти не больше одной пачки строк.
+Форматы: npz (только NumPy), parquet и arrow (Arrow IPC) - при установленном pyarrow.
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+import numpy as np
+from feedback_store import FeedbackBatch
+import queries
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_FORMATS = ("npz", "parquet", "arrow")
+NUMERIC_COLUMNS = queries.TRAINING_EXPORT_COLUMNS[:7]
+
+
+class TrainingChunk(NamedTuple):
+    """Пачка выгрузки: FeedbackBatch + тип задачи в виде кодов словаря (-1 - тип не указан)"""
+    batch: FeedbackBatch
+    task_type: np.ndarray       # (N,), int16, индекс в task_type_names
+    task_type_names: List[str]
+
+    def __len__(self) -> int:
+        return len(self.batch)
+
+
+def iter_chunks(row_batches: Iterable[List[tuple]]) -> Iterator[TrainingChunk]:
+    """Пачки строк queries.training_export_query -> TrainingChunk; словарь типов общий для всех пачек"""
+    vocabulary: Dict[str, int] = {}
+    for rows in row_batches:
+        table = np.array(rows, dtype=object)
+        values = table[:, :7].astype(np.float64)
+        codes = np.fromiter(
+            (-1 if name is None else vocabulary.setdefault(name, len(vocabulary)) for name in table[:, 7]),
+            dtype=np.int16, count=len(rows)
+        )
+        batch = FeedbackBatch(
+            np.ascontiguousarray(values[:, :4]), values[:, 4].copy(), values[:, 5].copy(), values[:, 6].copy()
+        )
+        yield TrainingChunk(batch, codes, list(vocabulary))
+
+
+def collect(chunks: Iterable[TrainingChunk]) -> TrainingChunk:
+    """Склеивает пачки в один TrainingChunk (вся выгрузка в памяти в виде массивов)"""
+    parts = list(chunks)
+    if not parts:
+        empty = FeedbackBatch(np.zeros((0, 4)), np.zeros(0), np.zeros(0), np.zeros(0))
+        return TrainingChunk(empty, np.zeros(0, dtype=np.int16), [])
+    batch = FeedbackBatch(*(np.concatenate(column) for column in zip(*(part.batch for part in parts))))
+    return TrainingChunk(batch, np.concatenate([part.task_type for part in parts]), parts[-1].task_type_names)
+
+
+def write_export(chunks: Iterable[TrainingChunk], path: str, fmt: str = "npz") -> int:
+    """Пишет пачки в файл по мере поступления, возвращает число строк"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {EXPORT_FORMATS}")
+    if fmt == "npz":
+        return _write_npz(chunks, path)
+    _require_pyarrow(fmt)
+    schema = pa.schema([(name, pa.float64()) for name in NUMERIC_COLUMNS] + [("task_type", pa.string())])
+    written = 0
+    if fmt == "parquet":
+        with pq.ParquetWriter(path, schema) as writer:
+            for chunk in chunks:
+                writer.write_batch(_to_record_batch(chunk, schema))
+                written += len(chunk)
+    else:
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for chunk in chunks:
+                writer.write_batch(_to_record_batch(chunk, schema))
+                written += len(chunk)
+    return written
+
+
+def load_export(path: str, fmt: Optional[str] = None) -> TrainingChunk:
+    """Читает файл write_export обратно в массивы; формат по расширению, если не указан"""
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {EXPORT_FORMATS}")
+    if fmt == "npz":
+        with np.load(path) as data:
+            columns = {name: data[name] for name in NUMERIC_COLUMNS}
+            codes = data["task_type"]
+            names = data["task_type_names"].tolist()
+    else:
+        _require_pyarrow(fmt)
+        if fmt == "parquet":
+            table = pq.read_table(path)
+        else:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+        columns = {name: table.column(name).to_numpy() for name in NUMERIC_COLUMNS}
+        task_type = table.column("task_type").combine_chunks().dictionary_encode()
+        codes = task_type.indices.fill_null(-1).to_numpy().astype(np.int16)
+        names = task_type.dictionary.to_pylist()
+    batch = FeedbackBatch(
+        np.column_stack([columns[name] for name in NUMERIC_COLUMNS[:4]]) if len(codes) else np.zeros((0, 4)),
+        columns["predicted"], columns["target"], columns["feedback_at"]
+    )
+    return TrainingChunk(batch, codes, names)
+
+
+def _require_pyarrow(fmt: str):
+    if pa is None:
+        raise RuntimeError(f"Export format '{fmt}' requires pyarrow (pip install pyarrow)")
+
+
+def _to_record_batch(chunk: TrainingChunk, schema) -> "pa.RecordBatch":
+    batch = chunk.batch
+    numeric = [batch.inputs[:, i] for i in range(4)] + [batch.predicted, batch.target, batch.timestamp]
+    task_type = pa.DictionaryArray.from_arrays(
+        pa.array(chunk.task_type, mask=chunk.task_type < 0),
+        pa.array(chunk.task_type_names, pa.string())
+    ).dictionary_decode()
+    return pa.RecordBatch.from_arrays([pa.array(column) for column in numeric] + [task_type], schema=schema)
+
+
+def _write_npz(chunks: Iterable[TrainingChunk], path: str) -> int:
+    """
+    np.savez требует все массивы целиком, поэтому колонки сначала дописываются в сырые
+    временные файлы, а в архив переносятся потоково, когда известна итоговая длина
+    """
+    columns = NUMERIC_COLUMNS + ("task_type",)
+    dtypes = {name: np.dtype(np.float64) for name in NUMERIC_COLUMNS}
+    dtypes["task_type"] = np.dtype(np.int16)
+    names: List[str] = []
+    written = 0
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmp:
+        raw = {name: open(os.path.join(tmp, name), "wb") for name in columns}
+        try:
+            for chunk in chunks:
+                batch = chunk.batch
+                for i, name in enumerate(NUMERIC_COLUMNS[:4]):
+                    batch.inputs[:, i].tofile(raw[name])
+                batch.predicted.tofile(raw["predicted"])
+                batch.target.tofile(raw["target"])
+                batch.timestamp.tofile(raw["feedback_at"])
+                chunk.task_type.tofile(raw["task_type"])
+                names = chunk.task_type_names
+                written += len(chunk)
+        finally:
+            for f in raw.values():
+                f.close()
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name in columns:
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as out, \
+                        open(os.path.join(tmp, name), "rb") as src:
+                    np.lib.format.write_array_header_1_0(out, {
+                        "descr": np.lib.format.dtype_to_descr(dtypes[name]),
+                        "fortran_order": False,
+                        "shape": (written,)
+                    })
+                    shutil.copyfileobj(src, out)
+            with archive.open("task_type_names.npy", "w") as out:
+                np.lib.format.write_array(out, np.array(names, dtype=str))
+    return written
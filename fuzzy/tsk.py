@@ -0,0 +1,116 @@
+# tsk.py
+"""
+Конвертер Mamdani -> TSK (Такаги-Сугено): антецеденты и правила агента сохраняются, а термы выхода
+заменяются константами или линейными функциями входов, подогнанными МНК к выходу Mamdani.
+
+TSK считается без дискретного универсума выхода и дефаззификации, поэтому заметно быстрее;
+цена - отклонение от исходного агента, которое оценивается на отложенной части выборки.
+Выборка - случайные точки на сетке универсумов входов (входы задач в основном целочисленные).
+"""
+import copy
+import time
+from typing import Dict, Optional
+import numpy as np
+from engine import compile_config
+from inference import CompiledEngine
+
+HOLDOUT_SHARE = 0.2
+
+
+def _fidelity(reference: np.ndarray, predicted: np.ndarray) -> Dict:
+    """Отклонение TSK от Mamdani там, где определены оба выхода"""
+    both = np.isfinite(reference) & np.isfinite(predicted)
+    errors = np.abs(predicted[both] - reference[both])
+    return {
+        "count": int(both.sum()),
+        "mae": float(errors.mean()) if errors.size else 0.0,
+        "rmse": float(np.sqrt(np.mean(errors ** 2))) if errors.size else 0.0,
+        "p95_abs_error": float(np.percentile(errors, 95)) if errors.size else 0.0,
+        "max_abs_error": float(errors.max()) if errors.size else 0.0,
+        "undefined_mismatch": int(np.count_nonzero(np.isfinite(reference) != np.isfinite(predicted)))
+    }
+
+
+def latency_us(engine: CompiledEngine, X: np.ndarray, single_calls: int = 200) -> Dict:
+    """Время на строку в пачке и медиана одиночного вызова, мкс"""
+    started = time.perf_counter()
+    engine.evaluate_batch(X)
+    batch = (time.perf_counter() - started) / max(len(X), 1) * 1e6
+    timings = []
+    for row in X[:single_calls]:
+        started = time.perf_counter()
+        engine.evaluate_batch(row)
+        timings.append((time.perf_counter() - started) * 1e6)
+    return {"batch_per_row": round(batch, 3), "single_call": round(float(np.median(timings)), 3)}
+
+
+def fit_tsk(config: Dict, order: str = "linear", samples: int = 20000,
+            seed: Optional[int] = None, ridge: float = 1e-3) -> Dict:
+    """
+    Подгоняет TSK-модель под Mamdani-конфиг. order: constant - по константе на терм выхода,
+    linear - константа и коэффициенты входов. Возвращает конфиг TSK, отклонение от Mamdani
+    на отложенной выборке и задержки обоих движков.
+
+    Выход TSK линеен по параметрам термов: y = sum_c s_c(x) * (b_c + a_c . x), где s_c - доля
+    суммарной степени срабатывания правил с термом c. Решается гребневая регрессия с притяжением
+    к центроиду соответствующего терма Mamdani - термы, которые почти не срабатывают, остаются около него.
+    """
+    if order not in ("constant", "linear"):
+        raise ValueError(f"Unknown TSK order '{order}', expected constant or linear")
+    if config.get("inference", "mamdani") != "mamdani":
+        raise ValueError("Config is already TSK")
+    source = compile_config(config)
+    names = source.input_names
+    universes = np.array([config["universes"][name] for name in names], dtype=np.float64)
+    lows, highs, steps = universes[:, 0], universes[:, 1], universes[:, 2]
+    widths = np.where(highs > lows, highs - lows, 1.0)
+
+    rng = np.random.default_rng(seed)
+    X = lows + rng.integers(0, np.floor((highs - lows) / steps) + 1, size=(samples, len(names))) * steps
+    y = source.evaluate_batch(X)
+    holdout = rng.random(samples) < HOLDOUT_SHARE
+    train = ~holdout & np.isfinite(y)
+    if np.count_nonzero(train) < 10:
+        raise ValueError("Too few points with fired rules to fit a TSK model")
+
+    strengths = source.rule_strengths(X[train])
+    labels = list(config["consequent"]["mfs"])
+    onehot = np.zeros((len(source.rules), len(labels)))
+    onehot[np.arange(len(source.rules)), source.rule_consequents] = 1.0
+    share = (strengths / strengths.sum(axis=1, keepdims=True)) @ onehot
+    # Входы нормируются на универсумы, чтобы коэффициенты были одного масштаба
+    basis = np.ones((share.shape[0], 1))
+    if order == "linear":
+        basis = np.hstack([basis, (X[train] - lows) / widths])
+    A = (share[:, :, None] * basis[:, None, :]).reshape(share.shape[0], -1)
+
+    prior = np.zeros((len(labels), basis.shape[1]))
+    prior[:, 0] = [np.mean(cfg["params"]) for cfg in config["consequent"]["mfs"].values()]
+    prior = prior.ravel()
+    lam = ridge * A.shape[0]
+    delta = np.linalg.solve(A.T @ A + lam * np.eye(A.shape[1]), A.T @ (y[train] - A @ prior))
+    theta = (prior + delta).reshape(len(labels), -1)
+
+    tsk_config = copy.deepcopy(config)
+    tsk_config["inference"] = "tsk"
+    consequent = tsk_config["consequent"]
+    consequent["defuzzify_method"] = "wtaver"
+    consequent["inputs"] = list(names)
+    for label, row in zip(labels, theta):
+        optimizable = config["consequent"]["mfs"][label].get("optimizable", False)
+        if order == "constant":
+            consequent["mfs"][label] = {"type": "constant", "params": [float(row[0])], "optimizable": optimizable}
+        else:
+            coefficients = row[1:] / widths
+            params = [float(row[0] - np.dot(coefficients, lows))] + coefficients.tolist()
+            consequent["mfs"][label] = {"type": "linear", "params": params, "optimizable": optimizable}
+
+    fitted = compile_config(tsk_config)
+    X_holdout = X[holdout]
+    return {
+        "config": tsk_config,
+        "order": order,
+        "samples": {"train": int(np.count_nonzero(train)), "holdout": int(np.count_nonzero(holdout))},
+        "fidelity": _fidelity(y[holdout], fitted.evaluate_batch(X_holdout)),
+        "latency_us": {"mamdani": latency_us(source, X_holdout), "tsk": latency_us(fitted, X_holdout)}
+    }
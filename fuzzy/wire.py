@@ -0,0 +1,101 @@
+# wire.py
+"""
+Компактный формат обмена для внутренних клиентов - MessagePack, выбирается заголовками:
+Content-Type: application/msgpack - тело запроса, Accept: application/msgpack - ответ.
+JSON остаётся форматом по умолчанию (UI, Swagger).
+
+Тело запроса в MessagePack валидируется той же pydantic-моделью, что и JSON (NegotiatedRoute).
+Ответ пачки (/evaluate/batch) в MessagePack колоночный: стратегии снижения рисков передаются
+один раз на категорию, а не в каждой строке (compact_batch).
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+BATCH_FIELDS = ("task_id", "complexity_score", "risk_score", "risk_category")
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";", 1)[0].strip().lower() in MSGPACK_TYPES
+
+
+def accepts_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "").lower()
+    return msgpack is not None and any(media_type in accept for media_type in MSGPACK_TYPES)
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Cannot serialize {type(obj).__name__} to MessagePack")
+
+
+def packb(data: Any) -> bytes:
+    return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+def respond(request: Request, content: Any, compact: Optional[Callable[[Any], Any]] = None) -> Any:
+    """
+    content - то, что эндпоинт вернул бы для JSON (без изменений, если клиент не просит MessagePack).
+    compact - преобразование в компактную форму для MessagePack
+    """
+    if not accepts_msgpack(request):
+        return content
+    return Response(packb(compact(content) if compact else content), media_type=MSGPACK_MEDIA_TYPE)
+
+
+def compact_batch(result: Dict) -> Dict:
+    """Ответ /evaluate/batch в колоночном виде: rows в порядке BATCH_FIELDS, стратегии - по категориям"""
+    rows, mitigation, evaluated_at = [], {}, None
+    for output in result["results"]:
+        rows.append([output.task_id, output.complexity_score, output.risk_score, output.risk_category])
+        mitigation.setdefault(output.risk_category, output.mitigation_strategies)
+        evaluated_at = output.evaluated_at
+    return {
+        "fields": list(BATCH_FIELDS),
+        "rows": rows,
+        "evaluated_at": evaluated_at,
+        "mitigation_strategies": mitigation,
+        "errors": result["errors"]
+    }
+
+
+class _MsgpackRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = msgpack.unpackb(await self.body(), raw=False)
+        return self._json
+
+
+class NegotiatedRoute(APIRoute):
+    """Маршрут, принимающий тело запроса и в JSON, и в MessagePack"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            if is_msgpack(request.headers.get("content-type")):
+                if msgpack is None:
+                    return JSONResponse({"detail": "MessagePack is not supported: msgpack is not installed"}, status_code=415)
+                # FastAPI разбирает тело как JSON только при JSON Content-Type - подменяем его,
+                # а разбор делает _MsgpackRequest.json
+                scope = dict(request.scope)
+                scope["headers"] = [
+                    (name, value) for name, value in request.scope["headers"] if name != b"content-type"
+                ] + [(b"content-type", b"application/json")]
+                request = _MsgpackRequest(scope, request.receive)
+            return await handler(request)
+
+        return route_handler
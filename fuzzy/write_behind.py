@@ -0,0 +1,166 @@
+# write_behind.py
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+from async_fuzzy_repository import AsyncFuzzyFeedbackRepository
+from inference import CompiledEngine
+from shadow import ShadowRegistry
+from rule_profile import RuleProfiler
+
+
+class EvaluateWriteBuffer:
+    """
+    Отложенная запись результатов /evaluate.
+
+    Обработчик кладёт строку в буфер и сразу отвечает; фоновая задача сбрасывает
+    буфер пачками (по размеру batch_size или раз в flush_interval секунд) через
+    AsyncFuzzyFeedbackRepository.save_evaluate_results_bulk.
+    Буфер ограничен max_pending строками: при переполнении submit ждёт освобождения
+    места до put_timeout секунд, после чего пишет строку в БД напрямую.
+    Повторная оценка той же задачи до сброса заменяет строку в буфере.
+    Если задан shadow, предсказания конфигов-кандидатов считаются на сбросе по всей пачке
+    (по строкам, посчитанным общими конфигами - served) и пишутся в той же транзакции. Если задан profiler, на сбросе пачка строк попадает в профиль правил движков, которые их посчитали.
+    """
+
+    def __init__(self, repo: AsyncFuzzyFeedbackRepository,
+                 batch_size: int = 500,
+                 flush_interval: float = 0.5,
+                 max_pending: int = 10000,
+                 put_timeout: float = 1.0,
+                 retry_delay: float = 1.0,
+                 shadow: Optional[ShadowRegistry] = None,
+                 profiler: Optional[RuleProfiler] = None):
+        self.repo = repo
+        self.shadow = shadow
+        self.profiler = profiler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.retry_delay = retry_delay
+        # task_id -> (строка, served - общие движки агентов, посчитавшие её)
+        self._pending: Dict[str, Tuple[tuple, Dict[str, CompiledEngine]]] = {}
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "submitted": 0,
+            "flushed_rows": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "backpressure_waits": 0,
+            "overflow_writes": 0,
+            "shadow_rows": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Останавливает фоновую задачу и сбрасывает остаток буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"[WRITE-BEHIND] Final flush failed, {len(self._pending)} evaluate results lost: {e}")
+
+    def is_pending(self, task_id: str) -> bool:
+        return task_id in self._pending
+
+    async def submit(self, task_id: str, row: tuple, served: Optional[Dict[str, CompiledEngine]] = None):
+        """
+        Ставит строку (порядок queries.EVALUATE_ROW_COLUMNS) в очередь на запись.
+        served - общие движки агентов, посчитавшие строку (без них строка не идёт в теневую оценку)
+        """
+        entry = (row, served or {})
+        self._stats["submitted"] += 1
+        if task_id not in self._pending and len(self._pending) >= self.max_pending:
+            self._stats["backpressure_waits"] += 1
+            try:
+                await asyncio.wait_for(self._wait_for_space(), self.put_timeout)
+            except asyncio.TimeoutError:
+                self._stats["overflow_writes"] += 1
+                await self._write([entry])
+                return
+        self._pending[task_id] = entry
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def ensure_written(self, *task_ids: str):
+        """Гарантирует, что строки задач уже в БД (например, перед записью фидбэка по ним)"""
+        if any(task_id in self._pending for task_id in task_ids):
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Записывает всё, что сейчас в буфере. Строки удаляются из буфера только после успешной записи"""
+        async with self._lock:
+            snapshot = list(self._pending.items())
+            written = 0
+            for start in range(0, len(snapshot), self.batch_size):
+                chunk = snapshot[start:start + self.batch_size]
+                started = time.perf_counter()
+                try:
+                    await self._write([entry for _, entry in chunk])
+                except Exception:
+                    self._stats["failed_flushes"] += 1
+                    raise
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                for task_id, entry in chunk:
+                    if self._pending.get(task_id) is entry:
+                        del self._pending[task_id]
+                written += len(chunk)
+                self._stats["flushes"] += 1
+                self._stats["flushed_rows"] += len(chunk)
+                self._stats["last_flush_ms"] = elapsed_ms
+                self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+                self._space.set()
+            return written
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["last_flush_ms"] = round(stats["last_flush_ms"], 3)
+        stats["max_flush_ms"] = round(stats["max_flush_ms"], 3)
+        stats["pending"] = len(self._pending)
+        stats["max_pending"] = self.max_pending
+        return stats
+
+    async def _write(self, entries: List[Tuple[tuple, Dict[str, CompiledEngine]]]):
+        rows = [row for row, _ in entries]
+        shadow_rows = None
+        if self.shadow:
+            shadow_rows = await asyncio.to_thread(self.shadow.score, rows, [served for _, served in entries])
+            self._stats["shadow_rows"] += len(shadow_rows)
+        await self.repo.save_evaluate_results_bulk(rows, shadow_rows)
+        if self.profiler is not None:
+            await asyncio.to_thread(self.profiler.observe, rows, [served for _, served in entries])
+
+    async def _wait_for_space(self):
+        while len(self._pending) >= self.max_pending:
+            self._space.clear()
+            await self._space.wait()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[WRITE-BEHIND] Flush failed, {len(self._pending)} rows kept for retry: {e}")
+                await asyncio.sleep(self.retry_delay)
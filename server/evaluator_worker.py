@@ -30,7 +30,14 @@ tracker_service = YandexTrackerService(
     org_id=os.getenv("YANDEX_ORG_ID"),
     queue_key=os.getenv("YANDEX_QUEUE_KEY")
 )
-fuzzy_client = FuzzyLogicClient(base_url=FUZZY_API_URL)
+# FUZZY_EMBEDDED=true - считать оценку в процессе воркера (fuzzy/scoring.py), в сервис только запись результатов
+# FUZZY_WIRE_FORMAT=msgpack - обмен с сервисом в MessagePack вместо JSON
+fuzzy_client = FuzzyLogicClient(
+    base_url=FUZZY_API_URL,
+    embedded=os.getenv("FUZZY_EMBEDDED", "false").lower() == "true",
+    refresh_interval=float(os.getenv("FUZZY_EMBEDDED_REFRESH_INTERVAL", 30)),
+    wire_format=os.getenv("FUZZY_WIRE_FORMAT", "json").lower()
+)
 evaluator = EvaluatorAgent(llm_service)
 redis_client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
 
@@ -172,5 +179,11 @@ async def main():
                 logger.error(f"Error processing message: {e}", exc_info=True)
         await asyncio.sleep(0.1)  # Небольшая пауза для снижения нагрузки
 
+async def run():
+    try:
+        await main()
+    finally:
+        await fuzzy_client.close()
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(run())
\ No newline at end of file
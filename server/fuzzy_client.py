@@ -1,11 +1,107 @@
+import asyncio
+import time
 import aiohttp
 from loguru import logger
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+# Встроенная оценка (fuzzy/scoring.py): доступна, если каталог fuzzy есть в PYTHONPATH и установлен numpy
+try:
+    from scoring import EmbeddedScorer, HttpEngineSource
+    SCORING_IMPORT_ERROR = None
+except ImportError as e:
+    EmbeddedScorer = None
+    HttpEngineSource = None
+    SCORING_IMPORT_ERROR = e
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+def _expand_batch(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Колоночный ответ /evaluate/batch в MessagePack (fuzzy/wire.py compact_batch) -> результаты как в JSON"""
+    if "fields" not in body:
+        return body["results"]
+    results = []
+    for row in body["rows"]:
+        result = dict(zip(body["fields"], row))
+        result["mitigation_strategies"] = body["mitigation_strategies"][result["risk_category"]]
+        result["evaluated_at"] = body["evaluated_at"]
+        results.append(result)
+    return results
 
 class FuzzyLogicClient:
-    def __init__(self, base_url: str = "http://localhost:8000", timeout: float = 30.0):
+    def __init__(self, base_url: str = "http://localhost:8000", timeout: float = 30.0,
+                 embedded: bool = False, refresh_interval: float = 30.0,
+                 health_ttl: float = 15.0, pool_size: int = 10, wire_format: str = "json"):
         self.base_url = base_url.rstrip("/")
         self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.refresh_interval = refresh_interval
+        self.health_ttl = health_ttl
+        self.pool_size = pool_size
+        # Одна сессия на клиента: пул keep-alive соединений вместо нового TCP-соединения на каждый вызов
+        self._session: Optional[aiohttp.ClientSession] = None
+        # (доступен ли сервис, time.monotonic() проверки); обновляется и по результатам обычных вызовов
+        self._health: Optional[tuple] = None
+        if embedded and EmbeddedScorer is None:
+            # явный запрос встроенной оценки не должен молча превращаться в HTTP
+            raise RuntimeError(
+                "Embedded fuzzy scoring requested but fuzzy/scoring.py is not importable "
+                f"(add the fuzzy directory to PYTHONPATH and install numpy): {SCORING_IMPORT_ERROR}"
+            )
+        self.embedded = embedded
+        self._scorer = None
+        # wire_format="msgpack" - тела запросов и ответов в MessagePack: меньше байт и быстрее разбор пачек
+        self.msgpack = wire_format == "msgpack" and msgpack is not None
+        if wire_format == "msgpack" and not self.msgpack:
+            logger.warning("MessagePack wire format requested but msgpack is not installed, using JSON")
+
+    async def _embedded_scorer(self):
+        """Движки агентов в памяти процесса; результаты пишутся в сервис пачками в фоне"""
+        if self._scorer is None:
+            source = HttpEngineSource(self.base_url, timeout=self.timeout.total, session=self._client())
+            scorer = EmbeddedScorer(source, persist=source, refresh_interval=self.refresh_interval)
+            await scorer.start()
+            self._scorer = scorer
+        return self._scorer
+
+    def _client(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            )
+        return self._session
+
+    def _mark_health(self, healthy: bool):
+        self._health = (healthy, time.monotonic())
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> tuple:
+        """POST в выбранном формате; (статус, тело ответа - разобранное при 200, иначе текст)"""
+        if self.msgpack:
+            kwargs = {
+                "data": msgpack.packb(payload, use_bin_type=True),
+                "headers": {"Content-Type": MSGPACK_MEDIA_TYPE, "Accept": MSGPACK_MEDIA_TYPE}
+            }
+        else:
+            kwargs = {"json": payload}
+        async with self._client().post(f"{self.base_url}{path}", **kwargs) as response:
+            self._mark_health(response.status < 500)
+            if response.status != 200:
+                return response.status, await response.text()
+            if response.content_type == MSGPACK_MEDIA_TYPE:
+                return response.status, msgpack.unpackb(await response.read(), raw=False)
+            return response.status, await response.json()
+
+    async def close(self):
+        if self._scorer is not None:
+            await self._scorer.close()
+            self._scorer = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
     
     async def evaluate_task(
         self,
@@ -16,6 +112,18 @@ class FuzzyLogicClient:
         requirement_uncertainty_pct: float,
         task_type: str
     ) -> Optional[Dict[str, Any]]:
+        if self.embedded:
+            try:
+                scorer = await self._embedded_scorer()
+                result = await scorer.evaluate_task(
+                    task_id, code_changes_lines, dependencies_count,
+                    team_expertise, requirement_uncertainty_pct, task_type
+                )
+                logger.debug(f"Fuzzy evaluation for {task_id} (embedded): risk={result['risk_category']}, complexity={result['complexity_score']}")
+                return result
+            except Exception as e:
+                logger.warning(f"Embedded fuzzy evaluation failed for {task_id}, falling back to HTTP: {e}")
+
         payload = {
             "task_id": task_id,
             "code_changes_lines": code_changes_lines,
@@ -26,31 +134,72 @@ class FuzzyLogicClient:
         }
         
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.post(
-                    f"{self.base_url}/evaluate",
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.debug(f"Fuzzy evaluation for {task_id}: risk={result['risk_category']}, complexity={result['complexity_score']}")
-                        return result
-                    else:
-                        error_text = await response.text()
-                        logger.warning(f"Fuzzy API error {response.status}: {error_text}")
-                        return None
-        except aiohttp.ClientError as e:
+            status, result = await self._post("/evaluate", payload)
+            if status == 200:
+                logger.debug(f"Fuzzy evaluation for {task_id}: risk={result['risk_category']}, complexity={result['complexity_score']}")
+                return result
+            else:
+                logger.warning(f"Fuzzy API error {status}: {result}")
+                return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._mark_health(False)
             logger.error(f"Failed to connect to fuzzy logic server: {e}")
             return None
         except Exception as e:
             logger.error(f"Unexpected error in fuzzy evaluation: {e}")
             return None
-    
+
+    async def evaluate_tasks(self, tasks: List[Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Оценка нескольких задач за один запрос (POST /evaluate/batch). tasks - словари с полями /evaluate.
+        Возвращает task_id -> результат; None - задача не оценена (выход не определён или ошибка запроса)
+        """
+        results: Dict[str, Optional[Dict[str, Any]]] = {task["task_id"]: None for task in tasks}
+        if not tasks:
+            return results
+        # встроенная оценка знает только общие конфиги: задачи с team_id считает сервис
+        if self.embedded and not any(task.get("team_id") for task in tasks):
+            try:
+                scorer = await self._embedded_scorer()
+                await scorer.refresh()
+            except Exception as e:
+                logger.warning(f"Embedded fuzzy scorer unavailable, falling back to HTTP: {e}")
+            else:
+                for task in tasks:
+                    try:
+                        results[task["task_id"]] = scorer.score(
+                            task["task_id"], task["code_changes_lines"], task["dependencies_count"],
+                            task["team_expertise"], task["requirement_uncertainty_pct"], task.get("task_type", "feature")
+                        )
+                    except Exception as e:
+                        logger.warning(f"Embedded fuzzy evaluation failed for {task['task_id']}: {e}")
+                return results
+        try:
+            status, body = await self._post("/evaluate/batch", {"items": tasks})
+            if status != 200:
+                logger.warning(f"Fuzzy API error {status}: {body}")
+                return results
+            for result in _expand_batch(body):
+                results[result["task_id"]] = result
+            for error in body.get("errors", []):
+                logger.warning(f"Fuzzy evaluation failed for {error['task_id']}: {error['error']}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._mark_health(False)
+            logger.error(f"Failed to connect to fuzzy logic server: {e}")
+        except Exception as e:
+            logger.error(f"Unexpected error in fuzzy batch evaluation: {e}")
+        return results
+
     async def health_check(self) -> bool:
+        """GET /health не чаще раза в health_ttl секунд; между проверками - последний известный статус"""
+        if self._scorer is not None and self._scorer.engines:
+            # оценка идёт локально; запись результатов переживает недоступность сервиса
+            return True
+        if self._health is not None and time.monotonic() - self._health[1] < self.health_ttl:
+            return self._health[0]
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
-                async with session.get(f"{self.base_url}/docs") as response:
-                    return response.status == 200
+            async with self._client().get(f"{self.base_url}/health", timeout=aiohttp.ClientTimeout(total=5)) as response:
+                self._mark_health(response.status == 200)
         except Exception:
-            return False
\ No newline at end of file
+            self._mark_health(False)
+        return self._health[0]
\ No newline at end of file